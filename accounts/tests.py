@@ -26,6 +26,7 @@ from django.utils import timezone
 from unittest.mock import patch
 from django.core.management.base import CommandError
 from game.models import GameSession, Player, GameTurn
+from game.testing import QueryBudgetMixin
 from django.conf import settings
 
 
@@ -1380,3 +1381,60 @@ class RolePlayDateURLsTest(TestCase):
         # Check the response
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, "Likes have been reset.")
+
+
+class QueryBudgetTest(QueryBudgetMixin, TestCase):
+    """
+    The most queries browse_profiles and like_profile may make, whatever the
+    number of profiles and likes (see game/testing.py).
+    """
+
+    BROWSE_PROFILES_BUDGET = 6
+    LIKE_PROFILE_BUDGET = 10
+
+    def setUp(self):
+        DatingPreference.create_defaults()
+        self.user = User.objects.create_user(username="budget", password="pass")
+        self.user.profile.gender = "F"
+        self.user.profile.save()
+        self.user.profile.open_to_dating.set(DatingPreference.objects.all())
+        self.client.force_login(self.user)
+
+    def create_users(self, count, prefix):
+        """Create `count` users open to dating the test user."""
+        users = []
+        for i in range(count):
+            user = User.objects.create_user(username=f"{prefix}_{i}")
+            user.profile.gender = Profile.GENDER_CHOICES[i % 3][0]
+            user.profile.save()
+            user.profile.open_to_dating.set(DatingPreference.objects.all())
+            users.append(user)
+        return users
+
+    def test_browse_profiles(self):
+        def build(scale):
+            self.create_users(3 * scale, "profile")
+            return lambda: self.client.get(reverse("browse_profiles"))
+
+        for scale, response in self.assertQueryBudget(
+            self.BROWSE_PROFILES_BUDGET, build
+        ).items():
+            self.assertEqual(len(response.context["profiles"]), 3 * scale)
+
+    def test_like_profile(self):
+        def build(scale):
+            # Likes and matches of other users
+            users = self.create_users(2 * scale, "liker")
+            for a, b in zip(users[::2], users[1::2]):
+                Like.objects.create(from_user=a, to_user=b)
+                Like.objects.create(from_user=b, to_user=a)
+                Match.objects.create(user1=a, user2=b)
+            liked = User.objects.create_user(username="liked")
+            Like.objects.create(from_user=liked, to_user=self.user)
+            url = reverse("like_profile", args=[liked.pk])
+            return lambda: self.client.post(url)
+
+        for response in self.assertQueryBudget(
+            self.LIKE_PROFILE_BUDGET, build
+        ).values():
+            self.assertTrue(response.json()["success"])
@@ -132,7 +132,13 @@ def view_profile(request):
 
 @login_required
 def browse_profiles(request):
-    recommended_profiles = get_recommended_profiles(request.user).order_by("user_id")
+    # The template shows the user and the preferences of every profile
+    recommended_profiles = (
+        get_recommended_profiles(request.user)
+        .order_by("user_id")
+        .select_related("user")
+        .prefetch_related("open_to_dating")
+    )
 
     # Pagination: Show 10 profiles per page
     # paginator = Paginator(recommended_profiles, 10)
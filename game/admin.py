@@ -1,4 +1,5 @@
 from django.contrib import admin
+from game import pools
 from .models import (
     Player,
     GameSession,
@@ -11,7 +12,6 @@ from .models import (
 )
 
 # Register your models here.
-admin.site.register(Player)
 admin.site.register(GameSession)
 admin.site.register(GameTurn)
 admin.site.register(Question)
@@ -20,6 +20,16 @@ admin.site.register(ChatMessage)
 admin.site.register(NarrativeChoice)
 
 
+@admin.register(Player)
+class PlayerAdmin(admin.ModelAdmin):
+    def get_exclude(self, request, obj=None):
+        storage = obj.pool_storage if obj else pools.default_pool_storage()
+        # Only relational players keep their pools in the ManyToMany fields
+        if storage != pools.RELATIONAL:
+            return [f"{name}_pool" for name in pools.POOL_MODELS]
+        return super().get_exclude(request, obj)
+
+
 @admin.register(Character)
 class CharacterAdmin(admin.ModelAdmin):
     list_display = (
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class GameConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "game"
+
+    def ready(self):
+        import game.signals  # noqa: F401
+
+        # This loads the signals on app initialization
@@ -0,0 +1,193 @@
+"""
+Process-wide indexes over the game content catalog.
+
+The catalog (words, questions, ...) only changes when content is ingested,
+so lookups that run on every turn are answered from indexes kept in memory
+and rebuilt lazily after the signals in game/signals.py invalidate them.
+
+Those signals only reach the process that made the change, and bulk writes
+send none, so every change also bumps the CatalogVersion row. Each process
+compares it with the version it last saw at most every
+GAME_CATALOG_CHECK_INTERVAL seconds and drops its indexes when it moved.
+"""
+
+import time
+
+import numpy as np
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+
+_simple_words = None
+
+# CatalogVersion last seen by this process, None before the first check
+_seen_version = None
+_checked_at = None
+
+# Sampling source -> sorted numpy array of ids, see game/sampling.py
+_id_arrays = {}
+
+# Bumped every time the id arrays are dropped, so callers can key their own
+# caches on the catalog contents.
+version = 0
+
+
+class SimpleWordIndex:
+    """Ids of the simple words, grouped by kind_of_word."""
+
+    def __init__(self, rows):
+        self.ids_by_kind = {}
+        self.kind_by_id = {}
+        for pk, kind in rows:
+            self.ids_by_kind.setdefault(kind, []).append(pk)
+            self.kind_by_id[pk] = kind
+
+    def ids(self, kind):
+        return self.ids_by_kind.get(kind, [])
+
+
+def check_version(force=False):
+    """
+    Drop the indexes when another process changed the catalog. The version
+    is read at most every GAME_CATALOG_CHECK_INTERVAL seconds, or now with
+    `force`. The first check of a process drops them too, as they may have
+    been loaded before a change.
+    """
+    global _seen_version, _checked_at
+    now = time.monotonic()
+    interval = getattr(settings, "GAME_CATALOG_CHECK_INTERVAL", 5)
+    if not force and _checked_at is not None and now - _checked_at < interval:
+        return
+    _checked_at = now
+    current = apps.get_model("game", "CatalogVersion").current()
+    if current != _seen_version:
+        _seen_version = current
+        invalidate_simple_words()
+        invalidate_id_arrays()
+
+
+def ensure_version(version):
+    """Check the catalog version now unless `version` was seen already."""
+    if _seen_version is None or _seen_version < version:
+        check_version(force=True)
+
+
+def snapshot():
+    """
+    Return the catalog version and the highest question and word ids, which
+    pin a derivation to the catalog as it is now, see pools.derive_pools.
+    """
+    marks = {
+        name: apps.get_model("game", model).objects.aggregate(last=Max("id"))["last"]
+        or 0
+        for name, model in (("question", "Question"), ("word", "Word"))
+    }
+    # Read last, so that the marks are not newer than the version (ingest
+    # bumps it in the transaction that adds the rows)
+    marks["version"] = apps.get_model("game", "CatalogVersion").current()
+    return marks
+
+
+def bump_version():
+    """
+    Record a change of the catalog for the other processes, once the
+    current transaction commits.
+    """
+    transaction.on_commit(apps.get_model("game", "CatalogVersion").bump)
+
+
+def simple_words():
+    global _simple_words
+    check_version()
+    index = _simple_words
+    if index is None:
+        Word = apps.get_model("game", "Word")
+        index = SimpleWordIndex(
+            Word.objects.filter(isSimple=True)
+            .order_by("id")
+            .values_list("id", "kind_of_word")
+        )
+        _simple_words = index
+    return index
+
+
+def invalidate_simple_words():
+    global _simple_words
+    _simple_words = None
+
+
+def general_question_ids(until=None):
+    """Return the general question ids, those up to id `until` if given."""
+    check_version()
+    key = ("general_questions",)
+    ids = _id_arrays.get(key)
+    if ids is None:
+        Question = apps.get_model("game", "Question")
+        ids = np.fromiter(
+            Question.objects.filter(is_general=True)
+            .order_by("id")
+            .values_list("id", flat=True),
+            dtype=np.int64,
+        )
+        _id_arrays[key] = ids
+    if until is not None:
+        ids = ids[: np.searchsorted(ids, until, side="right")]
+    return ids
+
+
+def activity_question_ids(activity_ids, until=None):
+    """
+    Return {activity_id: question id array} for the given activities, with
+    only the questions up to id `until` if given.
+    """
+    Activity = apps.get_model("game", "Activity")
+    return _related_ids(
+        "activity_questions",
+        Activity.questions.through,
+        "activity",
+        activity_ids,
+        until,
+    )
+
+
+def quality_word_ids(quality_ids, until=None):
+    """Return {quality_id: word id array}, see activity_question_ids."""
+    Quality = apps.get_model("game", "Quality")
+    return _related_ids(
+        "quality_words", Quality.words.through, "quality", quality_ids, until
+    )
+
+
+def _related_ids(source, through, owner, owner_ids, until=None):
+    check_version()
+    # Owners that are not cached yet are loaded together in one query
+    missing = {pk for pk in owner_ids if (source, pk) not in _id_arrays}
+    if missing:
+        target = next(
+            f.name
+            for f in through._meta.get_fields()
+            if f.is_relation and f.name != owner
+        )
+        loaded = {pk: [] for pk in missing}
+        for owner_id, target_id in (
+            through.objects.filter(**{f"{owner}_id__in": missing})
+            .order_by(f"{target}_id")
+            .values_list(f"{owner}_id", f"{target}_id")
+        ):
+            loaded[owner_id].append(target_id)
+        for pk, ids in loaded.items():
+            _id_arrays[(source, pk)] = np.array(ids, dtype=np.int64)
+    related = {pk: _id_arrays[(source, pk)] for pk in owner_ids}
+    if until is not None:
+        related = {
+            pk: ids[: np.searchsorted(ids, until, side="right")]
+            for pk, ids in related.items()
+        }
+    return related
+
+
+def invalidate_id_arrays():
+    global version
+    _id_arrays.clear()
+    version += 1
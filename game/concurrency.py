@@ -0,0 +1,84 @@
+"""
+Optimistic concurrency for the game's state machines.
+
+Both players, or two tabs of one player, can act on the same game at once.
+django_fsm checks a transition's source state in Python against the row as
+it was loaded, so two actions that loaded the same turn could both pass the
+check and the last save would win.
+
+Versioned models keep a version counter. Every save of an existing row is a
+conditional UPDATE
+
+    UPDATE ... SET ..., version = <loaded version + 1>
+    WHERE id = ... AND version = <loaded version> AND state = <loaded state>
+
+and raises StaleState when no row matched, i.e. another action saved the row
+since it was loaded. Nothing is locked, so a waiting action does not hold a
+database connection. The caller reloads the row and tries again (see
+GameConsumer.run_action_sync).
+"""
+
+from django.db import models
+from django_fsm import ConcurrentTransition, ConcurrentTransitionMixin
+
+
+class StaleState(ConcurrentTransition):
+    """The row was changed by someone else since it was loaded."""
+
+
+class VersionedModel(ConcurrentTransitionMixin, models.Model):
+    version = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._loaded_version = self.version
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        # ConcurrentTransitionMixin adds the state to the WHERE clause
+        try:
+            updated = super()._do_update(
+                base_qs.filter(version=self._loaded_version),
+                using,
+                pk_val,
+                values,
+                update_fields,
+                forced_update,
+            )
+        except ConcurrentTransition as error:
+            raise StaleState(str(error)) from error
+        if not updated and base_qs.filter(pk=pk_val).exists():
+            raise StaleState(
+                f"{self._meta.object_name} {pk_val} was changed by another action."
+            )
+        return updated
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        unsaved_states = {}
+        if update_fields is not None:
+            # ConcurrentTransitionMixin takes the states in memory as saved,
+            # also those that update_fields left out
+            initial_states = self._ConcurrentTransitionMixin__initial_states
+            unsaved_states = {
+                name: value
+                for name, value in initial_states.items()
+                if name not in update_fields
+            }
+        if not self._state.adding and (update_fields is None or update_fields):
+            self.version = self._loaded_version + 1
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "version"}
+        try:
+            super().save(*args, **kwargs)
+        except StaleState:
+            self.version = self._loaded_version
+            raise
+        self._loaded_version = self.version
+        self._ConcurrentTransitionMixin__initial_states.update(unsaved_states)
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._loaded_version = self.version
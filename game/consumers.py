@@ -3,11 +3,18 @@ from channels.generic.websocket import AsyncWebsocketConsumer
 import json
 
 from channels.layers import get_channel_layer
+from django_fsm import TransitionNotAllowed
 
+from game import tracing, unit_of_work
+from game.concurrency import StaleState
 from game.models import GameSession, Player, Question
 
 
 class GameConsumer(AsyncWebsocketConsumer):
+    # Attempts at an action before a conflict with a concurrent action is
+    # reported to the client
+    MAX_ACTION_ATTEMPTS = 3
+
     async def connect(self):
         self.game_id = self.scope["url_route"]["kwargs"]["game_id"]
         self.game_group_name = f"game_{self.game_id}"
@@ -36,6 +43,50 @@ class GameConsumer(AsyncWebsocketConsumer):
     def save_game_turn(self, game_turn):
         game_turn.save()
 
+    def get_player_sync(self, user):
+        # The transitions need the character and the moon sign of the player
+        return Player.objects.select_related("character", "MoonSignInterpretation").get(
+            user=user
+        )
+
+    def get_current_game_turn(self):
+        # One query for the session, its turn and moon phase sequence.
+        # The turn's parent_game is filled in from the same row, and the
+        # player checks only compare the session's player ids.
+        game_session = GameSession.objects.select_related(
+            "current_game_turn__moon_phase_turn_sequence"
+        ).get(game_id=self.game_id)
+        return game_session.current_game_turn
+
+    def run_action_sync(self, handler, value, player):
+        """
+        Run the *_sync `handler`. When another action changed the game since
+        it was loaded, the player is reloaded and the action is run again
+        (the handlers load the game themselves). When that action moved the
+        turn to a state the action is not allowed in, StaleState is raised,
+        so that the client is told to try again; in any other case an action
+        not allowed in the current state raises ValueError.
+        """
+        for attempt in range(1, self.MAX_ACTION_ATTEMPTS + 1):
+            try:
+                return handler(value, player)
+            except StaleState:
+                if attempt == self.MAX_ACTION_ATTEMPTS:
+                    raise
+                player = self.get_player_sync(player.user_id)
+            except TransitionNotAllowed as error:
+                if attempt > 1:
+                    raise StaleState(str(error)) from error
+                raise ValueError("This action is not allowed now.") from error
+
+    async def send_conflict(self):
+        await self.send_json(
+            {
+                "error": "The game was changed by another action, please try again.",
+                "retry": True,
+            }
+        )
+
     # Receive message from WebSocket
 
     async def receive(self, text_data, bytes_data=None):
@@ -50,6 +101,8 @@ class GameConsumer(AsyncWebsocketConsumer):
             )
             return
 
+        tracing.record(self.game_id, user, action, value)
+
         # Map the action to a handler function
         if action == "select_narrative":
             await self.make_narrative_choice(value)
@@ -68,11 +121,10 @@ class GameConsumer(AsyncWebsocketConsumer):
 
     def make_narrative_choice_sync(self, narrative, player):
         print(narrative + " _" + player.character_name + "_")
-        game_id = self.game_id
-        game_session = GameSession.objects.get(game_id=game_id)
-        game_turn = game_session.current_game_turn
-        game_turn.make_narrative_choice(narrative, player)
-        game_turn.save()
+        with unit_of_work.action():
+            game_turn = self.get_current_game_turn()
+            game_turn.make_narrative_choice(narrative, player)
+            unit_of_work.save(game_turn, "state")
 
     async def make_narrative_choice(self, narrative):
         user = self.scope["user"]
@@ -82,14 +134,16 @@ class GameConsumer(AsyncWebsocketConsumer):
             )
             return
 
-        player = await database_sync_to_async(Player.objects.get)(user=user)
+        player = await database_sync_to_async(self.get_player_sync)(user)
 
         try:
-            await database_sync_to_async(self.make_narrative_choice_sync)(
-                narrative, player
+            await database_sync_to_async(self.run_action_sync)(
+                self.make_narrative_choice_sync, narrative, player
             )
             # Broadcast the new state
             await self.broadcast_game_state()
+        except StaleState:
+            await self.send_conflict()
         except ValueError as e:
             await self.send_json({"error": str(e)})
 
@@ -97,8 +151,7 @@ class GameConsumer(AsyncWebsocketConsumer):
     def remove_question_from_pool(self, question_id, player):
         try:
             question = Question.objects.get(id=question_id)
-            player.question_pool.remove(question)
-            player.save()
+            player.pool("question").remove(question)
             return True
         except Question.DoesNotExist:
             return False
@@ -111,7 +164,7 @@ class GameConsumer(AsyncWebsocketConsumer):
             )
             return
 
-        player = await database_sync_to_async(Player.objects.get)(user=user)
+        player = await database_sync_to_async(self.get_player_sync)(user)
 
         try:
             question_removed = await self.remove_question_from_pool(question_id, player)
@@ -121,28 +174,30 @@ class GameConsumer(AsyncWebsocketConsumer):
                 )
                 return
 
-            await database_sync_to_async(self.select_question_sync)(question_id, player)
+            await database_sync_to_async(self.run_action_sync)(
+                self.select_question_sync, question_id, player
+            )
             await self.broadcast_game_state()
+        except StaleState:
+            await self.send_conflict()
         except ValueError as e:
             await self.send_json({"error": str(e)})
 
     def select_question_sync(self, question_id, player):
-        game_id = self.game_id
-        game_session = GameSession.objects.get(game_id=game_id)
-        game_turn = game_session.current_game_turn
+        with unit_of_work.action():
+            game_turn = self.get_current_game_turn()
 
-        try:
-            game_turn.select_question(question_id, player)
-            game_turn.save()
-        except Question.DoesNotExist:
-            pass  # Handle the error as needed
+            try:
+                game_turn.select_question(question_id, player)
+                unit_of_work.save(game_turn, "state")
+            except Question.DoesNotExist:
+                pass  # Handle the error as needed
 
     def answer_question_sync(self, answer, player):
-        game_id = self.game_id
-        game_session = GameSession.objects.get(game_id=game_id)
-        game_turn = game_session.current_game_turn
-        game_turn.answer_question(answer, player)
-        game_turn.save()
+        with unit_of_work.action():
+            game_turn = self.get_current_game_turn()
+            game_turn.answer_question(answer, player)
+            unit_of_work.save(game_turn, "state")
 
     async def answer_question(self, answer):
         user = self.scope["user"]
@@ -152,21 +207,24 @@ class GameConsumer(AsyncWebsocketConsumer):
             )
             return
 
-        player = await database_sync_to_async(Player.objects.get)(user=user)
+        player = await database_sync_to_async(self.get_player_sync)(user)
 
         try:
-            await database_sync_to_async(self.answer_question_sync)(answer, player)
+            await database_sync_to_async(self.run_action_sync)(
+                self.answer_question_sync, answer, player
+            )
             # Broadcast the new state
             await self.broadcast_game_state()
+        except StaleState:
+            await self.send_conflict()
         except ValueError as e:
             await self.send_json({"error": str(e)})
 
     def react_with_emoji_sync(self, emoji, player):
-        game_id = self.game_id
-        game_session = GameSession.objects.get(game_id=game_id)
-        game_turn = game_session.current_game_turn
-        game_turn.react_with_emoji(emoji, player)
-        game_turn.save()
+        with unit_of_work.action():
+            game_turn = self.get_current_game_turn()
+            game_turn.react_with_emoji(emoji, player)
+            unit_of_work.save(game_turn, "state")
 
     async def react_emoji(self, emoji):
         user = self.scope["user"]
@@ -176,20 +234,23 @@ class GameConsumer(AsyncWebsocketConsumer):
             )
             return
 
-        player = await database_sync_to_async(Player.objects.get)(user=user)
+        player = await database_sync_to_async(self.get_player_sync)(user)
         try:
-            await database_sync_to_async(self.react_with_emoji_sync)(emoji, player)
+            await database_sync_to_async(self.run_action_sync)(
+                self.react_with_emoji_sync, emoji, player
+            )
             # Broadcast the new state
             await self.broadcast_game_state()
+        except StaleState:
+            await self.send_conflict()
         except ValueError as e:
             await self.send_json({"error": str(e)})
 
     def write_message_about_moon_phase_sync(self, message, player):
-        game_id = self.game_id
-        game_session = GameSession.objects.get(game_id=game_id)
-        game_turn = game_session.current_game_turn
-        game_turn.write_message_about_moon_phase(message, player)
-        game_turn.save()
+        with unit_of_work.action():
+            game_turn = self.get_current_game_turn()
+            game_turn.write_message_about_moon_phase(message, player)
+            unit_of_work.save(game_turn, "state")
 
     async def moon_phase(self, value):
         user = self.scope["user"]
@@ -199,27 +260,26 @@ class GameConsumer(AsyncWebsocketConsumer):
             )
             return
 
-        player = await database_sync_to_async(Player.objects.get)(user=user)
+        player = await database_sync_to_async(self.get_player_sync)(user)
         message = value
         try:
-            await database_sync_to_async(self.write_message_about_moon_phase_sync)(
-                message, player
+            await database_sync_to_async(self.run_action_sync)(
+                self.write_message_about_moon_phase_sync, message, player
             )
             # Broadcast the new state
             await self.broadcast_game_state()
+        except StaleState:
+            await self.send_conflict()
         except ValueError as e:
             await self.send_json({"error": str(e)})
             # If there were partial changes to the game state, broadcast the new state
             await self.broadcast_game_state()
 
     def moon_meaning_sync(self, meaning, player):
-        game_id = self.game_id
-        game_session = GameSession.objects.get(game_id=game_id)
-        game_turn = game_session.current_game_turn
+        game_turn = self.get_current_game_turn()
         phase = game_turn.get_moon_phase()
         moon_interpretation = player.MoonSignInterpretation
         moon_interpretation.change_moon_sign(phase, meaning)
-        moon_interpretation.save()
 
     async def moon_meaning(self, meaning):
         user = self.scope["user"]
@@ -230,7 +290,7 @@ class GameConsumer(AsyncWebsocketConsumer):
             return
 
         try:
-            player = await database_sync_to_async(Player.objects.get)(user=user)
+            player = await database_sync_to_async(self.get_player_sync)(user)
             await database_sync_to_async(self.moon_meaning_sync)(meaning, player)
             # Broadcast the new state
             await self.broadcast_game_state()
@@ -53,7 +53,7 @@ class NarrativeChoiceForm(forms.Form):
         if player:
             self.fields["narrative"].choices = [
                 (n.id, n.name)
-                for n in player.narrative_choice_pool.filter(night_number=night)
+                for n in player.pool("narrative_choice").filter(night_number=night)
             ]
 
 
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from game.models import ChatMessage, ReactionSummary
+
+
+class Command(BaseCommand):
+    help = (
+        "Computes the reaction summaries of existing games from their chat "
+        "messages, replacing the summaries stored for those games"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--game-id", help="Only the game with this game_id")
+
+    def handle(self, *args, **options):
+        chat_messages = ChatMessage.objects.filter(game__isnull=False).exclude(
+            reaction__isnull=True
+        )
+        summaries = ReactionSummary.objects.all()
+        if options["game_id"]:
+            chat_messages = chat_messages.filter(game__game_id=options["game_id"])
+            summaries = summaries.filter(game__game_id=options["game_id"])
+
+        rows = {}
+        reactions = chat_messages.order_by("game", "seq").values_list(
+            "game_id", "sender", "reaction"
+        )
+        for game_id, sender, reaction in reactions.iterator():
+            if not reaction:
+                continue
+            if (game_id, sender) not in rows:
+                rows[game_id, sender] = ReactionSummary(game_id=game_id, sender=sender)
+            rows[game_id, sender].add(reaction)
+
+        with transaction.atomic():
+            summaries.delete()
+            ReactionSummary.objects.bulk_create(rows.values(), batch_size=1000)
+
+        games = {game_id for game_id, _ in rows}
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Backfilled {len(rows)} reaction summaries of {len(games)} games"
+            )
+        )
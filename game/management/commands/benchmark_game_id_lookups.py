@@ -0,0 +1,84 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from game.models import GameSession
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates throwaway game sessions and times GameSession lookups by "
+        "game_id, the lookup every game view and consumer action starts with. "
+        "Also reports the size of the game_id indexes where the database can "
+        "tell. Everything is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sessions", type=int, default=10000)
+        parser.add_argument("--lookups", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            start = time.perf_counter()
+            sessions = [GameSession() for _ in range(options["sessions"])]
+            GameSession.objects.bulk_create(sessions, batch_size=1000)
+            created = time.perf_counter() - start
+
+            # Look the sessions up by the id the URLs carry
+            game_ids = [str(session.game_id) for session in sessions]
+            lookups = random.choices(game_ids, k=options["lookups"])
+            start = time.perf_counter()
+            for game_id in lookups:
+                GameSession.objects.get(game_id=game_id)
+            looked_up = time.perf_counter() - start
+
+            index_sizes = self.index_sizes()
+            transaction.set_rollback(True)
+
+        self.stdout.write(
+            f"Created {len(sessions)} sessions in {created * 1000:.1f} ms"
+        )
+        self.stdout.write(
+            f"{len(lookups)} lookups in {looked_up * 1000:.1f} ms "
+            f"({looked_up / len(lookups) * 1e6:.1f} us per lookup)"
+        )
+        if index_sizes is None:
+            self.stdout.write(f"Index sizes are not available on {connection.vendor}")
+        for name, size in index_sizes or []:
+            self.stdout.write(f"Index {name}: {size / 1024:.1f} KiB")
+
+    def index_sizes(self):
+        """Return (name, bytes) for the indexes on game_id, or None."""
+        table = GameSession._meta.db_table
+        column = GameSession._meta.get_field("game_id").column
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                query = "SELECT pg_relation_size(quote_ident(%s))"
+            elif connection.vendor == "sqlite":
+                query = "SELECT SUM(pgsize) FROM dbstat WHERE name = %s"
+            else:
+                return None
+            sizes = []
+            for name in self.index_names(cursor, table, column):
+                cursor.execute(query, [name])
+                sizes.append((name, cursor.fetchone()[0] or 0))
+            return sizes
+
+    def index_names(self, cursor, table, column):
+        if connection.vendor == "sqlite":
+            # Introspection leaves out the names of the automatic indexes
+            cursor.execute(f"PRAGMA index_list({connection.ops.quote_name(table)})")
+            names = [row[1] for row in cursor.fetchall()]
+            columns = {}
+            for name in names:
+                cursor.execute(f"PRAGMA index_info({connection.ops.quote_name(name)})")
+                columns[name] = [row[2] for row in cursor.fetchall()]
+        else:
+            constraints = connection.introspection.get_constraints(cursor, table)
+            columns = {
+                name: info["columns"]
+                for name, info in constraints.items()
+                if info["index"] or info["unique"]
+            }
+        return [name for name, names in columns.items() if names == [column]]
@@ -0,0 +1,148 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from game.consumers import GameConsumer
+from game.models import (
+    Character,
+    GameSession,
+    Interest,
+    MoonSignInterpretation,
+    NarrativeChoice,
+    Player,
+    Question,
+    Word,
+    moon_phase_turn_sequence,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Plays one scripted turn of a throwaway game through the consumer's "
+        "action handlers and reports the number of queries and writes per "
+        "transition. "
+        "Everything is rolled back afterwards."
+    )
+
+    def handle(self, *args, **options):
+        results = []
+        with transaction.atomic():
+            game_id, users, narrative_choice = self.build_game()
+            consumer = GameConsumer()
+            consumer.game_id = game_id
+
+            question_ids = list(Question.objects.values_list("id", flat=True))
+            a, b = users
+            steps = [
+                ("select_question", a, question_ids[0]),
+                ("answer_question", b, "the moon is bright"),
+                ("react_emoji", a, "🌕"),
+                ("select_question", b, question_ids[1]),
+                ("answer_question", a, "the moon is bright"),
+                ("react_emoji", b, "🌑"),
+                ("make_narrative_choice", a, str(narrative_choice.id)),
+                ("make_narrative_choice", b, str(narrative_choice.id)),
+                ("moon_phase", a, "the moon"),
+                ("moon_phase", b, "the moon"),
+            ]
+            for action, user, value in steps:
+                queries = self.run(consumer, action, user, value)
+                results.append((action, user.username, *queries))
+            transaction.set_rollback(True)
+
+        self.stdout.write(
+            f"{'transition':<24}{'player':<14}{'queries':>8}{'writes':>8}"
+        )
+        for action, username, queries, writes in results:
+            self.stdout.write(f"{action:<24}{username:<14}{queries:>8}{writes:>8}")
+        total = sum(queries for _, _, queries, _ in results)
+        writes = sum(writes for _, _, _, writes in results)
+        self.stdout.write(
+            self.style.SUCCESS(f"Total queries: {total}, writes: {writes}")
+        )
+
+    def run(self, consumer, action, user, value):
+        handlers = {
+            "answer_question": consumer.answer_question_sync,
+            "react_emoji": consumer.react_with_emoji_sync,
+            "make_narrative_choice": consumer.make_narrative_choice_sync,
+            "moon_phase": consumer.write_message_about_moon_phase_sync,
+        }
+        with CaptureQueriesContext(connection) as queries:
+            # The consumer looks the player up before every action
+            player = consumer.get_player_sync(user)
+            try:
+                if action == "select_question":
+                    self.select_question(consumer, value, player)
+                else:
+                    handlers[action](value, player)
+            except ValueError:
+                # The first moon phase message reports that the partner has
+                # not written theirs yet, as it does in the consumer
+                pass
+        # Savepoints are not counted
+        statements = [
+            query["sql"]
+            for query in queries.captured_queries
+            if not query["sql"].startswith(("SAVEPOINT", "RELEASE SAVEPOINT"))
+        ]
+        writes = [
+            sql for sql in statements if sql.startswith(("INSERT", "UPDATE", "DELETE"))
+        ]
+        return len(statements), len(writes)
+
+    def select_question(self, consumer, question_id, player):
+        question = Question.objects.get(id=question_id)
+        player.pool("question").remove(question)
+        consumer.select_question_sync(question_id, player)
+
+    def build_game(self):
+        users = [
+            User.objects.create_user(username=f"benchmark_{slot}")
+            for slot in ("a", "b")
+        ]
+        game_session = GameSession()
+        game_session.save()
+        players = [
+            Player.objects.create(user=user, game_session=game_session)
+            for user in users
+        ]
+        game_session.playerA, game_session.playerB = players
+        game_session.save()
+        game_session.initialize_game()
+        game_session.save()
+
+        character = Character.objects.create(
+            name="Benchmark", description="", image="characters/benchmark.png"
+        )
+        interest = Interest.objects.create(name="Benchmarking")
+        narrative_choice = NarrativeChoice.objects.create(
+            name="Benchmark night", interest=interest, night_number=1
+        )
+        words = [Word.objects.create(word=w) for w in "the moon is bright".split()]
+        narrative_choice.words.add(*words)
+        questions = [Question.objects.create(text=f"benchmark {i}") for i in range(2)]
+        for player in players:
+            player.character = character
+            player.character_creation_state = Player.CHARACTER_COMPLETE
+            player.MoonSignInterpretation = MoonSignInterpretation.objects.create(
+                on_player=player,
+                new_moon="positive",
+                first_quarter="ambiguous",
+                full_moon="negative",
+                last_quarter="ambiguous",
+            )
+            player.save()
+            player.pool("question").add(*questions)
+            player.pool("character_word").add(*words)
+
+        # Make the turn after the narrative choices a full moon turn, with a
+        # schedule of its own as the one of the day is shared
+        sequence = moon_phase_turn_sequence(full_moon_turn_number=2)
+        sequence.build_turn_phases()
+        sequence.save()
+        game_session.current_game_turn.moon_phase_turn_sequence = sequence
+        game_session.current_game_turn.save()
+        game_session.start_regular_turn()
+        game_session.save()
+        return str(game_session.game_id), users, narrative_choice
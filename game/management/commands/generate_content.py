@@ -0,0 +1,104 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from game.models import Player
+from game.tools import character_json_template_generator as generator
+from game.tools.character_ingest import ingest_packs
+from game.tools.content_packs import merge_packs, normalize_pack
+
+# Simple words of each kind generated by default, per word a player holds
+SIMPLE_WORDS_PER_TARGET = 10
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate character packs of a given size for benchmarks, the same "
+        "ones for the same arguments and seed. The packs are written as JSON "
+        "files (--output) or ingested into the database (--load)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--characters", type=int, default=1)
+        parser.add_argument("--qualities", type=int, default=len(generator.QUALITIES))
+        parser.add_argument(
+            "--words-per-quality", type=int, default=generator.WORDS_PER_QUALITY
+        )
+        parser.add_argument("--activities", type=int, default=len(generator.ACTIVITIES))
+        parser.add_argument(
+            "--questions-per-activity",
+            type=int,
+            default=generator.QUESTIONS_PER_ACTIVITY,
+        )
+        parser.add_argument("--interests", type=int, default=len(generator.INTERESTS))
+        parser.add_argument(
+            "--narrative-choices-per-interest",
+            type=int,
+            default=generator.NARRATIVE_CHOICES_PER_INTEREST,
+        )
+        parser.add_argument(
+            "--words-per-narrative-choice",
+            type=int,
+            default=generator.WORDS_PER_NARRATIVE_CHOICE,
+        )
+        parser.add_argument(
+            "--simple-words",
+            nargs="*",
+            metavar="KIND=COUNT",
+            help="Simple words per kind_of_word, by default "
+            f"{SIMPLE_WORDS_PER_TARGET} times Player.SIMPLE_WORD_TARGETS",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Directory to write the packs to")
+        parser.add_argument(
+            "--load", action="store_true", help="Ingest the packs into the database"
+        )
+
+    def handle(self, *args, **options):
+        if not options["output"] and not options["load"]:
+            raise CommandError("Give --output, --load or both.")
+        try:
+            packs = generator.generate_packs(
+                characters=options["characters"],
+                qualities=options["qualities"],
+                words_per_quality=options["words_per_quality"],
+                activities=options["activities"],
+                questions_per_activity=options["questions_per_activity"],
+                interests=options["interests"],
+                narrative_choices_per_interest=options[
+                    "narrative_choices_per_interest"
+                ],
+                words_per_narrative_choice=options["words_per_narrative_choice"],
+                simple_words=self.simple_word_counts(options["simple_words"]),
+                seed=options["seed"],
+            )
+        except ValueError as error:
+            raise CommandError(error)
+
+        if options["output"]:
+            os.makedirs(options["output"], exist_ok=True)
+            for i, pack in enumerate(packs, 1):
+                path = os.path.join(options["output"], f"character_{i}.json")
+                with open(path, "w") as file:
+                    json.dump(pack, file)
+            self.stdout.write(f"Wrote {len(packs)} packs to {options['output']}")
+
+        if options["load"]:
+            report = ingest_packs([merge_packs(map(normalize_pack, packs))])
+            for line in report.lines():
+                self.stdout.write(line)
+            self.stdout.write(self.style.SUCCESS(f"Loaded {len(packs)} characters"))
+
+    def simple_word_counts(self, values):
+        if values is None:
+            return {
+                kind: count * SIMPLE_WORDS_PER_TARGET
+                for kind, count in Player.SIMPLE_WORD_TARGETS.items()
+            }
+        counts = {}
+        for value in values:
+            kind, _, count = value.partition("=")
+            if not kind or not count.isdigit():
+                raise CommandError(f"Expected KIND=COUNT, not {value!r}.")
+            counts[kind] = int(count)
+        return counts
@@ -1,19 +1,132 @@
-from django.core.management.base import BaseCommand
-import json
-from game.tools.character_ingest import ingest_json_data  # Import your function
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from game.tools.character_ingest import (
+    STREAM_BATCH_SIZE,
+    ingest_packs,
+    ingest_stream,
+)
+from game.tools.content_packs import load_pack, merge_packs
 
 
 class Command(BaseCommand):
-    help = "Ingest data from a JSON file into the database"
+    help = (
+        "Ingest character packs from JSON files into the database. The files "
+        "are read and validated in parallel, then written in one transaction. "
+        "With --stream they are read one record at a time instead and written "
+        "in batches as they are read, for packs too large to hold in memory."
+    )
 
     def add_arguments(self, parser):
-        parser.add_argument("json_file", type=str, help="Path to the JSON file")
+        parser.add_argument(
+            "paths",
+            nargs="+",
+            help="JSON files, directories of JSON files or glob patterns",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Processes reading the files",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Make the writes and roll them back, to report what would change",
+        )
+        parser.add_argument(
+            "--stream",
+            action="store_true",
+            help="Read the files one after the other, record by record",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=STREAM_BATCH_SIZE,
+            help="Words, questions and narrative choices written at a time "
+            "with --stream",
+        )
 
     def handle(self, *args, **options):
-        json_file = options["json_file"]
+        paths = self.expand(options["paths"])
+        if options["stream"]:
+            self.stream(paths, options["batch_size"], options["dry_run"])
+        else:
+            self.ingest(paths, options["workers"], options["dry_run"])
+        if options["dry_run"]:
+            self.stdout.write(self.style.WARNING("Dry run, nothing was ingested"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Successfully ingested data"))
+
+    def ingest(self, paths, workers, dry_run):
+        start = time.perf_counter()
+        packs = self.load(paths, workers)
+        loaded = time.perf_counter() - start
+
+        start = time.perf_counter()
+        pack = merge_packs(packs)
+        merged = time.perf_counter() - start
+
+        report = ingest_packs([pack], dry_run=dry_run)
+        self.stdout.write(f"Files: {len(paths)}")
+        for line in report.lines():
+            self.stdout.write(line)
+        self.stdout.write(f"read and validate: {loaded * 1000:.1f} ms")
+        self.stdout.write(f"merge: {merged * 1000:.1f} ms")
+
+    def stream(self, paths, batch_size, dry_run):
+        try:
+            report = ingest_stream(paths, batch_size=batch_size, dry_run=dry_run)
+        except (OSError, ValueError) as error:
+            raise CommandError(f"Invalid pack: {error}")
+        self.stdout.write(f"Files: {len(paths)}")
+        for line in report.lines():
+            self.stdout.write(line)
+
+    def expand(self, patterns):
+        paths = []
+        for pattern in patterns:
+            if os.path.isdir(pattern):
+                matches = glob.glob(os.path.join(glob.escape(pattern), "*.json"))
+            elif glob.has_magic(pattern):
+                matches = glob.glob(pattern)
+            else:
+                matches = [pattern]
+            if not matches:
+                raise CommandError(f"No JSON files match {pattern!r}")
+            paths += sorted(matches)
+        # A file named twice is ingested once
+        return list(dict.fromkeys(paths))
+
+    def load(self, paths, workers):
+        workers = max(1, min(workers or 1, len(paths)))
+        if workers == 1:
+            results = [self.try_load(path) for path in paths]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(load_pack, path) for path in paths]
+                results = [self.result(future) for future in futures]
+
+        errors = [
+            f"{path}: {error}"
+            for path, (pack, error) in zip(paths, results)
+            if error is not None
+        ]
+        if errors:
+            raise CommandError("Invalid packs:\n" + "\n".join(errors))
+        return [pack for pack, _ in results]
 
-        with open(json_file, "r") as file:
-            json_data = json.load(file)
+    def try_load(self, path):
+        try:
+            return load_pack(path), None
+        except (OSError, ValueError) as error:
+            return None, error
 
-        ingest_json_data(json_data)
-        self.stdout.write(self.style.SUCCESS("Successfully ingested data"))
+    def result(self, future):
+        try:
+            return future.result(), None
+        except (OSError, ValueError) as error:
+            return None, error
@@ -0,0 +1,278 @@
+import asyncio
+import io
+import random
+import time
+import uuid
+from collections import defaultdict
+from contextlib import redirect_stdout
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.management.base import CommandError
+from django.test import Client, override_settings
+from game.consumers import GameConsumer
+from game.management.commands import simulate_games
+from game.models import GameTurn, Player, Question, ReactionSummary
+
+# The channel layer of the load test, in the process like the application
+IN_MEMORY_CHANNEL_LAYERS = {
+    "default": {
+        "BACKEND": "channels.layers.InMemoryChannelLayer",
+        "CONFIG": {"capacity": 1000},
+    }
+}
+
+
+class LoadTestGame:
+    """A game of the load test and the websockets connected to it."""
+
+    def __init__(self, game_session, users):
+        self.game_session = game_session
+        self.users = users
+        self.consumer = GameConsumer()
+        self.consumer.game_id = str(game_session.game_id)
+        self.users_by_player = {user.player.pk: user for user in users}
+        # User id -> the connection the user acts through
+        self.players = {}
+        # All the connections to the game, watchers included
+        self.connections = []
+
+
+class Command(simulate_games.Command):
+    help = (
+        "Runs the ASGI application of roleplaydate.asgi with an in-memory "
+        "channel layer and plays games concurrently over websockets, as "
+        "logged in users sending the actions of the game page "
+        "(submit_question, submit_answer, react_emoji, select_narrative, "
+        "moon_phase). Every action is sent once the previous one of its game "
+        "was broadcast. Reports the actions per second, the round trip time "
+        "from an action to its refresh broadcast reaching the player who "
+        "sent it, and the fan-out time until it reached every connection of "
+        "the game. The users and games are deleted afterwards unless --keep "
+        "is given. Characters must have been ingested, see generate_content."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--games", type=int, default=10)
+        parser.add_argument(
+            "--turns", type=int, default=3, help="Turns played in every game"
+        )
+        parser.add_argument(
+            "--watchers",
+            type=int,
+            default=0,
+            help="Connections of every game that only receive the broadcasts, "
+            "as other tabs of the players",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=10,
+            help="Seconds to wait for a broadcast before giving up on a game",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Seed of the players' choices"
+        )
+        parser.add_argument(
+            "--keep", action="store_true", help="Keep the users and games created"
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.samples = defaultdict(list)
+        self.characters = self.load_characters()
+        self.question_ids = list(Question.objects.values_list("id", flat=True))
+        if not self.question_ids:
+            raise CommandError("There are no questions, ingest some content first.")
+        self.turns = options["turns"]
+        self.timeout = options["timeout"]
+        # Action -> [(round trip, fan-out), ...] in seconds
+        self.timings = defaultdict(list)
+        self.errors = 0
+        self.timeouts = 0
+
+        run = uuid.uuid4().hex[:8]
+        games = []
+        self.user_ids, self.session_keys = [], []
+        try:
+            for i in range(options["games"]):
+                games.append(self.set_up_game(f"load_{run}_{i}"))
+            elapsed = self.run(games, options["watchers"])
+        finally:
+            if not options["keep"]:
+                self.clean_up_games(games)
+
+        self.report(elapsed, games)
+
+    def set_up_game(self, name, game_id=None):
+        """Create two users, their game and characters, and log them in."""
+        users = [
+            User.objects.create_user(username=f"{name}_{slot}") for slot in ("a", "b")
+        ]
+        self.user_ids += [user.pk for user in users]
+        game_session = self.initialize_game(users, game_id)
+        for user in users:
+            self.create_character(game_session, user)
+        game = LoadTestGame(game_session, users)
+        game.cookies = {user.pk: self.login(user) for user in users}
+        self.session_keys += game.cookies.values()
+        return game
+
+    def run(self, games, watchers):
+        """Play `games` over websockets, return the time taken."""
+        # The consumer prints the narrative choices
+        with override_settings(
+            CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS
+        ), redirect_stdout(io.StringIO()):
+            # Imported here, as the ASGI application sets up Django
+            from roleplaydate.asgi import application
+
+            return async_to_sync(self.run_games)(application, games, watchers)
+
+    def clean_up_games(self, games):
+        self.clean_up([game.game_session.pk for game in games], self.user_ids)
+        Session.objects.filter(session_key__in=self.session_keys).delete()
+
+    def login(self, user):
+        """Return the session key of a new session of `user`."""
+        client = Client()
+        client.force_login(user)
+        return client.cookies[settings.SESSION_COOKIE_NAME].value
+
+    def connect(self, application, game, user):
+        cookie = f"{settings.SESSION_COOKIE_NAME}={game.cookies[user.pk]}"
+        return WebsocketCommunicator(
+            application,
+            f"/ws/game_progress/{game.game_session.game_id}/",
+            headers=[(b"cookie", cookie.encode())],
+        )
+
+    async def run_games(self, application, games, watchers):
+        """Connect every game, play them all at once, return the time taken."""
+        for game in games:
+            for user in game.users:
+                game.players[user.pk] = self.connect(application, game, user)
+            game.connections = list(game.players.values()) + [
+                self.connect(application, game, game.users[0]) for _ in range(watchers)
+            ]
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(
+                self.open(connection)
+                for game in games
+                for connection in game.connections
+            )
+        )
+        self.connect_time = time.perf_counter() - start
+
+        self.started = time.perf_counter()
+        await asyncio.gather(*(self.play_game(game) for game in games))
+        elapsed = time.perf_counter() - self.started
+
+        await asyncio.gather(
+            *(
+                connection.disconnect()
+                for game in games
+                for connection in game.connections
+            )
+        )
+        return elapsed
+
+    async def open(self, connection):
+        connected, _ = await connection.connect(timeout=self.timeout)
+        if not connected:
+            raise CommandError("A websocket connection was refused.")
+
+    async def play_game(self, game):
+        while True:
+            action = await database_sync_to_async(self.next_action)(game)
+            if action is None:
+                return
+            name, user, value = action
+            try:
+                timings = await self.send(game, name, user, value)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                return
+            self.timings[name].append(timings)
+
+    def next_action(self, game):
+        """Return (action, user, value) of the next action, None at the end."""
+        game_turn = game.consumer.get_current_game_turn()
+        game_session = game_turn.parent_game
+        if not game_session.is_active or game_turn.turn_number > self.turns:
+            return None
+        active_user = game.users_by_player[game_turn.active_player_id]
+        if game_turn.state == GameTurn.SELECT_QUESTION:
+            player = Player.objects.get(user=active_user)
+            question_ids = player.pool("question").ids() or self.question_ids
+            return "submit_question", active_user, self.rng.choice(question_ids)
+        if game_turn.state == GameTurn.ANSWER_QUESTION:
+            return "submit_answer", active_user, self.message(active_user)
+        if game_turn.state == GameTurn.REACT_EMOJI:
+            emoji = self.rng.choice(list(ReactionSummary.EMOJI_PHASES))
+            return "react_emoji", active_user, emoji
+        if game_turn.state == GameTurn.NARRATIVE_CHOICES:
+            user = game.users[1 if game_turn.player_a_narrative_choice_made else 0]
+            narrative = self.narrative_choice(user, game_turn.narrative_nights)
+            return "select_narrative", user, narrative
+        return "moon_phase", active_user, self.message(active_user)
+
+    async def send(self, game, action, user, value):
+        """
+        Send `action` as `user` and wait for its refresh broadcast on every
+        connection of the game. Return the round trip and the fan-out time.
+        """
+        start = time.perf_counter()
+        sender = game.players[user.pk]
+        await sender.send_json_to({"action": action, "value": value})
+        times = await asyncio.gather(
+            *(
+                self.receive_broadcast(connection, start)
+                for connection in game.connections
+            )
+        )
+        return times[game.connections.index(sender)], max(times)
+
+    async def receive_broadcast(self, connection, start):
+        """Wait for the next refresh or navigate command, return its time."""
+        while True:
+            message = await connection.receive_json_from(timeout=self.timeout)
+            if "command" in message:
+                return time.perf_counter() - start
+            # The first moon phase message is answered with an error saying
+            # that the partner has not written theirs yet
+            if "error" in message and not message["error"].startswith("Not both"):
+                self.errors += 1
+
+    def report(self, elapsed, games):
+        connections = sum(len(game.connections) for game in games)
+        self.stdout.write(
+            f"{'action':<20}{'count':>7}{'rtt p50':>10}{'rtt p99':>10}"
+            f"{'fan-out p50':>13}{'fan-out p99':>13}"
+        )
+        actions = 0
+        for action, samples in self.timings.items():
+            actions += len(samples)
+            round_trips, fan_outs = np.array(samples).T * 1000
+            rtt_p50, rtt_p99 = np.percentile(round_trips, [50, 99])
+            fan_out_p50, fan_out_p99 = np.percentile(fan_outs, [50, 99])
+            self.stdout.write(
+                f"{action:<20}{len(samples):>7}{rtt_p50:>8.1f}ms{rtt_p99:>8.1f}ms"
+                f"{fan_out_p50:>11.1f}ms{fan_out_p99:>11.1f}ms"
+            )
+        self.stdout.write(
+            f"{connections} connections opened in {self.connect_time:.2f} s, "
+            f"{self.errors} errors, {self.timeouts} games timed out"
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{actions} actions in {elapsed:.2f} s "
+                f"({actions / elapsed:.1f} actions/s)"
+            )
+        )
@@ -0,0 +1,225 @@
+import asyncio
+import random
+import time
+import uuid
+from collections import defaultdict
+
+import numpy as np
+from channels.db import database_sync_to_async
+from django.core.management.base import CommandError
+from game.management.commands import load_test_websockets
+from game.models import GameSession, Player, Question
+from game.tracing import read_trace
+
+# Actions after whose error the consumer still broadcasts a refresh
+BROADCAST_AFTER_ERROR = ("moon_phase", "moon_meaning")
+
+# Actions whose value is the id of an item of a pool of the player
+POOL_ACTIONS = {
+    "submit_question": "question",
+    "select_narrative": "narrative_choice",
+}
+
+
+def speed(value):
+    """Parse --speed, a factor or "max" (None)."""
+    if value == "max":
+        return None
+    try:
+        factor = float(value)
+    except ValueError:
+        factor = 0
+    if factor <= 0:
+        raise ValueError(value)
+    return factor
+
+
+class Command(load_test_websockets.Command):
+    help = (
+        "Replays a trace recorded with GAME_TRACE_FILE (see game/tracing.py) "
+        "over websockets, like load_test_websockets. Every game of the trace "
+        "is created again, with the same game id, for two new users whose "
+        "characters are picked at random; the first user of the trace to act "
+        "plays the player whose turn it is. The actions are sent at the "
+        "times they were recorded, sped up by --speed, or as fast as the "
+        "consumer answers with --speed=max, each one once the previous "
+        "action of its game was broadcast. Recorded question and narrative "
+        "choice ids that are not in the replaying player's pool are replaced "
+        "by one that is. Games are replayed from their first turn, so the "
+        "trace should cover them from there. The games are deleted "
+        "afterwards unless --keep is given. Characters must have been "
+        "ingested, see generate_content."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("trace", help="JSONL trace file")
+        parser.add_argument(
+            "--speed",
+            type=speed,
+            default=1.0,
+            help="Replay speed, 1 for the recorded pace, 10 for ten times "
+            'faster, "max" to send every action as soon as the previous one '
+            "was answered",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=10,
+            help="Seconds to wait for an answer before giving up on a game",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Seed of the characters and ids"
+        )
+        parser.add_argument(
+            "--keep", action="store_true", help="Keep the users and games created"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["trace"], "r") as file:
+                entries = list(read_trace(file))
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+        if not entries:
+            raise CommandError("The trace is empty.")
+        traces = defaultdict(list)
+        for entry in entries:
+            traces[entry["game_id"]].append(entry)
+
+        self.rng = random.Random(options["seed"])
+        self.samples = defaultdict(list)
+        self.characters = self.load_characters()
+        self.question_ids = list(Question.objects.values_list("id", flat=True))
+        if not self.question_ids:
+            raise CommandError("There are no questions, ingest some content first.")
+        self.speed = options["speed"]
+        self.timeout = options["timeout"]
+        self.timings = defaultdict(list)
+        self.errors = 0
+        self.timeouts = 0
+        self.replaced = 0
+        # Seconds each action was sent after the time it was due
+        self.lags = []
+
+        game_ids = list(traces)
+        existing = GameSession.objects.filter(game_id__in=game_ids)
+        if existing.exists():
+            raise CommandError(
+                f"{existing.count()} games of the trace exist already, replay "
+                "it against a database without them."
+            )
+
+        run = uuid.uuid4().hex[:8]
+        start = min(entry["ts"] for entry in entries)
+        games = []
+        self.user_ids, self.session_keys = [], []
+        try:
+            for i, game_id in enumerate(game_ids):
+                game = self.set_up_game(f"replay_{run}_{i}", game_id)
+                game.actions = self.schedule(game, traces[game_id], start)
+                games.append(game)
+            elapsed = self.run(games, 0)
+        finally:
+            if not options["keep"]:
+                self.clean_up_games(games)
+
+        self.report(elapsed, games)
+
+    def schedule(self, game, entries, start):
+        """
+        Return the (seconds after `start`, action, user, value) of the
+        entries of a game, the users of the trace mapped to those of `game`.
+        """
+        game_turn = GameSession.objects.get(pk=game.game_session.pk).current_game_turn
+        # The player whose turn it is first, as the first action is theirs
+        users = sorted(
+            game.users, key=lambda user: user.player.pk != game_turn.active_player_id
+        )
+        trace_users = list(dict.fromkeys(entry["user"] for entry in entries))
+        if len(trace_users) > len(users):
+            raise CommandError(
+                f"Game {entries[0]['game_id']} has {len(trace_users)} users."
+            )
+        users_by_trace_user = dict(zip(trace_users, users))
+        return [
+            (
+                entry["ts"] - start,
+                entry["action"],
+                users_by_trace_user[entry["user"]],
+                entry["value"],
+            )
+            for entry in entries
+        ]
+
+    async def play_game(self, game):
+        for offset, action, user, value in game.actions:
+            if self.speed:
+                delay = self.started + offset / self.speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                self.lags.append(max(0, -delay))
+            value = await database_sync_to_async(self.replay_value)(
+                game, action, user, value
+            )
+            try:
+                timings = await self.replay(game, action, user, value)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                return
+            if timings:
+                self.timings[action].append(timings)
+
+    def replay_value(self, game, action, user, value):
+        """Return the value to send for `value`, recorded in another database."""
+        if action == "end_game":
+            return str(game.game_session.game_id)
+        if action not in POOL_ACTIONS:
+            return value
+        ids = Player.objects.get(user=user).pool(POOL_ACTIONS[action]).ids()
+        if str(value) in map(str, ids):
+            return value
+        self.replaced += 1
+        if action == "submit_question":
+            return self.rng.choice(ids or self.question_ids)
+        return str(self.rng.choice(ids)) if ids else value
+
+    async def replay(self, game, action, user, value):
+        """
+        Send `action` as `user` and wait for its broadcast on every
+        connection of the game. Return the round trip and the fan-out time,
+        or None when the action was refused without a broadcast.
+        """
+        start = time.perf_counter()
+        sender = game.players[user.pk]
+        await sender.send_json_to({"action": action, "value": value})
+        while True:
+            message = await sender.receive_json_from(timeout=self.timeout)
+            if "command" in message:
+                break
+            # The first moon phase message is answered with an error saying
+            # that the partner has not written theirs yet
+            if not message["error"].startswith("Not both"):
+                self.errors += 1
+            if action not in BROADCAST_AFTER_ERROR:
+                return None
+        round_trip = time.perf_counter() - start
+        times = await asyncio.gather(
+            *(
+                self.receive_broadcast(connection, start)
+                for connection in game.connections
+                if connection is not sender
+            )
+        )
+        return round_trip, max([round_trip, *times])
+
+    def report(self, elapsed, games):
+        super().report(elapsed, games)
+        if self.lags:
+            p50, p99 = np.percentile(np.array(self.lags) * 1000, [50, 99])
+            self.stdout.write(
+                f"Sent {p50:.1f} ms (p50) and {p99:.1f} ms (p99) after the "
+                f"recorded time at {self.speed:g}x"
+            )
+        self.stdout.write(
+            f"{self.replaced} recorded ids not in the player's pool were replaced"
+        )
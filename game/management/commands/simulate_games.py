@@ -0,0 +1,354 @@
+import io
+import random
+import time
+import uuid
+from collections import defaultdict
+from contextlib import redirect_stdout
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.db.models import Max
+from django.test.utils import CaptureQueriesContext
+from game.consumers import GameConsumer
+from game.models import (
+    Character,
+    GameSession,
+    GameTurn,
+    MoonSignInterpretation,
+    NarrativeChoice,
+    Player,
+    Question,
+    ReactionSummary,
+    Word,
+)
+
+# Words used in an answer or a moon phase message
+WORDS_PER_MESSAGE = 4
+
+# Actions after which a game that has not reached the turn limit is stuck
+MAX_ACTIONS_PER_GAME = 20 * GameTurn.MAX_NUMBER_OF_TURNS
+
+
+class Command(BaseCommand):
+    help = (
+        "Plays whole games between pairs of new users in process: character "
+        "creation, then every turn up to the turn limit through the "
+        "consumer's action handlers, then the end of the session. Reports the "
+        "latency percentiles and the queries and writes of each transition. "
+        "The users and games are deleted afterwards unless --keep is given. "
+        "Characters must have been ingested, see generate_content."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--games", type=int, default=10)
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Seed of the players' choices"
+        )
+        parser.add_argument(
+            "--keep", action="store_true", help="Keep the users and games created"
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        # Transition -> [(seconds, queries, writes), ...]
+        self.samples = defaultdict(list)
+        self.characters = self.load_characters()
+        self.question_ids = list(Question.objects.values_list("id", flat=True))
+        if not self.question_ids:
+            raise CommandError("There are no questions, ingest some content first.")
+
+        run = uuid.uuid4().hex[:8]
+        game_ids, user_ids = [], []
+        start = time.perf_counter()
+        try:
+            for i in range(options["games"]):
+                users = [
+                    User.objects.create_user(username=f"simulated_{run}_{i}_{slot}")
+                    for slot in ("a", "b")
+                ]
+                user_ids += [user.pk for user in users]
+                game_ids.append(self.play_game(users))
+        finally:
+            if not options["keep"]:
+                self.clean_up(game_ids, user_ids)
+        elapsed = time.perf_counter() - start
+
+        self.report()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Played {len(game_ids)} games in {elapsed:.1f} s "
+                f"({len(game_ids) / elapsed:.2f} games/s)"
+            )
+        )
+
+    def load_characters(self):
+        """Return (character, {choice field: [id, ...]}) for every character."""
+        fields = [
+            f"{kind}_{n}_choices"
+            for kind, count in (("quality", 3), ("interest", 3), ("activity", 2))
+            for n in range(1, count + 1)
+        ]
+        characters = [
+            (
+                character,
+                {
+                    field: [row.pk for row in getattr(character, field).all()]
+                    for field in fields
+                },
+            )
+            for character in Character.objects.prefetch_related(*fields)
+        ]
+        if not characters:
+            raise CommandError(
+                "There are no characters, run generate_content --load first."
+            )
+        return characters
+
+    def measure(self, transition, action, *args):
+        """Run `action`, record its time, queries and writes, return its result."""
+        # The query log is capped, see CaptureQueriesContext
+        reset_queries()
+        # The consumer prints the narrative choices
+        with redirect_stdout(io.StringIO()), CaptureQueriesContext(
+            connection
+        ) as queries:
+            start = time.perf_counter()
+            try:
+                return action(*args)
+            finally:
+                seconds = time.perf_counter() - start
+                # Savepoints are not counted
+                statements = [
+                    query["sql"]
+                    for query in queries.captured_queries
+                    if not query["sql"].startswith(("SAVEPOINT", "RELEASE SAVEPOINT"))
+                ]
+                writes = [
+                    sql
+                    for sql in statements
+                    if sql.startswith(("INSERT", "UPDATE", "DELETE"))
+                ]
+                self.samples[transition].append((seconds, len(statements), len(writes)))
+
+    def play_game(self, users):
+        game_session = self.measure("initialize_game", self.initialize_game, users)
+        for user in users:
+            self.create_character(game_session, user)
+
+        consumer = GameConsumer()
+        consumer.game_id = str(game_session.game_id)
+        users_by_player = {user.player.pk: user for user in users}
+        for _ in range(MAX_ACTIONS_PER_GAME):
+            game_turn = consumer.get_current_game_turn()
+            game = game_turn.parent_game
+            # The turn limit only marks the session inactive, the players
+            # end it with the End Game Session button
+            if not game.is_active or game.state != GameSession.REGULAR_TURN:
+                break
+            self.play(consumer, game_turn, users_by_player)
+        else:
+            raise CommandError(f"Game {consumer.game_id} did not end.")
+
+        self.measure("end_session", self.end_session, game_session.pk)
+        return game_session.pk
+
+    def initialize_game(self, users, game_id=None):
+        # As initiate_game_session does
+        game_session = GameSession(game_id=game_id) if game_id else GameSession()
+        game_session.save()
+        players = [
+            Player.objects.create(user=user, game_session=game_session)
+            for user in users
+        ]
+        game_session.playerA, game_session.playerB = players
+        game_session.save()
+        game_session.initialize_game()
+        game_session.save()
+        return game_session
+
+    def create_character(self, game_session, user):
+        # The steps of CharacterCreationView
+        player = user.player
+        character, choices = self.rng.choice(self.characters)
+        self.measure(
+            "select_character_avatar", player.select_character_avatar, character
+        )
+        self.measure("select_moon_meaning", self.select_moon_meaning, player)
+
+        def pick(kind, count):
+            return [
+                self.rng.choice(choices[f"{kind}_{n}_choices"] or [None])
+                for n in range(1, count + 1)
+            ]
+
+        self.measure(
+            "create_public_profile",
+            self.create_public_profile,
+            player,
+            pick("quality", 3),
+            pick("interest", 3),
+            pick("activity", 2),
+        )
+        game_session.refresh_from_db()
+        players = [game_session.playerA, game_session.playerB]
+        if all(
+            p.character_creation_state == Player.CHARACTER_COMPLETE for p in players
+        ):
+            self.measure("start_regular_turn", self.start_regular_turn, game_session)
+        else:
+            other_player = players[1] if players[0].pk == player.pk else players[0]
+            game_session.current_game_turn.set_active_player(other_player)
+
+    def select_moon_meaning(self, player):
+        attitudes = ReactionSummary.ATTITUDES
+        moon_meaning = MoonSignInterpretation.objects.create(
+            on_player=player,
+            **{
+                phase: self.rng.choice(attitudes)
+                for phase in ReactionSummary.EMOJI_PHASES.values()
+            },
+        )
+        player.select_moon_meaning(moon_meaning=moon_meaning)
+        player.save()
+
+    def create_public_profile(self, player, qualities, interests, activities):
+        player.create_public_profile(
+            qualities=qualities, interests=interests, activities=activities
+        )
+        player.save()
+
+    def start_regular_turn(self, game_session):
+        game_session.start_regular_turn()
+        game_session.save()
+
+    def play(self, consumer, game_turn, users_by_player):
+        """Play the next action of the state of `game_turn`."""
+        active_user = users_by_player[game_turn.active_player_id]
+        other_user = next(
+            user for user in users_by_player.values() if user != active_user
+        )
+        state = game_turn.state
+        if state == GameTurn.SELECT_QUESTION:
+            self.measure(state, self.select_question, consumer, active_user)
+        elif state == GameTurn.ANSWER_QUESTION:
+            message = self.message(active_user)
+            self.measure(
+                state,
+                self.act,
+                consumer,
+                consumer.answer_question_sync,
+                active_user,
+                message,
+            )
+        elif state == GameTurn.REACT_EMOJI:
+            emoji = self.rng.choice(list(ReactionSummary.EMOJI_PHASES))
+            self.measure(
+                state,
+                self.act,
+                consumer,
+                consumer.react_with_emoji_sync,
+                active_user,
+                emoji,
+            )
+        elif state == GameTurn.NARRATIVE_CHOICES:
+            for user in (active_user, other_user):
+                narrative = self.narrative_choice(user, game_turn.narrative_nights)
+                self.measure(
+                    state,
+                    self.act,
+                    consumer,
+                    consumer.make_narrative_choice_sync,
+                    user,
+                    narrative,
+                )
+        elif state == GameTurn.MOON_PHASE:
+            for user in (active_user, other_user):
+                message = self.message(user)
+                try:
+                    self.measure(
+                        state,
+                        self.act,
+                        consumer,
+                        consumer.write_message_about_moon_phase_sync,
+                        user,
+                        message,
+                    )
+                except ValueError:
+                    # The first message reports that the partner has not
+                    # written theirs yet, as it does in the consumer
+                    pass
+
+    def act(self, consumer, handler, user, value):
+        # The consumer looks the player up before every action
+        player = consumer.get_player_sync(user)
+        consumer.run_action_sync(handler, value, player)
+
+    def select_question(self, consumer, user):
+        player = consumer.get_player_sync(user)
+        question_ids = player.pool("question").ids() or self.question_ids
+        question = Question.objects.get(id=self.rng.choice(question_ids))
+        player.pool("question").remove(question)
+        consumer.run_action_sync(consumer.select_question_sync, question.pk, player)
+
+    def narrative_choice(self, user, night):
+        """
+        Return the id of a narrative choice of `night` for the player of
+        `user`, as NarrativeChoiceForm offers them. Past the last night of
+        the content, the choices of the last night are offered again; a
+        player without any choice picks one of the catalog.
+        """
+        player = Player.objects.get(user=user)
+        choices = player.pool("narrative_choice").filter(night_number__lte=night)
+        if not choices.exists():
+            choices = NarrativeChoice.objects.filter(night_number__lte=night)
+        last_night = choices.aggregate(Max("night_number"))["night_number__max"]
+        if last_night is None:
+            raise CommandError(
+                f"There are no narrative choices up to night {night}, "
+                "ingest some content first."
+            )
+        ids = list(
+            choices.filter(night_number=last_night)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        return str(self.rng.choice(ids))
+
+    def message(self, user):
+        """Return a message made of words from the pools of the player of `user`."""
+        player = Player.objects.get(user=user)
+        ids = player.pool("simple_word").ids() + player.pool("character_word").ids()
+        ids = self.rng.sample(ids, min(len(ids), WORDS_PER_MESSAGE))
+        words = list(Word.objects.filter(id__in=ids).values_list("word", flat=True))
+        return " ".join(words) or "..."
+
+    def end_session(self, game_session_id):
+        game_session = GameSession.objects.get(pk=game_session_id)
+        game_session.end_session()
+        game_session.save()
+
+    def clean_up(self, game_ids, user_ids):
+        turn_ids = list(
+            GameSession.objects.filter(pk__in=game_ids).values_list(
+                "current_game_turn_id", flat=True
+            )
+        )
+        GameSession.objects.filter(pk__in=game_ids).delete()
+        GameTurn.objects.filter(pk__in=turn_ids).delete()
+        User.objects.filter(pk__in=user_ids).delete()
+
+    def report(self):
+        self.stdout.write(
+            f"{'transition':<26}{'count':>7}{'p50 ms':>9}{'p90 ms':>9}"
+            f"{'p99 ms':>9}{'max ms':>9}{'queries':>9}{'writes':>8}"
+        )
+        for transition, samples in self.samples.items():
+            seconds, queries, writes = np.array(samples).T
+            p50, p90, p99 = np.percentile(seconds * 1000, [50, 90, 99])
+            self.stdout.write(
+                f"{transition:<26}{len(samples):>7}{p50:>9.2f}{p90:>9.2f}"
+                f"{p99:>9.2f}{seconds.max() * 1000:>9.2f}"
+                f"{queries.mean():>9.1f}{writes.mean():>8.1f}"
+            )
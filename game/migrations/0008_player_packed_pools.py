@@ -0,0 +1,104 @@
+# Generated by Django 4.2 on 2026-10-18 14:16
+
+from django.db import migrations, models
+import game.pools
+
+POOLS = {
+    "character_word": "word",
+    "simple_word": "word",
+    "question": "question",
+    "narrative_choice": "narrativechoice",
+}
+
+
+def move_pools_to_packed_storage(apps, schema_editor):
+    # Existing players keep the relational pools unless the deployment
+    # switched to packed storage, in which case their rows are moved over,
+    # so that old and new players use the same storage.
+    if game.pools.default_pool_storage() != game.pools.PACKED:
+        return
+    Player = apps.get_model("game", "Player")
+    for pool, target in POOLS.items():
+        through = getattr(Player, f"{pool}_pool").through
+        ids_by_player = {}
+        for player_id, target_id in through.objects.order_by("id").values_list(
+            "player_id", f"{target}_id"
+        ):
+            ids_by_player.setdefault(player_id, []).append(target_id)
+        players = list(Player.objects.filter(pool_storage=game.pools.RELATIONAL))
+        for player in players:
+            setattr(player, f"{pool}_ids", ids_by_player.get(player.id, []))
+        Player.objects.bulk_update(players, [f"{pool}_ids"], batch_size=500)
+        through.objects.all().delete()
+    Player.objects.update(pool_storage=game.pools.PACKED)
+
+
+def move_pools_to_relational_storage(apps, schema_editor):
+    Player = apps.get_model("game", "Player")
+    players = list(Player.objects.filter(pool_storage=game.pools.PACKED))
+    for pool, target in POOLS.items():
+        through = getattr(Player, f"{pool}_pool").through
+        through.objects.bulk_create(
+            [
+                through(player_id=player.id, **{f"{target}_id": target_id})
+                for player in players
+                for target_id in getattr(player, f"{pool}_ids")
+            ],
+            batch_size=500,
+            ignore_conflicts=True,
+        )
+    Player.objects.filter(pool_storage=game.pools.PACKED).update(
+        pool_storage=game.pools.RELATIONAL
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("game", "0007_moon_phase_dates_moon_phase_turn_sequence_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="player",
+            name="character_word_ids",
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name="player",
+            name="narrative_choice_ids",
+            field=models.JSONField(blank=True, default=list),
+        ),
+        # Existing rows start out relational, the data migration below
+        # decides whether they move.
+        migrations.AddField(
+            model_name="player",
+            name="pool_storage",
+            field=models.CharField(
+                choices=[("relational", "Relational"), ("packed", "Packed")],
+                default="relational",
+                max_length=20,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="player",
+            name="pool_storage",
+            field=models.CharField(
+                choices=[("relational", "Relational"), ("packed", "Packed")],
+                default=game.pools.default_pool_storage,
+                max_length=20,
+            ),
+        ),
+        migrations.AddField(
+            model_name="player",
+            name="question_ids",
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name="player",
+            name="simple_word_ids",
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.RunPython(
+            move_pools_to_packed_storage, move_pools_to_relational_storage
+        ),
+    ]
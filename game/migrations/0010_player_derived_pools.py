@@ -0,0 +1,46 @@
+# Generated by Django 4.2 on 2026-10-18 14:24
+
+from django.db import migrations, models
+import game.pools
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("game", "0009_catalog_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="player",
+            name="catalog_snapshot",
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="player",
+            name="consumed_ids",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name="player",
+            name="creation_choices",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name="player",
+            name="pool_seed",
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name="player",
+            name="pool_storage",
+            field=models.CharField(
+                choices=[
+                    ("relational", "Relational"),
+                    ("packed", "Packed"),
+                    ("derived", "Derived"),
+                ],
+                default=game.pools.default_pool_storage,
+                max_length=20,
+            ),
+        ),
+    ]
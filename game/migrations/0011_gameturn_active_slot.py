@@ -0,0 +1,45 @@
+# Generated by Django 4.2 on 2026-10-18 16:02
+
+from django.db import migrations, models
+
+
+def fill_active_slots(apps, schema_editor):
+    GameSession = apps.get_model("game", "GameSession")
+    GameTurn = apps.get_model("game", "GameTurn")
+    slots = {"A": [], "B": []}
+    for turn_id, active_player_id, player_a_id, player_b_id in (
+        GameSession.objects.exclude(current_game_turn=None)
+        .exclude(current_game_turn__active_player=None)
+        .values_list(
+            "current_game_turn_id",
+            "current_game_turn__active_player_id",
+            "playerA_id",
+            "playerB_id",
+        )
+    ):
+        if active_player_id == player_a_id:
+            slots["A"].append(turn_id)
+        elif active_player_id == player_b_id:
+            slots["B"].append(turn_id)
+    for slot, turn_ids in slots.items():
+        GameTurn.objects.filter(id__in=turn_ids).update(active_slot=slot)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("game", "0010_player_derived_pools"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="gameturn",
+            name="active_slot",
+            field=models.CharField(
+                blank=True,
+                choices=[("A", "Player A"), ("B", "Player B")],
+                default="",
+                max_length=1,
+            ),
+        ),
+        migrations.RunPython(fill_active_slots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2 on 2026-10-18 14:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("game", "0011_gameturn_active_slot"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="gamesession",
+            name="version",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="gameturn",
+            name="version",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 4.2 on 2026-10-18 15:10
+
+import uuid
+
+from django.db import migrations, models
+
+
+def copy_game_ids_to_uuids(apps, schema_editor):
+    GameSession = apps.get_model("game", "GameSession")
+    sessions = list(GameSession.objects.only("id", "game_id"))
+    for session in sessions:
+        try:
+            session.game_uuid = uuid.UUID(session.game_id)
+        except (TypeError, ValueError):
+            # Not a UUID, such sessions cannot be reached by URL anyway
+            session.game_uuid = uuid.uuid4()
+    GameSession.objects.bulk_update(sessions, ["game_uuid"], batch_size=500)
+
+
+def copy_uuids_to_game_ids(apps, schema_editor):
+    GameSession = apps.get_model("game", "GameSession")
+    sessions = list(GameSession.objects.only("id", "game_uuid"))
+    for session in sessions:
+        session.game_id = str(session.game_uuid)
+    GameSession.objects.bulk_update(sessions, ["game_id"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+    """
+    Store game_id as a native UUID. The values are copied through a new
+    column rather than converted in place, because backends without a UUID
+    type store it as 32 hex digits and an in-place copy would keep the
+    dashes.
+    """
+
+    dependencies = [
+        ("game", "0012_versioned_game_state"),
+    ]
+
+    operations = [
+        # Nullable for the way back, when the old column is added again
+        migrations.AlterField(
+            model_name="gamesession",
+            name="game_id",
+            field=models.CharField(max_length=255, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name="gamesession",
+            name="game_uuid",
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.RunPython(copy_game_ids_to_uuids, copy_uuids_to_game_ids),
+        migrations.RemoveField(
+            model_name="gamesession",
+            name="game_id",
+        ),
+        migrations.RenameField(
+            model_name="gamesession",
+            old_name="game_uuid",
+            new_name="game_id",
+        ),
+        migrations.AlterField(
+            model_name="gamesession",
+            name="game_id",
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+    ]
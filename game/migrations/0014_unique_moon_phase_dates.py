@@ -0,0 +1,30 @@
+# Generated by Django 4.2 on 2026-10-18 14:48
+
+from django.db import migrations
+from django.db.models import Min
+
+
+def delete_duplicate_moon_phase_dates(apps, schema_editor):
+    moon_phase_dates = apps.get_model("game", "moon_phase_dates")
+    keep = (
+        moon_phase_dates.objects.values("moon_phase", "date")
+        .annotate(keep_id=Min("id"))
+        .values_list("keep_id", flat=True)
+    )
+    moon_phase_dates.objects.exclude(id__in=list(keep)).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("game", "0013_gamesession_uuid_game_id"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            delete_duplicate_moon_phase_dates, migrations.RunPython.noop
+        ),
+        migrations.AlterUniqueTogether(
+            name="moon_phase_dates",
+            unique_together={("moon_phase", "date")},
+        ),
+    ]
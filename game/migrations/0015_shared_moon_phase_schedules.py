@@ -0,0 +1,60 @@
+# Generated by Django 4.2 on 2026-10-18 14:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+PHASE_FIELDS = [
+    ("new_moon_turn_number", "N"),
+    ("first_quarter_turn_number", "Q"),
+    ("full_moon_turn_number", "F"),
+    ("last_quarter_turn_number", "L"),
+]
+MAX_NUMBER_OF_TURNS = 30
+
+
+def fill_turn_phases(apps, schema_editor):
+    # The schedules of existing games stay their own, without a start_date
+    moon_phase_turn_sequence = apps.get_model("game", "moon_phase_turn_sequence")
+    sequences = list(moon_phase_turn_sequence.objects.all())
+    for sequence in sequences:
+        turn_numbers = [
+            (getattr(sequence, field), code)
+            for field, code in PHASE_FIELDS
+            if getattr(sequence, field) is not None and getattr(sequence, field) >= 1
+        ]
+        length = max([MAX_NUMBER_OF_TURNS, *(turn for turn, _ in turn_numbers)])
+        turn_phases = ["."] * length
+        for turn_number, code in reversed(turn_numbers):
+            turn_phases[turn_number - 1] = code
+        sequence.turn_phases = "".join(turn_phases)
+    moon_phase_turn_sequence.objects.bulk_update(sequences, ["turn_phases"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("game", "0014_unique_moon_phase_dates"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="moon_phase_turn_sequence",
+            name="start_date",
+            field=models.DateField(blank=True, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name="moon_phase_turn_sequence",
+            name="turn_phases",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+        migrations.AlterField(
+            model_name="gameturn",
+            name="moon_phase_turn_sequence",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to="game.moon_phase_turn_sequence",
+            ),
+        ),
+        migrations.RunPython(fill_turn_phases, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 4.2 on 2026-10-18 14:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def key_chat_messages_by_game(apps, schema_editor):
+    GameLog = apps.get_model("game", "GameLog")
+    GameSession = apps.get_model("game", "GameSession")
+    ChatMessage = apps.get_model("game", "ChatMessage")
+    game_by_log = dict(
+        GameSession.objects.filter(gameLog__isnull=False).values_list(
+            "gameLog_id", "id"
+        )
+    )
+    log_rows = GameLog.chat_messages.through.objects.order_by("chatmessage_id")
+    game_by_message = {}
+    for gamelog_id, message_id in log_rows.values_list("gamelog_id", "chatmessage_id"):
+        if gamelog_id in game_by_log:
+            game_by_message.setdefault(message_id, game_by_log[gamelog_id])
+
+    # Numbered in the order the messages were written
+    messages = list(ChatMessage.objects.filter(id__in=game_by_message).order_by("id"))
+    last_seq = {}
+    for message in messages:
+        message.game_id = game_by_message[message.id]
+        message.seq = last_seq.get(message.game_id, 0) + 1
+        last_seq[message.game_id] = message.seq
+    ChatMessage.objects.bulk_update(messages, ["game", "seq"], batch_size=1000)
+
+
+def log_chat_messages(apps, schema_editor):
+    GameLog = apps.get_model("game", "GameLog")
+    GameSession = apps.get_model("game", "GameSession")
+    ChatMessage = apps.get_model("game", "ChatMessage")
+    # Every game had its log
+    games = list(GameSession.objects.filter(gameLog__isnull=True))
+    for game in games:
+        game.gameLog = GameLog.objects.create()
+    GameSession.objects.bulk_update(games, ["gameLog"], batch_size=1000)
+    through = GameLog.chat_messages.through
+    through.objects.bulk_create(
+        [
+            through(gamelog_id=gamelog_id, chatmessage_id=message_id)
+            for message_id, gamelog_id in ChatMessage.objects.filter(
+                game__gameLog__isnull=False
+            )
+            .order_by("game", "seq")
+            .values_list("id", "game__gameLog_id")
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("game", "0015_shared_moon_phase_schedules"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chatmessage",
+            name="game",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="chat_messages",
+                to="game.gamesession",
+            ),
+        ),
+        migrations.AddField(
+            model_name="chatmessage",
+            name="seq",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(key_chat_messages_by_game, log_chat_messages),
+        migrations.AddConstraint(
+            model_name="chatmessage",
+            constraint=models.UniqueConstraint(
+                fields=("game", "seq"), name="unique_chat_message_seq"
+            ),
+        ),
+        migrations.RemoveField(
+            model_name="gamelog",
+            name="chat_messages",
+        ),
+        migrations.RemoveField(
+            model_name="gamesession",
+            name="gameLog",
+        ),
+        migrations.DeleteModel(
+            name="GameLog",
+        ),
+    ]
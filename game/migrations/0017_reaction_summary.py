@@ -0,0 +1,47 @@
+# Generated by Django 4.2 on 2026-10-18 15:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("game", "0016_game_keyed_chat_messages"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReactionSummary",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("sender", models.CharField(max_length=255)),
+                ("reactions", models.JSONField(blank=True, default=list)),
+                ("new_moon_count", models.PositiveIntegerField(default=0)),
+                ("first_quarter_count", models.PositiveIntegerField(default=0)),
+                ("full_moon_count", models.PositiveIntegerField(default=0)),
+                ("last_quarter_count", models.PositiveIntegerField(default=0)),
+                (
+                    "game",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="reaction_summaries",
+                        to="game.gamesession",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="reactionsummary",
+            constraint=models.UniqueConstraint(
+                fields=("game", "sender"), name="unique_reaction_summary_sender"
+            ),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-18 15:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("game", "0017_reaction_summary"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="gamesession",
+            name="summary",
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -1,13 +1,17 @@
 import random
-from collections import Counter
+import secrets
+from collections import Counter, defaultdict, deque
 
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Value
 from django.contrib.auth.models import User
 import uuid
 from django.urls import reverse
 from django.utils.datetime_safe import datetime
 from django_fsm import FSMField, transition
+from game import catalog, moon_phases, pools, unit_of_work
+from game.concurrency import VersionedModel
 from django.shortcuts import render, get_object_or_404
 
 
@@ -17,10 +21,11 @@ class Player(models.Model):
     )  # if the user is deleted, the 'Player' is deleted.
 
     character_name = models.CharField(max_length=255, blank=True)
-    character_word_pool = models.ManyToManyField("Word", blank=True, related_name="wp")
-    simple_word_pool = models.ManyToManyField("Word", blank=True, related_name="swp")
-    question_pool = models.ManyToManyField("Question", blank=True)
-    narrative_choice_pool = models.ManyToManyField("NarrativeChoice", blank=True)
+    # The pools of relational storage, see pools.py and Player.pool
+    character_word_pool = pools.PoolField("Word", blank=True, related_name="wp")
+    simple_word_pool = pools.PoolField("Word", blank=True, related_name="swp")
+    question_pool = pools.PoolField("Question", blank=True)
+    narrative_choice_pool = pools.PoolField("NarrativeChoice", blank=True)
 
     game_session = models.ForeignKey(
         "GameSession", related_name="game_players", on_delete=models.CASCADE
@@ -50,6 +55,24 @@ class Player(models.Model):
         default=CHARACTER_AVATAR_SELECTION, choices=CHARACTER_CREATION_STATE_CHOICES
     )
 
+    # Where the word, question and narrative choice pools are stored, see
+    # game/pools.py. Packed pools keep the ids in the arrays below, derived
+    # pools are computed from the seed and creation choices.
+    pool_storage = models.CharField(
+        max_length=20,
+        choices=pools.STORAGE_CHOICES,
+        default=pools.default_pool_storage,
+    )
+    character_word_ids = models.JSONField(default=list, blank=True)
+    simple_word_ids = models.JSONField(default=list, blank=True)
+    question_ids = models.JSONField(default=list, blank=True)
+    narrative_choice_ids = models.JSONField(default=list, blank=True)
+    pool_seed = models.BigIntegerField(null=True, blank=True)
+    creation_choices = models.JSONField(default=dict, blank=True)
+    consumed_ids = models.JSONField(default=dict, blank=True)
+    # Catalog the derived pools are drawn from, see catalog.snapshot
+    catalog_snapshot = models.JSONField(null=True, blank=True)
+
     @transition(
         field=character_creation_state,
         source=CHARACTER_AVATAR_SELECTION,
@@ -79,7 +102,7 @@ class Player(models.Model):
         self.save()
 
     def save(self, *args, **kwargs):
-        if not self.game_session:
+        if not self.game_session_id:
             raise ValidationError(
                 "A player must be associated with a GameSession before saving."
             )
@@ -96,100 +119,182 @@ class Player(models.Model):
         super(Player, self).delete(*args, **kwargs)
 
     def populate_character_with_creation_choices(
-        self, qualities, interests, activities
+        self, qualities, interests, activities, seed=None
     ):
-        # Adding 60 random general questions to the question pool
-        general_questions = list(Question.objects.filter(is_general=True))
-        random_general_questions = random.sample(
-            general_questions, min(len(general_questions), 60)
-        )
-        for question in random_general_questions:
-            self.question_pool.add(question)
-
-            # Populating questions from activities
-        for activity_id in activities:
-            if activity_id is not None:
-                activity = Activity.objects.get(id=activity_id)
-                questions = list(activity.questions.all())
-                random_questions = random.sample(questions, min(len(questions), 6))
-                for question in random_questions:
-                    self.question_pool.add(question)
-
-        for quality_id in qualities:
-            if quality_id is not None:
-                quality = Quality.objects.get(id=quality_id)
-                words = list(quality.words.all())
-                random_words = random.sample(words, min(len(words), 15))
-                for word in random_words:
-                    self.character_word_pool.add(word)
-
-        for interest_id in interests:
-            if interest_id is not None:
-                interest = Interest.objects.get(id=interest_id)
-                for narrative_choice in interest.narrative_choices.all():
-                    self.narrative_choice_pool.add(narrative_choice)
-
-        self.replenish_simple_words()
-
-    def replenish_simple_words(self):
-        # Count the current kind_of_words in the pool
-        current_counts = Counter(
-            word.kind_of_word for word in self.simple_word_pool.all()
+        """
+        Fill the question, word and narrative choice pools from the choices
+        made during public profile creation.
+
+        Questions and words are sampled from the cached catalog id arrays (a
+        seed makes the draw reproducible), narrative choices are read with a
+        single query, and the pools are written together in one unit of work
+        (one bulk insert per pool, or one update of the player row).
+        """
+        activity_ids = [int(pk) for pk in activities if pk is not None]
+        quality_ids = [int(pk) for pk in qualities if pk is not None]
+        interest_ids = [int(pk) for pk in interests if pk is not None]
+
+        narrative_choice_ids = list(
+            NarrativeChoice.objects.filter(interest_id__in=interest_ids)
+            .order_by("interest_id", "id")
+            .values_list("id", flat=True)
         )
-        target_counts = {
-            "verb": 5,
-            "pronoun": 3,
-            "preposition": 5,
-            "conjunction": 5,
-            "article": 3,
-            "determiner": 5,
-            "modifier": 4,
-        }  # Adjust numbers as needed
-
-        simple_words = list(Word.objects.filter(isSimple=True).all())
-        for kind, target_count in target_counts.items():
-            current_count = current_counts[kind]
-            words_to_add_count = target_count - current_count
-
-            # Filter words of this kind
-            words_of_this_kind = [
-                word for word in simple_words if word.kind_of_word == kind
-            ]
-            if words_to_add_count > 0 and len(words_of_this_kind) >= words_to_add_count:
-                filtered_words = [
-                    word
-                    for word in words_of_this_kind
-                    if word not in self.simple_word_pool.all()
-                ]
-
-                # Randomly select words to add
-                words_to_add = random.sample(
-                    filtered_words, k=min(len(words_of_this_kind), words_to_add_count)
+        additions = {"narrative_choice": narrative_choice_ids}
+        if self.pool_storage != pools.DERIVED:
+            additions.update(pools.derive_pools(seed, quality_ids, activity_ids))
+
+        with unit_of_work.action():
+            pools.add_to_pools(self, additions)
+            self.replenish_simple_words()
+            if self.pool_storage == pools.DERIVED:
+                # Only the seed and the choices are stored, the question and
+                # character word pools are derived from them when needed
+                self.pool_seed = seed if seed is not None else secrets.randbits(62)
+                self.creation_choices = {
+                    "qualities": quality_ids,
+                    "activities": activity_ids,
+                }
+                self.consumed_ids = {}
+                # Content ingested later must not change the derived pools
+                self.catalog_snapshot = catalog.snapshot()
+                unit_of_work.save(
+                    self,
+                    "pool_seed",
+                    "creation_choices",
+                    "consumed_ids",
+                    "catalog_snapshot",
                 )
 
-                for word in words_to_add:
-                    self.simple_word_pool.add(word)
-
-        self.save()
-        current_counts = Counter(
-            word.kind_of_word for word in self.simple_word_pool.all()
+    def pool(self, name):
+        """
+        Return the player's pool called `name` ("character_word",
+        "simple_word", "question" or "narrative_choice") for the player's
+        storage mode.
+        """
+        return pools.get_pool(self, name)
+
+    def consume_words(self, text):
+        """
+        Remove the words used in `text` from the player's word pools.
+
+        Every token consumes one pool entry: simple words are used first, then
+        character words, so a word typed twice uses up two entries with that
+        spelling. All tokens are resolved with a single query and the used
+        entries are removed in one write per pool.
+
+        Returns the tokens that did not match any remaining pool entry.
+        """
+        tokens = text.split()
+        if not tokens:
+            return []
+
+        # Available entries per spelling, simple pool first
+        available = defaultdict(deque)
+        for pool, entry, word in self._word_pool_entries(set(tokens)):
+            available[word].append((pool, entry))
+
+        consumed = ([], [])
+        not_found = []
+        for token in tokens:
+            if available[token]:
+                pool, entry = available[token].popleft()
+                consumed[pool].append(entry)
+            else:
+                not_found.append(token)
+
+        if self.pool_storage != pools.RELATIONAL:
+            # Entries are word ids, the player row is written once
+            pools.remove_from_pools(
+                self, {"simple_word": consumed[0], "character_word": consumed[1]}
+            )
+        else:
+            # Entries are through-table row ids
+            if consumed[0]:
+                Player.simple_word_pool.through.objects.filter(
+                    id__in=consumed[0]
+                ).delete()
+            if consumed[1]:
+                Player.character_word_pool.through.objects.filter(
+                    id__in=consumed[1]
+                ).delete()
+        return not_found
+
+    def _word_pool_entries(self, words):
+        """
+        Yield (pool, entry, word) for every word pool entry spelled as one of
+        `words`, simple pool (0) before character pool (1).
+        """
+        if self.pool_storage != pools.RELATIONAL:
+            simple_ids = self.pool("simple_word").ids()
+            character_ids = self.pool("character_word").ids()
+            spelling = dict(
+                Word.objects.filter(
+                    pk__in=simple_ids + character_ids, word__in=words
+                ).values_list("id", "word")
+            )
+            for pool, ids in enumerate((simple_ids, character_ids)):
+                for pk in ids:
+                    if pk in spelling:
+                        yield pool, pk, spelling[pk]
+            return
+
+        simple_entries = (
+            Player.simple_word_pool.through.objects.filter(
+                player=self, word__word__in=words
+            )
+            .annotate(pool=Value(0))
+            .values_list("id", "word__word", "pool")
         )
-        print(current_counts.get("verb"))
-
+        character_entries = (
+            Player.character_word_pool.through.objects.filter(
+                player=self, word__word__in=words
+            )
+            .annotate(pool=Value(1))
+            .values_list("id", "word__word", "pool")
+        )
+        for entry, word, pool in simple_entries.union(
+            character_entries, all=True
+        ).order_by("pool", "id"):
+            yield pool, entry, word
+
+    # Number of simple words of each kind a player should have available
+    SIMPLE_WORD_TARGETS = {
+        "verb": 5,
+        "pronoun": 3,
+        "preposition": 5,
+        "conjunction": 5,
+        "article": 3,
+        "determiner": 5,
+        "modifier": 4,
+    }  # Adjust numbers as needed
 
-# Auxiliary functions for game session
-def generate_game_id():
-    return str(uuid.uuid4())
+    def replenish_simple_words(self):
+        """
+        Top the simple word pool back up to SIMPLE_WORD_TARGETS, drawing
+        random words from the cached simple word catalog.
+        """
+        simple_word_pool = self.pool("simple_word")
+        index = catalog.simple_words()
+        in_pool = set(simple_word_pool.ids())
 
+        # Count the current kind_of_words in the pool
+        current_counts = Counter(index.kind_by_id.get(pk) for pk in in_pool)
+
+        words_to_add = []
+        for kind, target_count in self.SIMPLE_WORD_TARGETS.items():
+            words_to_add_count = target_count - current_counts[kind]
+            if words_to_add_count <= 0:
+                continue
+            candidates = [pk for pk in index.ids(kind) if pk not in in_pool]
+            words_to_add += random.sample(
+                candidates, k=min(len(candidates), words_to_add_count)
+            )
 
-def generate_unique_game_id():
-    game_id = generate_game_id()
-    while GameSession.objects.filter(game_id=game_id).exists():
-        game_id = generate_game_id()
-    return game_id
+        if words_to_add:
+            simple_word_pool.add(*words_to_add)
 
 
-class GameSession(models.Model):
+class GameSession(VersionedModel):
     # Constants for game session states
     INITIALIZING = "initializing"
     CHARACTER_CREATION = "character_creation"
@@ -207,10 +312,8 @@ class GameSession(models.Model):
     ]
 
     state = FSMField(default=INITIALIZING, choices=STATE_CHOICES)
-    game_id = models.CharField(
-        max_length=255,
-        unique=True,
-    )
+    # Collisions are left to the unique index, see save()
+    game_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
     playerA = models.ForeignKey(
         "Player",
         on_delete=models.SET_NULL,
@@ -226,6 +329,8 @@ class GameSession(models.Model):
         blank=True,
     )
     is_active = models.BooleanField(default=True)
+    # Written once by end_session, the players are deleted then
+    summary = models.JSONField(null=True, blank=True, editable=False)
 
     current_game_turn = models.OneToOneField(
         "GameTurn",
@@ -237,31 +342,18 @@ class GameSession(models.Model):
 
     asked_questions = models.ManyToManyField("Question", blank=True)
 
-    gameLog = models.OneToOneField(
-        "GameLog",
-        on_delete=models.SET_NULL,
-        null=True,
-        blank=True,
-        related_name="parent_game",
-    )
-
-    def __init__(self, *args, **kwargs):
-        super(GameSession, self).__init__(*args, **kwargs)
-        if not self.game_id:
-            self.game_id = generate_unique_game_id()
-
     @transition(field=state, source=INITIALIZING, target=CHARACTER_CREATION)
     def initialize_game(self):
         # Check if both players are set
         if not self.playerA or not self.playerB:
             raise ValueError("Both players must be set before initializing the game.")
-        self.gameLog = GameLog.objects.create()
-        self.save()
         self.current_game_turn = GameTurn.objects.create()
         self.current_game_turn.active_player = self.playerA
-        self.current_game_turn.moon_phase_turn_sequence = moon_phase_turn_sequence()
-        self.current_game_turn.moon_phase_turn_sequence.populate_turn_numbers()
-        self.current_game_turn.moon_phase_turn_sequence.save()
+        self.current_game_turn.active_slot = GameTurn.PLAYER_A
+        # Games started on the same day share the same schedule
+        self.current_game_turn.moon_phase_turn_sequence = (
+            moon_phase_turn_sequence.for_date(datetime.now().date())
+        )
         self.current_game_turn.save()
         return True, "Game initialized successfully."
 
@@ -272,15 +364,66 @@ class GameSession(models.Model):
 
     @transition(field=state, source="*", target="ended")
     def end_session(self):
+        # The summary outlives the players, it is made once before they go
+        summary = self.summary if self.summary is not None else self.build_summary()
         self.playerA.delete()
         self.playerB.delete()
         self.current_game_turn.delete()
         self.refresh_from_db()
+        self.summary = summary
         # self.chat_messages.all().delete()
         # self.delete()
 
+    def build_summary(self):
+        """
+        Return the end of game summary of each player, keyed by user id: the
+        reactions to their messages, their count per attitude, and who their
+        partner is.
+        """
+        reaction_summaries = {
+            summary.sender: summary for summary in self.reaction_summaries.all()
+        }
+        players = {}
+        for player, partner in (
+            (self.playerA, self.playerB),
+            (self.playerB, self.playerA),
+        ):
+            if player is None:
+                continue
+            summary = reaction_summaries.get(player.character_name)
+            interpretation = player.MoonSignInterpretation
+            players[str(player.user_id)] = {
+                "sender": player.character_name,
+                "reactions": summary.reactions if summary else [],
+                "attitude_summary": (
+                    summary.attitude_summary(interpretation)
+                    if summary and interpretation
+                    else {}
+                ),
+                "partner": (
+                    {"username": partner.user.username, "email": partner.user.email}
+                    if partner
+                    else None
+                ),
+            }
+        return {"players": players}
+
+    # Inserts tried with a new game_id after a collision
+    GAME_ID_ATTEMPTS = 3
+
     def save(self, *args, **kwargs):
-        super(GameSession, self).save(*args, **kwargs)
+        if not self._state.adding:
+            return super(GameSession, self).save(*args, **kwargs)
+        for attempt in range(1, self.GAME_ID_ATTEMPTS + 1):
+            try:
+                with transaction.atomic():
+                    return super(GameSession, self).save(*args, **kwargs)
+            except IntegrityError:
+                if attempt == self.GAME_ID_ATTEMPTS or not (
+                    GameSession.objects.filter(game_id=self.game_id).exists()
+                ):
+                    raise
+                self.game_id = uuid.uuid4()
 
     def get_absolute_url(self):
         return reverse("game:game_progress", kwargs={"game_id": self.game_id})
@@ -308,7 +451,7 @@ class GameSession(models.Model):
         return render(request, "game_template.html", context)
 
 
-class GameTurn(models.Model):
+class GameTurn(VersionedModel):
     active_player = models.ForeignKey(
         "Player", on_delete=models.SET_NULL, null=True, blank=True
     )
@@ -323,8 +466,24 @@ class GameTurn(models.Model):
     player_a_moon_phase_message_written = models.BooleanField(default=False)
     player_b_moon_phase_message_written = models.BooleanField(default=False)
 
-    moon_phase_turn_sequence = models.OneToOneField(
-        "moon_phase_turn_sequence", on_delete=models.CASCADE, null=True, blank=True
+    moon_phase_turn_sequence = models.ForeignKey(
+        "moon_phase_turn_sequence", on_delete=models.SET_NULL, null=True, blank=True
+    )
+
+    MAX_NUMBER_OF_TURNS = 30
+
+    # Slots of the parent game's players
+    PLAYER_A = "A"
+    PLAYER_B = "B"
+    SLOT_CHOICES = [
+        (PLAYER_A, "Player A"),
+        (PLAYER_B, "Player B"),
+    ]
+
+    # Which of the parent game's players is active, kept next to
+    # active_player so that turn checks compare ids instead of loading players
+    active_slot = models.CharField(
+        max_length=1, choices=SLOT_CHOICES, blank=True, default=""
     )
 
     SELECT_QUESTION = "select_question"
@@ -349,19 +508,60 @@ class GameTurn(models.Model):
 
     def set_active_player(self, player):
         self.active_player = player
-        self.save()
+        self.active_slot = self.slot_of(player) or ""
+        unit_of_work.save(self, "active_player", "active_slot")
+
+    def slot_of(self, player):
+        """Return the slot of `player` in the parent game, or None."""
+        return self._slot_of_id(player.pk if player else None)
+
+    def _slot_of_id(self, player_id):
+        # Only the player ids stored on the session are compared, so neither
+        # player is loaded
+        game = getattr(self, "parent_game", None)
+        if game is None or player_id is None:
+            return None
+        if player_id == game.playerA_id:
+            return self.PLAYER_A
+        if player_id == game.playerB_id:
+            return self.PLAYER_B
+        return None
+
+    def get_active_slot(self):
+        # Turns saved before the slot existed fall back to the player id
+        return self.active_slot or self._slot_of_id(self.active_player_id)
+
+    def is_active_player(self, player):
+        return player.pk == self.active_player_id
 
     def switch_active_player(self):
-        if self.active_player == self.parent_game.playerA:
-            self.active_player = self.parent_game.playerB
+        game = self.parent_game
+        if self.get_active_slot() == self.PLAYER_A:
+            self.active_slot = self.PLAYER_B
+            self.active_player_id = game.playerB_id
         else:
-            self.active_player = self.parent_game.playerA
-        self.save()
+            self.active_slot = self.PLAYER_A
+            self.active_player_id = game.playerA_id
+        unit_of_work.save(self, "active_player", "active_slot")
+
+    def add_chat_message(self, player, text):
+        """Append `text` to the game's chat as a message from `player`."""
+        # Characters ingested from packs have no image
+        image = player.character.image
+        chat_message = ChatMessage(
+            game=self.parent_game,
+            seq=ChatMessage.next_seq(self.parent_game.pk),
+            avatar_url=str(image.url) if image else "",
+            sender=str(player.character_name),
+            text=str(text),
+        )
+        unit_of_work.insert(chat_message)
+        return chat_message
 
     @transition(field=state, source=SELECT_QUESTION, target=ANSWER_QUESTION)
     def select_question(self, selected_question_id, player):
         # Check if the current user is the active player
-        if player != self.active_player:
+        if not self.is_active_player(player):
             raise ValueError("It's not your turn.")
 
         # Get the selected question
@@ -370,37 +570,19 @@ class GameTurn(models.Model):
             raise ValueError("No question selected.")
 
         # Create a chat message and add it to the log
-        chat_message = ChatMessage.objects.create(
-            avatar_url=str(player.character.image.url),
-            sender=str(player.character_name),
-            text=str(selected_question.text),
-        )
-        self.parent_game.gameLog.chat_messages.add(chat_message)
+        self.add_chat_message(player, selected_question.text)
 
         self.switch_active_player()
 
     @transition(field=state, source=ANSWER_QUESTION, target=REACT_EMOJI)
     def answer_question(self, answer, player):
         # Check if the current user is the active player
-        if player != self.active_player:
+        if not self.is_active_player(player):
             raise ValueError("It's not your turn.")
 
         # Create a chat message and add it to the log
-        chat_message = ChatMessage.objects.create(
-            avatar_url=str(player.character.image.url),
-            sender=str(player.character_name),
-            text=str(answer),
-        )
-        for word in answer.split():
-            if player.simple_word_pool.filter(word=word):
-                word = player.simple_word_pool.filter(word=word).first()
-                player.simple_word_pool.remove(word)
-                player.save()
-            elif player.character_word_pool.filter(word=word):
-                word = player.character_word_pool.filter(word=word).first()
-                player.character_word_pool.remove(word)
-                player.save()
-        self.parent_game.gameLog.chat_messages.add(chat_message)
+        self.add_chat_message(player, answer)
+        player.consume_words(answer)
         self.switch_active_player()
 
     @transition(field=state, source=REACT_EMOJI, target=None)
@@ -410,22 +592,24 @@ class GameTurn(models.Model):
             raise ValueError("Please select an emoji to react with.")
 
         # Check if the current user is the active player
-        if player != self.active_player:
+        if not self.is_active_player(player):
             raise ValueError("It's not your turn.")
 
-        if player == self.parent_game.playerA:
+        slot = self.slot_of(player)
+        if slot == self.PLAYER_A:
             self.player_a_completed_cycle = True
-        elif player == self.parent_game.playerB:
+        elif slot == self.PLAYER_B:
             self.player_b_completed_cycle = True
         else:
             raise ValueError("Invalid player.")
 
         # Fetch the latest message for the current game session to add the reaction
-        latest_message = self.parent_game.gameLog.chat_messages.last()
+        latest_message = self.parent_game.chat_messages.order_by("-seq").first()
 
         if latest_message:
             latest_message.reaction = emoji
-            latest_message.save()
+            unit_of_work.save(latest_message, "reaction")
+            ReactionSummary.record(self.parent_game.pk, latest_message.sender, emoji)
 
         self.switch_active_player()
 
@@ -435,10 +619,11 @@ class GameTurn(models.Model):
             self.player_b_completed_cycle = False
             # Set the state to the determined next state
             self.state = self.NARRATIVE_CHOICES
-            self.save()
         else:
             self.state = self.SELECT_QUESTION
-            self.save()
+        unit_of_work.save(
+            self, "player_a_completed_cycle", "player_b_completed_cycle", "state"
+        )
 
     @transition(
         field=state,
@@ -447,14 +632,18 @@ class GameTurn(models.Model):
     )
     def make_narrative_choice(self, narrative_choice, player):
         # Update the narrative choice for the player
-        if player == self.parent_game.playerA:
+        slot = self.slot_of(player)
+        if slot == self.PLAYER_A:
             self.player_a_narrative_choice_made = True
             self.process_narrative_choice(narrative_choice, player)
-        elif player == self.parent_game.playerB:
+        elif slot == self.PLAYER_B:
             self.player_b_narrative_choice_made = True
             self.process_narrative_choice(narrative_choice, player)
         else:
             raise ValueError("Invalid player.")
+        unit_of_work.save(
+            self, "player_a_narrative_choice_made", "player_b_narrative_choice_made"
+        )
 
         # process the narrative choice here:
         # adding the associated words to the player's word pool
@@ -468,9 +657,7 @@ class GameTurn(models.Model):
         # Fetch the selected narrative choice and add to word pool
         selected_narrative_choice = NarrativeChoice.objects.get(id=narrative_choice)
         if selected_narrative_choice:
-            for word in selected_narrative_choice.words.all():
-                player.character_word_pool.add(word)
-                player.save()
+            player.pool("character_word").add(*selected_narrative_choice.words.all())
         player.replenish_simple_words()
 
     def reset_flags_and_transition(self):
@@ -481,8 +668,7 @@ class GameTurn(models.Model):
         # Increment turn number and check for game end
         self.turn_number += 1
         self.narrative_nights += 1
-        MAX_NUMBER_OF_TURNS = 30
-        if self.turn_number >= MAX_NUMBER_OF_TURNS:
+        if self.turn_number >= self.MAX_NUMBER_OF_TURNS:
             self.parent_game.set_game_inactive()
             self.parent_game.state = self.parent_game.ENDED
 
@@ -490,7 +676,14 @@ class GameTurn(models.Model):
         next_state = self.regular_or_special_moon_next()
         self.switch_active_player()
         self.state = next_state
-        self.save()
+        unit_of_work.save(
+            self,
+            "player_a_narrative_choice_made",
+            "player_b_narrative_choice_made",
+            "turn_number",
+            "narrative_nights",
+            "state",
+        )
 
     def regular_or_special_moon_next(self):
         if self.get_moon_phase():
@@ -501,22 +694,7 @@ class GameTurn(models.Model):
     def get_moon_phase(self):
         # Ensure that moon_phase_turn_sequence is not None
         if self.moon_phase_turn_sequence:
-            if self.turn_number == self.moon_phase_turn_sequence.new_moon_turn_number:
-                return "new_moon"
-            elif (
-                self.turn_number
-                == self.moon_phase_turn_sequence.first_quarter_turn_number
-            ):
-                return "first_quarter"
-            elif (
-                self.turn_number == self.moon_phase_turn_sequence.full_moon_turn_number
-            ):
-                return "full_moon"
-            elif (
-                self.turn_number
-                == self.moon_phase_turn_sequence.last_quarter_turn_number
-            ):
-                return "last_quarter"
+            return self.moon_phase_turn_sequence.phase_of_turn(self.turn_number)
 
         # Return None or a default value if no matching phase is found
         return None
@@ -537,43 +715,33 @@ class GameTurn(models.Model):
     )
     def write_message_about_moon_phase(self, message, player):
         # Update the moon message for the player
-        if player == self.parent_game.playerA:
+        slot = self.slot_of(player)
+        if slot == self.PLAYER_A:
             self.player_a_moon_phase_message_written = True
-        elif player == self.parent_game.playerB:
+        elif slot == self.PLAYER_B:
             self.player_b_moon_phase_message_written = True
         else:
             raise ValueError("Invalid player.")
-        self.save()
+        unit_of_work.save(
+            self,
+            "player_a_moon_phase_message_written",
+            "player_b_moon_phase_message_written",
+        )
         # Create a chat message and add it to the log
-        if player != self.active_player:
+        if not self.is_active_player(player):
             raise ValueError("It's not your turn.")
 
-        chat_message = ChatMessage.objects.create(
-            avatar_url=str(player.character.image.url),
-            sender=str(player.character_name),
-            text=str(message),
-        )
-        self.parent_game.gameLog.chat_messages.add(chat_message)
+        self.add_chat_message(player, message)
 
         # Change the current moon sign reason to the message
         moon_phase = self.get_moon_phase()
         moon_sign_interpretation = player.MoonSignInterpretation
         moon_sign_interpretation.change_moon_sign_reason(moon_phase, message)
-        moon_sign_interpretation.save()
 
         # Process the answer and update word pools
-        for word in message.split():
-            if player.simple_word_pool.filter(word=word).exists():
-                word_obj = player.simple_word_pool.filter(word=word).first()
-                player.simple_word_pool.remove(word_obj)
-            elif player.character_word_pool.filter(word=word).exists():
-                word_obj = player.character_word_pool.filter(word=word).first()
-                player.character_word_pool.remove(word_obj)
-
-        player.save()
+        player.consume_words(message)
 
         self.switch_active_player()
-        self.save()
         # Check if both players have written their messages
         if (
             self.player_a_moon_phase_message_written
@@ -584,20 +752,26 @@ class GameTurn(models.Model):
             self.player_b_moon_phase_message_written = False
             # Transition to the SELECT_QUESTION state and add 1 to the turn number
             self.turn_number += 1
+            unit_of_work.save(
+                self,
+                "player_a_moon_phase_message_written",
+                "player_b_moon_phase_message_written",
+                "turn_number",
+            )
         else:
             raise ValueError("Not both players have written their messages.")
 
 
-class GameLog(models.Model):
-    chat_messages = models.ManyToManyField(
-        "ChatMessage", blank=True, related_name="game_log"
-    )
-
-    def __int__(self):
-        return self.id
-
-
 class ChatMessage(models.Model):
+    game = models.ForeignKey(
+        "GameSession",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="chat_messages",
+    )
+    # Position of the message in the game's chat, from 1
+    seq = models.PositiveIntegerField(null=True, blank=True)
     avatar_url = models.CharField(max_length=255, null=True, blank=True)
     sender = models.CharField(max_length=255)  # The name of the sender (player)
     text = models.TextField()  # The main content of the message (question/answer)
@@ -608,9 +782,109 @@ class ChatMessage(models.Model):
         auto_now_add=True
     )  # To track when the message was sent
 
+    class Meta:
+        # Also the index of the latest message, range and count lookups
+        constraints = [
+            models.UniqueConstraint(
+                fields=["game", "seq"], name="unique_chat_message_seq"
+            )
+        ]
+
     def __str__(self):
         return self.text
 
+    @classmethod
+    def next_seq(cls, game_id):
+        """Return the seq of the next message of the game."""
+        queued = [
+            message.seq
+            for message in unit_of_work.pending(cls)
+            if message.game_id == game_id
+        ]
+        if queued:
+            return max(queued) + 1
+        last_seq = (
+            cls.objects.filter(game_id=game_id)
+            .order_by("-seq")
+            .values_list("seq", flat=True)
+            .first()
+        )
+        return (last_seq or 0) + 1
+
+
+class ReactionSummary(models.Model):
+    """
+    The reactions to the messages of one sender in a game, in the order they
+    were made, and their count per moon phase. GameTurn.react_with_emoji
+    keeps it up to date, so the end of game summary reads one row instead of
+    the whole chat.
+    """
+
+    EMOJI_PHASES = {
+        "🌑": "new_moon",
+        "🌓": "first_quarter",
+        "🌕": "full_moon",
+        "🌗": "last_quarter",
+    }
+    ATTITUDES = ("positive", "negative", "ambiguous")
+    COUNT_FIELDS = [f"{phase}_count" for phase in EMOJI_PHASES.values()]
+
+    game = models.ForeignKey(
+        "GameSession", on_delete=models.CASCADE, related_name="reaction_summaries"
+    )
+    sender = models.CharField(max_length=255)
+    # The reaction emojis in order, each a string as some are several
+    # code points long
+    reactions = models.JSONField(blank=True, default=list)
+    new_moon_count = models.PositiveIntegerField(default=0)
+    first_quarter_count = models.PositiveIntegerField(default=0)
+    full_moon_count = models.PositiveIntegerField(default=0)
+    last_quarter_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["game", "sender"], name="unique_reaction_summary_sender"
+            )
+        ]
+
+    @classmethod
+    def record(cls, game_id, sender, emoji):
+        """
+        Add a reaction with `emoji` to a message of `sender`.
+
+        The row is locked until the end of the action, which writes it. A
+        missing row is created at once, as only an existing row can be locked.
+        """
+        with transaction.atomic():
+            summaries = cls.objects.select_for_update()
+            summary = summaries.filter(game_id=game_id, sender=sender).first()
+            if summary is None:
+                # The first reactions of both players may both create the row
+                cls.objects.bulk_create(
+                    [cls(game_id=game_id, sender=sender)], ignore_conflicts=True
+                )
+                summary = summaries.get(game_id=game_id, sender=sender)
+            summary.add(emoji)
+            unit_of_work.save(summary, "reactions", *cls.COUNT_FIELDS)
+
+    def add(self, emoji):
+        self.reactions = [*self.reactions, emoji]
+        phase = self.EMOJI_PHASES.get(emoji)
+        if phase:
+            count = f"{phase}_count"
+            setattr(self, count, getattr(self, count) + 1)
+
+    def attitude_summary(self, moon_sign_interpretation):
+        """Return the count per attitude of the reactions for the sender."""
+        attitude_summary = {}
+        for phase in self.EMOJI_PHASES.values():
+            count = getattr(self, f"{phase}_count")
+            attitude = moon_sign_interpretation.get_moon_sign(phase)
+            if count and attitude in self.ATTITUDES:
+                attitude_summary[attitude] = attitude_summary.get(attitude, 0) + count
+        return attitude_summary
+
 
 class Character(models.Model):
     name = models.CharField(max_length=255)
@@ -708,6 +982,26 @@ class Word(models.Model):
         return f"<Word: {self.word}>"
 
 
+class CatalogVersion(models.Model):
+    """
+    Counter bumped whenever the content catalog (words, questions, qualities,
+    activities) changes, so that every process can tell that its indexes in
+    game/catalog.py are stale. There is one row.
+    """
+
+    version = models.PositiveBigIntegerField(default=0)
+
+    @classmethod
+    def current(cls):
+        return cls.objects.filter(pk=1).values_list("version", flat=True).first() or 0
+
+    @classmethod
+    def bump(cls):
+        if not cls.objects.filter(pk=1).update(version=F("version") + 1):
+            cls.objects.get_or_create(pk=1)
+            cls.objects.filter(pk=1).update(version=F("version") + 1)
+
+
 class MoonSignInterpretation(models.Model):
     # Assuming you have a Player model that is linked to the User model
     on_player = models.ForeignKey(
@@ -757,7 +1051,7 @@ class MoonSignInterpretation(models.Model):
 
         # Use setattr to update the attribute
         setattr(self, moon_phase, new_sign)
-        self.save()
+        unit_of_work.save(self)
 
     def change_moon_sign_reason(self, moon_phase, reason):
         # map moon_phase to moon phase reason
@@ -771,7 +1065,7 @@ class MoonSignInterpretation(models.Model):
 
         # Use setattr to update the attribute
         setattr(self, moon_phase_reason, reason)
-        self.save()
+        unit_of_work.save(self)
 
 
 class PublicProfile(models.Model):
@@ -795,27 +1089,70 @@ class moon_phase_dates(models.Model):
     moon_phase = models.CharField(max_length=20, choices=CHOICES)
     date = models.DateField()
 
+    class Meta:
+        unique_together = ("moon_phase", "date")
+
 
 def get_next_turn_number(current_date, moon_phase):
-    next_phase_date = (
-        moon_phase_dates.objects.filter(date__gte=current_date, moon_phase=moon_phase)
-        .order_by("date")
-        .first()
-    )
+    next_phase_date = moon_phases.next_phase_date(moon_phase, current_date)
 
     if next_phase_date:
-        return (next_phase_date.date - current_date).days + 1
+        return (next_phase_date - current_date).days + 1
     return None
 
 
 class moon_phase_turn_sequence(models.Model):
+    """
+    The turns of the moon phases for games started on `start_date`.
+
+    One schedule is shared by all games started that day. `turn_phases` has
+    one character per turn, starting with turn 1: the PHASE_CODES of the
+    phase of the turn, or NO_PHASE.
+    """
+
+    PHASE_CODES = {
+        "new_moon": "N",
+        "first_quarter": "Q",
+        "full_moon": "F",
+        "last_quarter": "L",
+    }
+    NO_PHASE = "."
+
     new_moon_turn_number = models.IntegerField(null=True, blank=True)
     first_quarter_turn_number = models.IntegerField(null=True, blank=True)
     full_moon_turn_number = models.IntegerField(null=True, blank=True)
     last_quarter_turn_number = models.IntegerField(null=True, blank=True)
-
-    def populate_turn_numbers(self):
-        current_date = datetime.now().date()
+    start_date = models.DateField(unique=True, null=True, blank=True)
+    turn_phases = models.CharField(max_length=64, blank=True, default="")
+
+    @classmethod
+    def for_date(cls, start_date):
+        """
+        Return the schedule of `start_date`, created if needed.
+
+        Return None when no moon phase date follows `start_date`, so that no
+        empty schedule is shared by the games of the day. A schedule saved
+        empty before is rebuilt.
+        """
+        sequence = cls.objects.filter(start_date=start_date).first()
+        if sequence is not None and sequence.has_turn_numbers():
+            return sequence
+        if sequence is None:
+            sequence = cls(start_date=start_date)
+        sequence.populate_turn_numbers(start_date)
+        if not sequence.has_turn_numbers():
+            return None
+        try:
+            with transaction.atomic():
+                sequence.save()
+        except IntegrityError:
+            # Another game created the schedule of the day first
+            return cls.objects.get(start_date=start_date)
+        return sequence
+
+    def populate_turn_numbers(self, current_date=None):
+        if current_date is None:
+            current_date = datetime.now().date()
         self.new_moon_turn_number = get_next_turn_number(current_date, "new_moon")
         self.first_quarter_turn_number = get_next_turn_number(
             current_date, "first_quarter"
@@ -824,3 +1161,49 @@ class moon_phase_turn_sequence(models.Model):
         self.last_quarter_turn_number = get_next_turn_number(
             current_date, "last_quarter"
         )
+        self.build_turn_phases()
+
+    def turn_numbers(self):
+        return {
+            "new_moon": self.new_moon_turn_number,
+            "first_quarter": self.first_quarter_turn_number,
+            "full_moon": self.full_moon_turn_number,
+            "last_quarter": self.last_quarter_turn_number,
+        }
+
+    def has_turn_numbers(self):
+        return any(
+            turn_number is not None for turn_number in self.turn_numbers().values()
+        )
+
+    def build_turn_phases(self):
+        """
+        Fill turn_phases from the turn numbers of the phases.
+
+        The phases past the last turn of a game are left out, so that
+        turn_phases has one character per turn of the game.
+        """
+        turn_numbers = {
+            phase: turn_number
+            for phase, turn_number in self.turn_numbers().items()
+            if turn_number is not None
+            and 1 <= turn_number <= GameTurn.MAX_NUMBER_OF_TURNS
+        }
+        turn_phases = [self.NO_PHASE] * GameTurn.MAX_NUMBER_OF_TURNS
+        # The first phase wins when two fall on the same turn
+        for phase, turn_number in reversed(turn_numbers.items()):
+            turn_phases[turn_number - 1] = self.PHASE_CODES[phase]
+        self.turn_phases = "".join(turn_phases)
+
+    def phase_of_turn(self, turn_number):
+        """Return the moon phase of `turn_number`, or None."""
+        if not self.turn_phases:
+            self.build_turn_phases()
+        if not 1 <= turn_number <= len(self.turn_phases):
+            return None
+        return _PHASES_BY_CODE.get(self.turn_phases[turn_number - 1])
+
+
+_PHASES_BY_CODE = {
+    code: phase for phase, code in moon_phase_turn_sequence.PHASE_CODES.items()
+}
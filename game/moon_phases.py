@@ -0,0 +1,304 @@
+"""
+Moon phase times computed locally.
+
+The phases are computed with the algorithm of Jean Meeus, "Astronomical
+Algorithms" (2nd ed., chapter 49), which is accurate to well under a minute
+for the years the game uses. All lunations of a range of years are computed
+at once with NumPy arrays.
+
+The times are converted to America/New_York and only the local date is
+kept, as the USNO based populate_moon_phase_dates command used to do.
+
+The stored dates (moon_phase_dates) are answered from a process-wide index
+sorted per phase, see next_phase_date.
+"""
+
+import time
+from bisect import bisect_left
+from datetime import datetime, timezone
+
+import numpy as np
+import pytz
+from django.apps import apps
+from django.conf import settings
+from django.db.models import Count, Max
+
+PHASES = ("new_moon", "first_quarter", "full_moon", "last_quarter")
+
+# The game's day starts at midnight in New York
+LOCAL_TIME_ZONE = "America/New_York"
+
+# Mean length of a lunation, in days
+SYNODIC_MONTH = 29.530588861
+
+# Julian date of 1970-01-01 00:00 UTC
+UNIX_EPOCH_JD = 2440587.5
+
+# Periodic terms of the new and full moon corrections (Meeus table 49.A):
+# coefficient for the new moon, for the full moon, power of E, and the
+# multiples of M, M' and F in the argument
+_NEW_FULL_TERMS = [
+    (-0.40720, -0.40614, 0, 0, 1, 0),
+    (0.17241, 0.17302, 1, 1, 0, 0),
+    (0.01608, 0.01614, 0, 0, 2, 0),
+    (0.01039, 0.01043, 0, 0, 0, 2),
+    (0.00739, 0.00734, 1, -1, 1, 0),
+    (-0.00514, -0.00515, 1, 1, 1, 0),
+    (0.00208, 0.00209, 2, 2, 0, 0),
+    (-0.00111, -0.00111, 0, 0, 1, -2),
+    (-0.00057, -0.00057, 0, 0, 1, 2),
+    (0.00056, 0.00056, 1, 1, 2, 0),
+    (-0.00042, -0.00042, 0, 0, 3, 0),
+    (0.00042, 0.00042, 1, 1, 0, 2),
+    (0.00038, 0.00038, 1, 1, 0, -2),
+    (-0.00024, -0.00024, 1, -1, 2, 0),
+    (-0.00007, -0.00007, 0, 2, 1, 0),
+    (0.00004, 0.00004, 0, 0, 2, -2),
+    (0.00004, 0.00004, 0, 3, 0, 0),
+    (0.00003, 0.00003, 0, 1, 1, -2),
+    (0.00003, 0.00003, 0, 0, 2, 2),
+    (-0.00003, -0.00003, 0, 1, 1, 2),
+    (0.00003, 0.00003, 0, -1, 1, 2),
+    (-0.00002, -0.00002, 0, -1, 1, -2),
+    (-0.00002, -0.00002, 0, 1, 3, 0),
+    (0.00002, 0.00002, 0, 0, 4, 0),
+]
+
+# Periodic terms of the quarter corrections: coefficient, power of E, and the
+# multiples of M, M' and F
+_QUARTER_TERMS = [
+    (-0.62801, 0, 0, 1, 0),
+    (0.17172, 1, 1, 0, 0),
+    (-0.01183, 1, 1, 1, 0),
+    (0.00862, 0, 0, 2, 0),
+    (0.00804, 0, 0, 0, 2),
+    (0.00454, 1, -1, 1, 0),
+    (0.00204, 2, 2, 0, 0),
+    (-0.00180, 0, 0, 1, -2),
+    (-0.00070, 0, 0, 1, 2),
+    (-0.00040, 0, 0, 3, 0),
+    (-0.00034, 1, -1, 2, 0),
+    (0.00032, 1, 1, 0, 2),
+    (0.00032, 1, 1, 0, -2),
+    (-0.00028, 2, 2, 1, 0),
+    (0.00027, 1, 1, 2, 0),
+    (-0.00005, 0, -1, 1, -2),
+    (0.00004, 0, 0, 2, 2),
+    (-0.00004, 0, 1, 1, 2),
+    (0.00004, 0, -2, 1, 0),
+    (0.00003, 0, 1, 1, -2),
+    (0.00003, 0, 3, 0, 0),
+    (0.00002, 0, 0, 2, -2),
+    (0.00002, 0, -1, 1, 2),
+    (-0.00002, 0, 1, 3, 0),
+]
+
+# Additional corrections for all phases: coefficient and the argument
+# A = a + b * k (- 0.009173 * T**2 for the first one), in degrees
+_PLANETARY_TERMS = [
+    (0.000325, 299.77, 0.107408),
+    (0.000165, 251.88, 0.016321),
+    (0.000164, 251.83, 26.651886),
+    (0.000126, 349.42, 36.412478),
+    (0.000110, 84.66, 18.206239),
+    (0.000062, 141.74, 53.303771),
+    (0.000060, 207.14, 2.453732),
+    (0.000056, 154.84, 7.306860),
+    (0.000047, 34.52, 27.261239),
+    (0.000042, 207.19, 0.121824),
+    (0.000040, 291.34, 1.844379),
+    (0.000037, 161.72, 24.198154),
+    (0.000035, 239.56, 25.513099),
+    (0.000023, 331.55, 3.592518),
+]
+
+
+def _phase_jde(k, phase):
+    """
+    Julian Ephemeris Days of the phase number `phase` (0 new moon, 1 first
+    quarter, 2 full moon, 3 last quarter) of the lunations `k`, an array of
+    integers counted from the new moon of 2000-01-06.
+    """
+    k = k + phase / 4
+    t = k / 1236.85
+    jde = (
+        2451550.09766
+        + SYNODIC_MONTH * k
+        + 0.00015437 * t**2
+        - 0.000000150 * t**3
+        + 0.00000000073 * t**4
+    )
+    e = 1 - 0.002516 * t - 0.0000074 * t**2
+    # Mean anomalies of the sun and the moon, the moon's argument of latitude
+    # and the longitude of its ascending node
+    m = np.radians(2.5534 + 29.10535670 * k - 0.0000014 * t**2 - 0.00000011 * t**3)
+    m_moon = np.radians(
+        201.5643
+        + 385.81693528 * k
+        + 0.0107582 * t**2
+        + 0.00001238 * t**3
+        - 0.000000058 * t**4
+    )
+    f = np.radians(
+        160.7108
+        + 390.67050284 * k
+        - 0.0016118 * t**2
+        - 0.00000227 * t**3
+        + 0.000000011 * t**4
+    )
+    omega = np.radians(
+        124.7746 - 1.56375588 * k + 0.0020672 * t**2 + 0.00000215 * t**3
+    )
+
+    if phase in (0, 2):
+        column = phase // 2
+        terms = [(row[column], *row[2:]) for row in _NEW_FULL_TERMS]
+    else:
+        terms = _QUARTER_TERMS
+    for coefficient, e_power, m_n, m_moon_n, f_n in terms:
+        jde += (
+            coefficient * e**e_power * np.sin(m_n * m + m_moon_n * m_moon + f_n * f)
+        )
+    jde -= 0.00017 * np.sin(omega)
+
+    if phase in (1, 3):
+        w = (
+            0.00306
+            - 0.00038 * e * np.cos(m)
+            + 0.00026 * np.cos(m_moon)
+            - 0.00002 * np.cos(m_moon - m)
+            + 0.00002 * np.cos(m_moon + m)
+            + 0.00002 * np.cos(2 * f)
+        )
+        jde += w if phase == 1 else -w
+
+    for i, (coefficient, a, b) in enumerate(_PLANETARY_TERMS):
+        argument = a + b * k
+        if i == 0:
+            argument -= 0.009173 * t**2
+        jde += coefficient * np.sin(np.radians(argument))
+    return jde
+
+
+def _delta_t(year):
+    """
+    Difference between dynamical and universal time in seconds (polynomials
+    of Espenak and Meeus).
+    """
+    t = year - 2000
+    return np.where(
+        year < 2050,
+        62.92 + 0.32217 * t + 0.005589 * t**2,
+        -20 + 32 * ((year - 1820) / 100) ** 2 - 0.5628 * (2150 - year),
+    )
+
+
+def phase_times(start_year, end_year):
+    """
+    Return (phase, UTC datetime) for every phase from the start of
+    `start_year` to the end of `end_year`, in time order.
+    """
+    first = int(np.floor((start_year - 2000) * 12.3685)) - 1
+    last = int(np.ceil((end_year + 1 - 2000) * 12.3685)) + 1
+    k = np.arange(first, last + 1, dtype=np.float64)
+
+    times = []
+    for phase, name in enumerate(PHASES):
+        jde = _phase_jde(k, phase)
+        year = 2000 + (jde - 2451545.0) / 365.25
+        seconds = (jde - UNIX_EPOCH_JD) * 86400 - _delta_t(year)
+        # Rounded to the minute, like the published tables
+        minutes = np.rint(seconds / 60).astype(np.int64)
+        times += [(int(m), name) for m in minutes]
+
+    start = datetime(start_year, 1, 1, tzinfo=timezone.utc).timestamp() // 60
+    end = datetime(end_year + 1, 1, 1, tzinfo=timezone.utc).timestamp() // 60
+    return [
+        (name, datetime.fromtimestamp(minute * 60, timezone.utc))
+        for minute, name in sorted(times)
+        if start <= minute < end
+    ]
+
+
+def phase_dates(start_year, end_year):
+    """
+    Return (phase, date) for every phase of the years, where the date is the
+    day of the phase in LOCAL_TIME_ZONE.
+    """
+    local_zone = pytz.timezone(LOCAL_TIME_ZONE)
+    return [
+        (name, time.astimezone(local_zone).date())
+        for name, time in phase_times(start_year, end_year)
+    ]
+
+
+_index = None
+
+
+class MoonPhaseIndex:
+    """Sorted dates of every phase in moon_phase_dates."""
+
+    def __init__(self, rows):
+        self.dates = {phase: [] for phase in PHASES}
+        ids = []
+        for pk, phase, date in rows:
+            ids.append(pk)
+            self.dates.setdefault(phase, []).append(date)
+        for dates in self.dates.values():
+            dates.sort()
+        # Row count and highest id of the table the index was loaded from
+        self.bound = (len(ids), max(ids, default=None))
+        self.checked_at = time.monotonic()
+
+    def next_date(self, phase, day):
+        """Return the first date of `phase` on or after `day`, or None."""
+        dates = self.dates.get(phase, [])
+        i = bisect_left(dates, day)
+        return dates[i] if i < len(dates) else None
+
+    def is_stale(self):
+        """
+        Return whether the table changed since the index was loaded, reading
+        its bound at most every GAME_CATALOG_CHECK_INTERVAL seconds.
+        """
+        now = time.monotonic()
+        interval = getattr(settings, "GAME_CATALOG_CHECK_INTERVAL", 5)
+        if now - self.checked_at < interval:
+            return False
+        self.checked_at = now
+        moon_phase_dates = apps.get_model("game", "moon_phase_dates")
+        bound = moon_phase_dates.objects.aggregate(Count("id"), Max("id"))
+        return (bound["id__count"], bound["id__max"]) != self.bound
+
+
+def index():
+    global _index
+    phase_index = _index
+    if phase_index is None:
+        moon_phase_dates = apps.get_model("game", "moon_phase_dates")
+        phase_index = MoonPhaseIndex(
+            moon_phase_dates.objects.values_list("id", "moon_phase", "date")
+        )
+        _index = phase_index
+    return phase_index
+
+
+def invalidate_index():
+    global _index
+    _index = None
+
+
+def next_phase_date(phase, day):
+    """
+    Return the first stored date of `phase` on or after `day`, or None.
+
+    The table may have been populated by another process (the
+    populate_moon_phase_dates command) after the index was loaded, so a date
+    past the end of the index reloads it when the table's bound moved. The
+    misses are answered from the index in between.
+    """
+    date = index().next_date(phase, day)
+    if date is None and index().is_stale():
+        invalidate_index()
+        date = index().next_date(phase, day)
+    return date
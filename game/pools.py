@@ -0,0 +1,380 @@
+"""
+Storage backends for a player's word, question and narrative choice pools.
+
+A player keeps its pools in one of three ways:
+
+- "relational": the ManyToMany through tables (the original layout);
+- "packed": id arrays stored on the player row itself;
+- "derived": the question and character word pools are not stored at all.
+  They are derived on demand from the player's seed and creation choices
+  (see derive_pools), and only the ids used up since then ("consumed") or
+  added later (narrative choice words) are stored. The other two pools are
+  packed.
+
+All backends expose the same small API, which is what GameTurn, the views
+and the consumer use:
+
+    pool = player.pool("character_word")
+    pool.add(word)
+    pool.remove(word)
+    word in pool
+    pool.filter(kind_of_word="verb")
+"""
+
+from functools import lru_cache
+
+from django.apps import apps
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models.fields.related_descriptors import ManyToManyDescriptor
+
+from game import catalog, sampling, unit_of_work
+
+RELATIONAL = "relational"
+PACKED = "packed"
+DERIVED = "derived"
+
+STORAGE_CHOICES = [
+    (RELATIONAL, "Relational"),
+    (PACKED, "Packed"),
+    (DERIVED, "Derived"),
+]
+
+# Pool name -> model stored in it
+POOL_MODELS = {
+    "character_word": "Word",
+    "simple_word": "Word",
+    "question": "Question",
+    "narrative_choice": "NarrativeChoice",
+}
+
+# Pools that the derived storage mode computes from the player's seed
+DERIVED_POOLS = ("question", "character_word")
+
+# Player fields that the packed and derived storage modes change
+PACKED_FIELDS = [f"{name}_ids" for name in POOL_MODELS] + ["consumed_ids"]
+
+
+class PoolStorageError(Exception):
+    """A pool was used through the storage of another mode."""
+
+
+class RelationalPoolDescriptor(ManyToManyDescriptor):
+    """
+    Accessor of a pool's ManyToMany manager that refuses players of the other
+    storage modes, whose pools are on the player row and whose through rows
+    are empty.
+    """
+
+    def __get__(self, instance, cls=None):
+        if instance is not None and instance.pool_storage != RELATIONAL:
+            raise PoolStorageError(
+                f"Player {instance.pk} keeps its pools in {instance.pool_storage} "
+                f"storage, use player.pool() instead of {self.field.name}."
+            )
+        return super().__get__(instance, cls)
+
+
+class PoolField(models.ManyToManyField):
+    """ManyToManyField of a pool of the relational storage mode."""
+
+    def contribute_to_class(self, cls, name, **kwargs):
+        super().contribute_to_class(cls, name, **kwargs)
+        setattr(cls, self.name, RelationalPoolDescriptor(self.remote_field))
+
+    def deconstruct(self):
+        # Migrations see a plain ManyToManyField
+        name, path, args, kwargs = super().deconstruct()
+        return name, "django.db.models.ManyToManyField", args, kwargs
+
+
+def default_pool_storage():
+    return getattr(settings, "GAME_POOL_STORAGE", RELATIONAL)
+
+
+def _pk(item):
+    return item if isinstance(item, int) else item.pk
+
+
+def derive_pools(seed, quality_ids, activity_ids, snapshot=None):
+    """
+    Draw the question and character word pools for a set of creation
+    choices: 60 general questions, 6 questions per activity and 15 words per
+    quality, sampled from the catalog in that order with one generator.
+
+    With a seed the result only depends on the seed, the choices and the
+    catalog contents, and is cached per catalog version. With a `snapshot`
+    (catalog.snapshot) as well, the questions and words added to the catalog
+    after it are left out and the ids are drawn with sampling.stable_sample,
+    so the pools stay the same whatever content was ingested since, in any
+    process. A deleted row is replaced in the pools that drew it by the next
+    id of their ranking; the other pools stay the same.
+    """
+    if seed is None:
+        return _derive_pools(sampling.rng(), quality_ids, activity_ids)
+    if snapshot:
+        catalog.ensure_version(snapshot["version"])
+        snapshot = tuple(sorted(snapshot.items()))
+    derived = _derived_pools(
+        seed, tuple(quality_ids), tuple(activity_ids), snapshot, catalog.version
+    )
+    return {name: list(ids) for name, ids in derived.items()}
+
+
+@lru_cache(maxsize=1024)
+def _derived_pools(seed, quality_ids, activity_ids, snapshot, version):
+    if snapshot:
+        return _derive_pinned_pools(seed, quality_ids, activity_ids, dict(snapshot))
+    return _derive_pools(sampling.rng(seed), quality_ids, activity_ids)
+
+
+def _derive_pinned_pools(seed, quality_ids, activity_ids, snapshot):
+    general_ids = catalog.general_question_ids(until=snapshot["question"])
+    question_ids = sampling.stable_sample(general_ids, 60, seed, 0)
+    activity_questions = catalog.activity_question_ids(
+        activity_ids, until=snapshot["question"]
+    )
+    for activity_id in activity_ids:
+        question_ids += sampling.stable_sample(
+            activity_questions[activity_id], 6, seed, 1, activity_id
+        )
+
+    character_word_ids = []
+    quality_words = catalog.quality_word_ids(quality_ids, until=snapshot["word"])
+    for quality_id in quality_ids:
+        character_word_ids += sampling.stable_sample(
+            quality_words[quality_id], 15, seed, 2, quality_id
+        )
+
+    return {
+        "question": list(dict.fromkeys(question_ids)),
+        "character_word": list(dict.fromkeys(character_word_ids)),
+    }
+
+
+def _derive_pools(rng, quality_ids, activity_ids):
+    # 60 random general questions
+    question_ids = sampling.sample(catalog.general_question_ids(), 60, rng)
+
+    # Questions from activities
+    activity_questions = catalog.activity_question_ids(activity_ids)
+    for activity_id in activity_ids:
+        question_ids += sampling.sample(activity_questions[activity_id], 6, rng)
+
+    # Words from qualities
+    character_word_ids = []
+    quality_words = catalog.quality_word_ids(quality_ids)
+    for quality_id in quality_ids:
+        character_word_ids += sampling.sample(quality_words[quality_id], 15, rng)
+
+    return {
+        "question": list(dict.fromkeys(question_ids)),
+        "character_word": list(dict.fromkeys(character_word_ids)),
+    }
+
+
+class RelationalPool:
+    """Pool backed by the player's ManyToMany field."""
+
+    def __init__(self, player, name):
+        self.player = player
+        self.name = name
+        self.manager = getattr(player, f"{name}_pool")
+
+    @property
+    def through(self):
+        return self.manager.through
+
+    def ids(self):
+        return list(
+            self.through.objects.filter(player=self.player)
+            .order_by("id")
+            .values_list(f"{self.manager.target_field_name}_id", flat=True)
+        )
+
+    def all(self):
+        return self.manager.all()
+
+    def filter(self, *args, **kwargs):
+        return self.manager.filter(*args, **kwargs)
+
+    def count(self):
+        return self.manager.count()
+
+    def add(self, *items):
+        # One INSERT, rows that are already in the pool are skipped
+        target = f"{self.manager.target_field_name}_id"
+        unit_of_work.insert(
+            *[self.through(player=self.player, **{target: _pk(i)}) for i in items],
+            ignore_conflicts=True,
+        )
+
+    def remove(self, *items):
+        # One DELETE, run at once even in an action (see unit_of_work)
+        self.manager.remove(*items)
+
+    def clear(self):
+        self.manager.clear()
+
+    def __contains__(self, item):
+        return self.manager.filter(pk=_pk(item)).exists()
+
+
+class PackedPool:
+    """Pool stored as an ordered list of ids on the player row."""
+
+    def __init__(self, player, name):
+        self.player = player
+        self.name = name
+        self.field = f"{name}_ids"
+        self.model = apps.get_model("game", POOL_MODELS[name])
+
+    def ids(self):
+        return list(getattr(self.player, self.field))
+
+    def all(self):
+        return self.model.objects.filter(pk__in=self.ids())
+
+    def filter(self, *args, **kwargs):
+        return self.all().filter(*args, **kwargs)
+
+    def count(self):
+        return len(self.ids())
+
+    def add(self, *items):
+        _change_packed_pools(self.player, {self.name: items}, "added")
+
+    def remove(self, *items):
+        _change_packed_pools(self.player, {self.name: items}, "removed")
+
+    def clear(self):
+        self.remove(*self.ids())
+
+    def __contains__(self, item):
+        return _pk(item) in self.ids()
+
+    def added(self, items):
+        """Return the player field values after adding `items`."""
+        ids = list(getattr(self.player, self.field))
+        present = set(ids)
+        for item in items:
+            pk = _pk(item)
+            if pk not in present:
+                ids.append(pk)
+                present.add(pk)
+        return {self.field: ids}
+
+    def removed(self, items):
+        """Return the player field values after removing `items`."""
+        removed = {_pk(item) for item in items}
+        ids = getattr(self.player, self.field)
+        return {self.field: [pk for pk in ids if pk not in removed]}
+
+
+class DerivedPool(PackedPool):
+    """
+    Pool derived from the player's seed and creation choices. The player row
+    only stores the ids consumed from the derived pool and the ids added on
+    top of it (in the packed array of the same name).
+
+    Derivation is pinned to the catalog snapshot taken when the choices were
+    made, so content ingested during a game does not change the pool, while
+    a deleted row is replaced by another one (see derive_pools). Players
+    without a snapshot derive from the current catalog.
+    """
+
+    def base_ids(self):
+        choices = self.player.creation_choices
+        if self.player.pool_seed is None or not choices:
+            return []
+        return derive_pools(
+            self.player.pool_seed,
+            choices.get("qualities", []),
+            choices.get("activities", []),
+            self.player.catalog_snapshot,
+        )[self.name]
+
+    def consumed(self):
+        return list(self.player.consumed_ids.get(self.name, []))
+
+    def ids(self):
+        consumed = set(self.consumed())
+        added = getattr(self.player, self.field)
+        return [
+            pk for pk in dict.fromkeys(self.base_ids() + added) if pk not in consumed
+        ]
+
+    def added(self, items):
+        new = list(dict.fromkeys(_pk(item) for item in items))
+        base = set(self.base_ids())
+        changes = super().added([pk for pk in new if pk not in base])
+        changes["consumed_ids"] = self._consumed_ids(
+            [pk for pk in self.consumed() if pk not in new]
+        )
+        return changes
+
+    def removed(self, items):
+        removed = [_pk(item) for item in items]
+        base = set(self.base_ids())
+        changes = super().removed(removed)
+        consumed = self.consumed()
+        consumed += [pk for pk in removed if pk in base and pk not in consumed]
+        changes["consumed_ids"] = self._consumed_ids(consumed)
+        return changes
+
+    def _consumed_ids(self, ids):
+        consumed_ids = dict(self.player.consumed_ids)
+        consumed_ids[self.name] = ids
+        return consumed_ids
+
+
+def get_pool(player, name):
+    if name not in POOL_MODELS:
+        raise ValueError(f"Unknown pool: {name}")
+    if player.pool_storage == RELATIONAL:
+        return RelationalPool(player, name)
+    if player.pool_storage == DERIVED and name in DERIVED_POOLS:
+        return DerivedPool(player, name)
+    return PackedPool(player, name)
+
+
+def add_to_pools(player, additions):
+    """
+    Add ids to several pools at once: one bulk insert per through table for
+    relational pools, a single UPDATE of the player row otherwise.
+    """
+    _update_pools(player, additions, "add", "added")
+
+
+def remove_from_pools(player, removals):
+    """Remove ids from several pools at once, see add_to_pools."""
+    _update_pools(player, removals, "remove", "removed")
+
+
+def _update_pools(player, items_by_pool, method, changes):
+    if player.pool_storage == RELATIONAL:
+        for name, items in items_by_pool.items():
+            if items:
+                getattr(get_pool(player, name), method)(*items)
+        return
+    _change_packed_pools(player, items_by_pool, changes)
+
+
+def _change_packed_pools(player, items_by_pool, changes):
+    """
+    Apply the `changes` ("added" or "removed") of the items to the arrays on
+    the player row. The arrays are reloaded from the row locked until the
+    transaction ends, so that two actions changing the pools of one player
+    do not overwrite each other's changes.
+    """
+    with transaction.atomic(savepoint=False):
+        unit_of_work.lock(player, *PACKED_FIELDS)
+        fields = set()
+        for name, items in items_by_pool.items():
+            pool_changes = getattr(get_pool(player, name), changes)(items)
+            for field, value in pool_changes.items():
+                if value != getattr(player, field):
+                    setattr(player, field, value)
+                    fields.add(field)
+        if fields:
+            unit_of_work.save(player, *sorted(fields))
@@ -0,0 +1,60 @@
+"""
+Random sampling of catalog and pool ids.
+
+Samples are drawn without replacement from numpy id arrays (see
+game/catalog.py), so only the chosen rows ever need to be fetched from the
+database. Passing a seed makes the draw reproducible; the extra `salt`
+values keep draws that share a seed independent from one another.
+"""
+
+import numpy as np
+
+
+def rng(seed=None, *salt):
+    if seed is None:
+        return np.random.default_rng()
+    return np.random.default_rng([seed, *salt])
+
+
+def sample(ids, k, generator=None):
+    """Return up to `k` distinct ids from `ids` as a list of ints."""
+    ids = np.asarray(ids, dtype=np.int64)
+    k = min(k, len(ids))
+    if k <= 0:
+        return []
+    generator = generator or rng()
+    return generator.choice(ids, size=k, replace=False).tolist()
+
+
+def stable_sample(ids, k, seed, *salt):
+    """
+    Return up to `k` distinct ids from `ids`: the first ones ranked by a
+    hash of the id, the seed and the salt. Unlike sample, adding or removing
+    an id changes the result by at most that id, so the same draw can be
+    made again from a catalog that changed since.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    k = min(k, len(ids))
+    if k <= 0:
+        return []
+    key = np.uint64(rng(seed, *salt).integers(2**63))
+    ranks = _mix(ids.astype(np.uint64) ^ key)
+    chosen = np.argpartition(ranks, k - 1)[:k]
+    chosen = chosen[np.argsort(ranks[chosen], kind="stable")]
+    return ids[chosen].tolist()
+
+
+def _mix(x):
+    # splitmix64 finalizer, on arrays of uint64 that wrap around
+    with np.errstate(over="ignore"):
+        x = x + np.uint64(0x9E3779B97F4A7C15)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return x ^ (x >> np.uint64(31))
+
+
+def sample_rows(model, ids, k, generator=None):
+    """Sample `k` ids and fetch only those rows, in sampled order."""
+    chosen = sample(ids, k, generator)
+    rows = model.objects.in_bulk(chosen)
+    return [rows[pk] for pk in chosen if pk in rows]
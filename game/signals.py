@@ -0,0 +1,29 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from game import catalog, moon_phases
+from .models import Activity, Quality, Question, Word, moon_phase_dates
+
+
+@receiver(post_save, sender=Word)
+@receiver(post_delete, sender=Word)
+def invalidate_simple_word_index(sender, **kwargs):
+    catalog.invalidate_simple_words()
+    catalog.bump_version()
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+@receiver(post_delete, sender=Word)
+@receiver(post_delete, sender=Activity)
+@receiver(post_delete, sender=Quality)
+@receiver(m2m_changed, sender=Activity.questions.through)
+@receiver(m2m_changed, sender=Quality.words.through)
+def invalidate_sampling_sources(sender, **kwargs):
+    catalog.invalidate_id_arrays()
+    catalog.bump_version()
+
+
+@receiver(post_save, sender=moon_phase_dates)
+@receiver(post_delete, sender=moon_phase_dates)
+def invalidate_moon_phase_index(sender, **kwargs):
+    moon_phases.invalidate_index()
@@ -0,0 +1,142 @@
+"""
+Helpers for tests: query budgets and runs under every pool storage.
+
+A budget is the largest number of queries a request or a game action may
+make. assertQueryBudget measures the action against fixtures built at
+increasing scales and fails when it goes over its budget at any scale, or
+when its number of queries grows with the scale (an N+1 query), with a diff
+of the SQL of the smallest and the largest scale.
+
+for_each_pool_storage runs a TestCase once more under every pool storage
+other than the configured one (see game/pools.py).
+
+TestRunner, the TEST_RUNNER of the project, keeps the number of queries of
+a test independent of the clock.
+"""
+
+import difflib
+import re
+import sys
+
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext
+
+from game import catalog, moon_phases, pools
+
+# The storages for_each_pool_storage runs the tests under
+POOL_STORAGES = (pools.RELATIONAL, pools.PACKED, pools.DERIVED)
+
+# Literals in SQL, replaced so that the statements of two scales compare
+_SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SQL_LISTS = re.compile(r"\((?:\?, )+\?\)")
+
+
+def normalize_sql(sql):
+    """Return `sql` with its literals replaced by ? and lists shortened."""
+    return _SQL_LISTS.sub("(?, ...)", _SQL_LITERALS.sub("?", sql))
+
+
+class QueryBudgetMixin:
+    """assertQueryBudget for TestCase."""
+
+    # Scales the fixtures are built at, see assertQueryBudget
+    budget_scales = (1, 10)
+
+    def assertQueryBudget(self, budget, build, scales=None):
+        """
+        Call `build(scale)` for every scale, which creates the fixtures of
+        that size and returns the function to measure, and check the queries
+        of that function against `budget`. Every scale is rolled back before
+        the next one is built. Return the results of the function per scale.
+        """
+        scales = scales or self.budget_scales
+        # A first run fills the caches that only the first query of a test fills
+        self._measure(build, scales[0])
+        results, statements = {}, {}
+        for scale in scales:
+            results[scale], statements[scale] = self._measure(build, scale)
+
+        for scale, sql in statements.items():
+            if len(sql) > budget:
+                self.fail(
+                    f"{len(sql)} queries at scale {scale}, over the budget of "
+                    f"{budget}:\n" + "\n".join(sql)
+                )
+        smallest, largest = min(scales), max(scales)
+        if len(statements[largest]) != len(statements[smallest]):
+            diff = difflib.unified_diff(
+                [normalize_sql(sql) for sql in statements[smallest]],
+                [normalize_sql(sql) for sql in statements[largest]],
+                f"scale {smallest}",
+                f"scale {largest}",
+                lineterm="",
+            )
+            self.fail(
+                f"The queries grow from {len(statements[smallest])} at scale "
+                f"{smallest} to {len(statements[largest])} at scale {largest}:\n"
+                + "\n".join(diff)
+            )
+        return results
+
+    def _measure(self, build, scale):
+        with transaction.atomic():
+            action = build(scale)
+            with CaptureQueriesContext(connection) as queries:
+                result = action()
+            transaction.set_rollback(True)
+        # The process-wide indexes may hold rows that were rolled back
+        catalog.invalidate_simple_words()
+        catalog.invalidate_id_arrays()
+        moon_phases.invalidate_index()
+        # Savepoints are not counted
+        statements = [
+            query["sql"]
+            for query in queries.captured_queries
+            if not query["sql"].startswith(("SAVEPOINT", "RELEASE SAVEPOINT"))
+        ]
+        return result, statements
+
+
+def for_each_pool_storage(cls):
+    """
+    Class decorator adding to the module of the TestCase `cls` a subclass of
+    it for every other pool storage, named after the storage (PackedFooTest).
+    """
+    module = sys.modules[cls.__module__]
+    for storage in POOL_STORAGES:
+        if storage == pools.default_pool_storage():
+            continue
+        name = f"{storage.capitalize()}{cls.__name__}"
+        subclass = type(cls)(name, (cls,), {"__module__": cls.__module__})
+        subclass.__qualname__ = name
+        setattr(module, name, override_settings(GAME_POOL_STORAGE=storage)(subclass))
+    return cls
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Runs the tests with the time-based checks for changes made by other
+    processes (GAME_CATALOG_CHECK_INTERVAL, see game/catalog.py and
+    game/moon_phases.py) turned off, as if the clock stood still: whether a
+    lookup checks the catalog version would otherwise depend on how long
+    the tests before it took. Tests of the checks set the interval to 0.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._check_interval = override_settings(
+            GAME_CATALOG_CHECK_INTERVAL=float("inf")
+        )
+        self._check_interval.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._check_interval.disable()
+        super().teardown_test_environment(**kwargs)
+
+    def setup_databases(self, **kwargs):
+        old_config = super().setup_databases(**kwargs)
+        # The first check of the process, which no test should pay for
+        catalog.check_version(force=True)
+        return old_config
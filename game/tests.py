@@ -1,6 +1,13 @@
 from django.contrib.messages import get_messages
-from django.test import TestCase, RequestFactory, Client
+from django.test import (
+    TestCase,
+    TransactionTestCase,
+    RequestFactory,
+    Client,
+    override_settings,
+)
 from .models import (
+    CatalogVersion,
     Character,
     Quality,
     Interest,
@@ -13,8 +20,10 @@ from .models import (
     Word,
     NarrativeChoice,
     MoonSignInterpretation,
-    GameLog,
     PublicProfile,
+    moon_phase_dates,
+    moon_phase_turn_sequence,
+    ReactionSummary,
 )
 from django.core.exceptions import ValidationError
 from .forms import (
@@ -22,22 +31,43 @@ from .forms import (
     MoonSignInterpretationForm,
     PublicProfileCreationForm,
     AnswerFormMoon,
+    NarrativeChoiceForm,
 )
 from django import forms
 from PIL import Image
 from django.core.files.uploadedfile import InMemoryUploadedFile, SimpleUploadedFile
 from django.core.files.storage import default_storage
-import io, os, uuid
+import io, json, os, random, tempfile, uuid
 from roleplaydate import settings
 from django.urls import reverse
-from .views import CharacterCreationView, GameProgressView, end_game_session
+from .views import (
+    CHAT_WINDOW,
+    CharacterCreationView,
+    GameProgressView,
+    end_game_session,
+)
 from django.contrib.auth.models import User
 from django.core.files.base import ContentFile
 from .context_processors import game_session_processor
 from uuid import uuid4
 from unittest.mock import patch
 from django.contrib.auth import get_user_model
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from django.core.management import CommandError, call_command
+from collections import Counter
+from django.db import IntegrityError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+from game import catalog, moon_phases, pools, sampling, tracing, unit_of_work
+from game.tools import (
+    character_ingest,
+    character_json_template_generator,
+    content_packs,
+)
+from game.concurrency import StaleState
+from asgiref.sync import async_to_sync
+from game.consumers import GameConsumer
+from game.management.commands import simulate_games
+from game.testing import QueryBudgetMixin, for_each_pool_storage, normalize_sql
 
 
 class CharacterModelTest(TestCase):
@@ -267,6 +297,7 @@ class GameSessionProcessorTest(TestCase):
         self.assertEqual(context, {"game_session_url": None})
 
 
+@for_each_pool_storage
 class GameProgressViewTestCase(TestCase):
     def setUp(self):
         # Create test users
@@ -425,7 +456,7 @@ class GameProgressViewTestCase(TestCase):
 
         # Add a question to the player's question pool
         question = Question.objects.create(text="test question")
-        self.user.player.question_pool.add(question)
+        self.user.player.pool("question").add(question)
 
         response = self.client.get(
             reverse("game_progress", kwargs={"game_id": self.game_session.game_id})
@@ -446,9 +477,9 @@ class GameProgressViewTestCase(TestCase):
         word1 = Word.objects.create(word="Uno")
         word2 = Word.objects.create(word="Dos")
         word3 = Word.objects.create(word="Tres")
-        self.user.player.simple_word_pool.add(word1)
-        self.user.player.character_word_pool.add(word2)
-        self.user.player.simple_word_pool.add(word3)
+        self.user.player.pool("simple_word").add(word1)
+        self.user.player.pool("character_word").add(word2)
+        self.user.player.pool("simple_word").add(word3)
         self.user.player.save()
         # Assertions
 
@@ -543,9 +574,9 @@ class GameProgressViewTestCase(TestCase):
         word1 = Word.objects.create(word="Uno")
         word2 = Word.objects.create(word="Dos")
         word3 = Word.objects.create(word="Tres")
-        self.user.player.simple_word_pool.add(word1)
-        self.user.player.character_word_pool.add(word2)
-        self.user.player.simple_word_pool.add(word3)
+        self.user.player.pool("simple_word").add(word1)
+        self.user.player.pool("character_word").add(word2)
+        self.user.player.pool("simple_word").add(word3)
         self.user.player.save()
 
         self.user.player.MoonSignInterpretation = MoonSignInterpretation.objects.create(
@@ -572,7 +603,61 @@ class GameProgressViewTestCase(TestCase):
         self.assertIsInstance(response.context["answer_moon_form"], AnswerFormMoon)
         self.assertTemplateUsed(response, "game_progress.html")
 
+    def add_chat_messages(self, count):
+        ChatMessage.objects.bulk_create(
+            ChatMessage(
+                game=self.game_session, seq=seq, sender="Sender", text=f"m{seq}"
+            )
+            for seq in range(1, count + 1)
+        )
+
+    def chat_history(self, **params):
+        return self.client.get(
+            reverse("chat_history", kwargs={"game_id": self.game_session.game_id}),
+            params,
+        )
+
+    def test_renders_the_latest_chat_messages(self):
+        self.add_chat_messages(CHAT_WINDOW + 10)
+        response = self.client.get(
+            reverse("game_progress", kwargs={"game_id": self.game_session.game_id})
+        )
+        self.assertEqual(
+            [message.seq for message in response.context["chat_messages"]],
+            list(range(11, CHAT_WINDOW + 11)),
+        )
+        self.assertTrue(response.context["has_older_messages"])
 
+    def test_chat_history_before_and_after(self):
+        self.add_chat_messages(CHAT_WINDOW + 10)
+        data = self.chat_history(before=11).json()
+        self.assertEqual(
+            [message["seq"] for message in data["messages"]], list(range(1, 11))
+        )
+        self.assertFalse(data["has_more"])
+
+        data = self.chat_history(after=CHAT_WINDOW + 8).json()
+        self.assertEqual(
+            [message["text"] for message in data["messages"]],
+            [f"m{CHAT_WINDOW + 9}", f"m{CHAT_WINDOW + 10}"],
+        )
+        self.assertFalse(data["has_more"])
+
+        data = self.chat_history(after=0).json()
+        self.assertEqual(len(data["messages"]), CHAT_WINDOW)
+        self.assertTrue(data["has_more"])
+
+    def test_chat_history_is_for_participants(self):
+        self.assertEqual(self.chat_history(before="x").status_code, 400)
+        outsider = User.objects.create_user(username="outsider")
+        Player.objects.create(user=outsider, game_session=GameSession.objects.create())
+        self.client.force_login(outsider)
+        self.assertEqual(self.chat_history().status_code, 403)
+        self.client.logout()
+        self.assertEqual(self.chat_history().status_code, 403)
+
+
+@for_each_pool_storage
 class CharacterCreationViewTestCase(TestCase):
     def setUp(self):
         # Create test users
@@ -805,30 +890,30 @@ class CharacterCreationViewTestCase(TestCase):
         )
 
         # Assert that the players word pool has been updated with the correct words
-
+        self.user.player.refresh_from_db()
         self.assertIn(
             self.test_character.quality_1_choices.first().words.first(),
-            self.user.player.character_word_pool.all(),
+            self.user.player.pool("character_word").all(),
         )
         self.assertIn(
             self.test_character.quality_2_choices.first().words.first(),
-            self.user.player.character_word_pool.all(),
+            self.user.player.pool("character_word").all(),
         )
         self.assertIn(
             self.test_character.quality_3_choices.first().words.first(),
-            self.user.player.character_word_pool.all(),
+            self.user.player.pool("character_word").all(),
         )
 
         # Assert that the players question pool has been updated with the correct question
         self.assertIn(
             self.test_character.activity_1_choices.first().questions.first(),
-            self.user.player.question_pool.all(),
+            self.user.player.pool("question").all(),
         )
 
         # Assert that the players narrative choice pool has been updated with the correct narrative choice
         self.assertIn(
             self.test_character.interest_3_choices.first().narrative_choices.first(),
-            self.user.player.narrative_choice_pool.all(),
+            self.user.player.pool("narrative_choice").all(),
         )
 
 
@@ -918,6 +1003,36 @@ class EndGameSessionViewTestCase(TestCase):
         )
         self.assertRedirects(response, reverse("home"))
 
+    def test_summary_is_stored_once_and_outlives_the_players(self):
+        self.game_session.playerA.character_name = "Teller"
+        self.game_session.playerA.save()
+        ReactionSummary.objects.create(
+            game=self.game_session, sender="Teller", reactions=["🌕", "🌑"]
+        )
+        url = reverse("end_game_session", kwargs={"game_id": self.game_session.game_id})
+        self.client.get(url)
+        self.game_session.refresh_from_db()
+        self.assertFalse(Player.objects.filter(user=self.user).exists())
+        summary = self.game_session.summary
+
+        # Later renders only read the stored summary: the game, the login
+        # session and user, and the game of the context processor
+        ReactionSummary.objects.all().delete()
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertEqual(
+            response.context["messages_by_sender"],
+            {"Teller": {"reactions": ["🌕", "🌑"]}},
+        )
+        self.assertEqual(response.context["other_player_user"], "testuser2")
+
+        partner = Client()
+        partner.force_login(self.another_user)
+        response = partner.get(url)
+        self.assertEqual(response.context["other_player_user"], "testuser")
+        self.game_session.refresh_from_db()
+        self.assertEqual(self.game_session.summary, summary)
+
 
 class InitiateGameSessionTestCase(TestCase):
     # Probably will delete when we remove the initiate game session page
@@ -956,6 +1071,7 @@ class InitiateGameSessionTestCase(TestCase):
         self.assertNotIn(self.user1, response.context["selectable_users"])
 
 
+@for_each_pool_storage
 class CharacterCreationViewTest(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(username="testuser", password="12345")
@@ -1355,7 +1471,6 @@ class GameSessionTestCase(TestCase):
         # Test the initialization of the game session
         self.game_session.initialize_game()
         self.assertEqual(self.game_session.state, GameSession.CHARACTER_CREATION)
-        self.assertIsNotNone(self.game_session.gameLog)
         self.assertIsNotNone(self.game_session.current_game_turn)
         self.assertEqual(
             self.game_session.current_game_turn.active_player, self.player1
@@ -1590,11 +1705,6 @@ class GameTurnModelTest(TestCase):
         # Create a GameSession instance
         self.game_session = GameSession.objects.create()
 
-        # Create a GameLog instance and associate it with the game session
-        self.game_log = GameLog.objects.create()
-        self.game_session.gameLog = self.game_log
-        self.game_session.save()
-
         # Create a dummy image file
         image = SimpleUploadedFile(
             name="test_image.jpg", content=b"", content_type="image/jpeg"
@@ -1672,3 +1782,1993 @@ class GameTurnModelTest(TestCase):
         # Delete the dummy image file if it exists
         if self.character.image:
             self.character.image.delete(save=False)
+
+
+class GameTurnActiveSlotTest(TestCase):
+    def setUp(self):
+        self.game_session = GameSession.objects.create()
+        self.playerA = Player.objects.create(
+            user=User.objects.create_user(username="slot_a"),
+            game_session=self.game_session,
+        )
+        self.playerB = Player.objects.create(
+            user=User.objects.create_user(username="slot_b"),
+            game_session=self.game_session,
+        )
+        self.game_session.playerA = self.playerA
+        self.game_session.playerB = self.playerB
+        self.game_session.save()
+        self.game_session.initialize_game()
+        self.game_session.save()
+
+    def test_initialize_game_starts_with_player_a(self):
+        turn = self.game_session.current_game_turn
+        self.assertEqual(turn.active_slot, GameTurn.PLAYER_A)
+        self.assertEqual(turn.active_player, self.playerA)
+
+    def test_switch_active_player_flips_slot_without_reading(self):
+        turn = GameTurn.objects.select_related("parent_game").get(
+            id=self.game_session.current_game_turn.id
+        )
+        with self.assertNumQueries(1):  # the UPDATE of the turn
+            turn.switch_active_player()
+        self.assertEqual(turn.active_slot, GameTurn.PLAYER_B)
+        self.assertEqual(turn.active_player_id, self.playerB.id)
+
+        turn.switch_active_player()
+        self.assertEqual(turn.active_slot, GameTurn.PLAYER_A)
+        self.assertEqual(turn.active_player, self.playerA)
+
+    def test_slot_falls_back_to_active_player(self):
+        turn = self.game_session.current_game_turn
+        GameTurn.objects.filter(id=turn.id).update(
+            active_slot="", active_player=self.playerB
+        )
+        turn = GameTurn.objects.select_related("parent_game").get(id=turn.id)
+        self.assertEqual(turn.get_active_slot(), GameTurn.PLAYER_B)
+        turn.switch_active_player()
+        self.assertEqual(turn.active_slot, GameTurn.PLAYER_A)
+        self.assertEqual(turn.active_player_id, self.playerA.id)
+
+    def test_set_active_player_sets_slot(self):
+        turn = self.game_session.current_game_turn
+        turn.set_active_player(self.playerB)
+        self.assertEqual(turn.active_slot, GameTurn.PLAYER_B)
+
+        outsider = Player.objects.create(
+            user=User.objects.create_user(username="slot_c"),
+            game_session=GameSession.objects.create(),
+        )
+        turn.set_active_player(outsider)
+        self.assertEqual(turn.active_slot, "")
+
+    def test_react_with_emoji_uses_slots(self):
+        turn = self.game_session.current_game_turn
+        turn.state = GameTurn.REACT_EMOJI
+        turn.save()
+        turn.react_with_emoji("🌕", self.playerA)
+        self.assertTrue(turn.player_a_completed_cycle)
+        self.assertEqual(turn.active_slot, GameTurn.PLAYER_B)
+
+        turn.state = GameTurn.REACT_EMOJI
+        with self.assertRaises(ValueError):
+            turn.react_with_emoji("🌕", self.playerA)
+
+    def test_consumer_loads_turn_with_parent_game(self):
+        consumer = GameConsumer()
+        consumer.game_id = self.game_session.game_id
+        with self.assertNumQueries(1):
+            turn = consumer.get_current_game_turn()
+            self.assertEqual(turn.parent_game.id, self.game_session.id)
+            self.assertEqual(turn.get_active_slot(), GameTurn.PLAYER_A)
+            self.assertEqual(turn.parent_game.state, self.game_session.state)
+
+
+@for_each_pool_storage
+class UnitOfWorkTest(TestCase):
+    def setUp(self):
+        self.game_session = GameSession.objects.create()
+        self.playerA = Player.objects.create(
+            user=User.objects.create_user(username="unit_a"),
+            game_session=self.game_session,
+            character=Character.objects.create(
+                name="Unit", description="", image="characters/unit.png"
+            ),
+        )
+        self.playerB = Player.objects.create(
+            user=User.objects.create_user(username="unit_b"),
+            game_session=self.game_session,
+        )
+        self.game_session.playerA = self.playerA
+        self.game_session.playerB = self.playerB
+        self.game_session.save()
+        self.game_session.initialize_game()
+        self.game_session.save()
+        self.turn = self.game_session.current_game_turn
+
+    def writes(self, queries):
+        return [
+            query["sql"]
+            for query in queries.captured_queries
+            if query["sql"].startswith(("INSERT", "UPDATE", "DELETE"))
+        ]
+
+    def test_saves_are_coalesced(self):
+        with CaptureQueriesContext(connection) as queries:
+            with unit_of_work.action():
+                self.turn.turn_number = 2
+                unit_of_work.save(self.turn, "turn_number")
+                self.turn.narrative_nights = 2
+                unit_of_work.save(self.turn, "narrative_nights")
+                self.assertEqual(self.writes(queries), [])
+        self.assertEqual(len(self.writes(queries)), 1)
+
+        self.turn.refresh_from_db()
+        self.assertEqual(self.turn.turn_number, 2)
+        self.assertEqual(self.turn.narrative_nights, 2)
+
+    def test_new_rows_are_bulk_inserted_in_order(self):
+        with CaptureQueriesContext(connection) as queries:
+            with unit_of_work.action():
+                self.turn.add_chat_message(self.playerA, "first")
+                self.turn.add_chat_message(self.playerA, "second")
+        self.assertEqual(len(self.writes(queries)), 1)
+        self.assertEqual(
+            list(
+                self.game_session.chat_messages.order_by("seq").values_list(
+                    "seq", "text"
+                )
+            ),
+            [(1, "first"), (2, "second")],
+        )
+
+    def test_updates_are_flushed_before_inserts(self):
+        with CaptureQueriesContext(connection) as queries:
+            with unit_of_work.action():
+                self.turn.add_chat_message(self.playerA, "first")
+                self.turn.turn_number = 2
+                unit_of_work.save(self.turn, "turn_number")
+        self.assertEqual(
+            [sql.split()[0] for sql in self.writes(queries)], ["UPDATE", "INSERT"]
+        )
+
+    def test_value_error_flushes_and_other_errors_discard(self):
+        with self.assertRaises(ValueError):
+            with unit_of_work.action():
+                self.turn.add_chat_message(self.playerA, "kept")
+                raise ValueError("Not both players have written their messages.")
+        with self.assertRaises(KeyError):
+            with unit_of_work.action():
+                self.turn.add_chat_message(self.playerA, "discarded")
+                raise KeyError("boom")
+        self.assertEqual(
+            list(ChatMessage.objects.values_list("text", flat=True)), ["kept"]
+        )
+
+    def test_nested_actions_flush_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            with unit_of_work.action():
+                with unit_of_work.action():
+                    self.turn.switch_active_player()
+                self.assertEqual(self.writes(queries), [])
+                self.turn.switch_active_player()
+        self.assertEqual(len(self.writes(queries)), 1)
+
+    def test_reaction_summary_is_written_at_the_flush(self):
+        sender = self.playerA.character_name
+        ReactionSummary.objects.create(game=self.game_session, sender=sender)
+        with CaptureQueriesContext(connection) as queries:
+            with unit_of_work.action():
+                ReactionSummary.record(self.game_session.pk, sender, "🌕")
+                self.assertEqual(self.writes(queries), [])
+        self.assertEqual(len(self.writes(queries)), 1)
+        self.assertEqual(ReactionSummary.objects.get().reactions, ["🌕"])
+
+    def test_saves_immediately_outside_an_action(self):
+        self.turn.turn_number = 5
+        with self.assertNumQueries(1):
+            unit_of_work.save(self.turn, "turn_number")
+        self.turn.refresh_from_db()
+        self.assertEqual(self.turn.turn_number, 5)
+
+    def test_consumer_action_writes_once_per_table(self):
+        self.game_session.start_regular_turn()
+        self.game_session.save()
+        self.turn.add_chat_message(self.playerA, "question")
+        self.turn.state = GameTurn.REACT_EMOJI
+        self.turn.save()
+        # The summary row exists after the first reaction to the sender
+        ReactionSummary.objects.create(
+            game=self.game_session, sender=self.playerA.character_name
+        )
+
+        consumer = GameConsumer()
+        consumer.game_id = self.game_session.game_id
+        with CaptureQueriesContext(connection) as queries:
+            consumer.react_with_emoji_sync("🌕", self.playerA)
+        # The reaction, its summary and the turn
+        self.assertEqual(len(self.writes(queries)), 3)
+
+        self.turn.refresh_from_db()
+        self.assertEqual(self.turn.state, GameTurn.SELECT_QUESTION)
+        self.assertEqual(self.turn.active_slot, GameTurn.PLAYER_B)
+        self.assertTrue(self.turn.player_a_completed_cycle)
+        self.assertEqual(ChatMessage.objects.get().reaction, "🌕")
+
+
+class ChatMessageSeqTest(TestCase):
+    def setUp(self):
+        self.game_session = GameSession.objects.create()
+        self.playerA = Player.objects.create(
+            user=User.objects.create_user(username="seq_a"),
+            game_session=self.game_session,
+            character=Character.objects.create(
+                name="Seq", description="", image="characters/seq.png"
+            ),
+        )
+        self.playerB = Player.objects.create(
+            user=User.objects.create_user(username="seq_b"),
+            game_session=self.game_session,
+        )
+        self.game_session.playerA = self.playerA
+        self.game_session.playerB = self.playerB
+        self.game_session.save()
+        self.game_session.initialize_game()
+        self.game_session.save()
+        self.turn = self.game_session.current_game_turn
+
+    def test_seq_continues_after_stored_messages(self):
+        self.turn.add_chat_message(self.playerA, "first")
+        with unit_of_work.action():
+            self.turn.add_chat_message(self.playerA, "second")
+            self.turn.add_chat_message(self.playerA, "third")
+        other_game = GameSession.objects.create()
+        self.assertEqual(ChatMessage.next_seq(other_game.pk), 1)
+        self.assertEqual(
+            list(
+                self.game_session.chat_messages.order_by("seq").values_list(
+                    "seq", "text"
+                )
+            ),
+            [(1, "first"), (2, "second"), (3, "third")],
+        )
+
+    def test_seq_is_unique_per_game(self):
+        self.turn.add_chat_message(self.playerA, "first")
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ChatMessage.objects.create(
+                game=self.game_session, seq=1, sender="Seq", text="again"
+            )
+
+    def test_reaction_goes_to_the_latest_message(self):
+        self.turn.add_chat_message(self.playerA, "question")
+        self.turn.add_chat_message(self.playerA, "answer")
+        self.turn.state = GameTurn.REACT_EMOJI
+        self.turn.active_slot = GameTurn.PLAYER_A
+        self.turn.react_with_emoji("🌕", self.playerA)
+        self.assertEqual(
+            dict(self.game_session.chat_messages.values_list("text", "reaction")),
+            {"question": None, "answer": "🌕"},
+        )
+
+
+class ReactionSummaryTest(TestCase):
+    def setUp(self):
+        self.game_session = GameSession.objects.create()
+        self.player = Player.objects.create(
+            user=User.objects.create_user(username="summary_a"),
+            game_session=self.game_session,
+            character_name="Summary",
+        )
+        self.player.MoonSignInterpretation = MoonSignInterpretation.objects.create(
+            on_player=self.player,
+            new_moon="positive",
+            first_quarter="ambiguous",
+            full_moon="positive",
+            last_quarter="negative",
+        )
+        self.player.save()
+        self.emojis = ["🌕", "🌑", "🌗", "🌕"]
+        for seq, emoji in enumerate(self.emojis, start=1):
+            ChatMessage.objects.create(
+                game=self.game_session, seq=seq, sender="Summary", text=f"m{seq}"
+            )
+            ReactionSummary.record(self.game_session.pk, "Summary", emoji)
+
+    def test_record(self):
+        summary = ReactionSummary.objects.get()
+        self.assertEqual(summary.reactions, self.emojis)
+        self.assertEqual(summary.full_moon_count, 2)
+        self.assertEqual(summary.first_quarter_count, 0)
+        self.assertEqual(
+            summary.attitude_summary(self.player.MoonSignInterpretation),
+            {"positive": 3, "negative": 1},
+        )
+
+    def test_emojis_of_several_code_points_are_kept_whole(self):
+        emojis = ["❤️", "👩‍🚀", "👍🏽"]
+        for emoji in emojis:
+            ReactionSummary.record(self.game_session.pk, "Other", emoji)
+        summary = ReactionSummary.objects.get(sender="Other")
+        self.assertEqual(summary.reactions, emojis)
+
+    def test_record_when_the_row_was_created_concurrently(self):
+        # The partner's first reaction created the row in the meantime
+        ReactionSummary.objects.create(game=self.game_session, sender="Other")
+        ReactionSummary.record(self.game_session.pk, "Other", "🌑")
+        summary = ReactionSummary.objects.get(sender="Other")
+        self.assertEqual(summary.reactions, ["🌑"])
+        self.assertEqual(summary.new_moon_count, 1)
+
+    def test_end_of_game_summary_reads_one_row(self):
+        self.game_session.playerA = self.player
+        with self.assertNumQueries(1):
+            summary = self.game_session.build_summary()
+        self.assertEqual(
+            summary["players"][str(self.player.user_id)],
+            {
+                "sender": "Summary",
+                "reactions": self.emojis,
+                "attitude_summary": {"positive": 3, "negative": 1},
+                "partner": None,
+            },
+        )
+
+    def test_backfill(self):
+        for message, emoji in zip(
+            ChatMessage.objects.order_by("seq"), self.emojis, strict=True
+        ):
+            message.reaction = emoji
+            message.save()
+        recorded = ReactionSummary.objects.get()
+        ReactionSummary.objects.update(reactions=[], full_moon_count=0)
+        call_command("backfill_reaction_summaries", stdout=io.StringIO())
+        backfilled = ReactionSummary.objects.get()
+        self.assertEqual(backfilled.reactions, recorded.reactions)
+        self.assertEqual(
+            [backfilled.new_moon_count, backfilled.full_moon_count],
+            [recorded.new_moon_count, recorded.full_moon_count],
+        )
+
+
+@for_each_pool_storage
+class VersionedGameStateTest(TestCase):
+    def setUp(self):
+        self.game_session = GameSession.objects.create()
+        self.playerA = Player.objects.create(
+            user=User.objects.create_user(username="version_a"),
+            game_session=self.game_session,
+            character=Character.objects.create(
+                name="Version", description="", image="characters/version.png"
+            ),
+        )
+        self.playerB = Player.objects.create(
+            user=User.objects.create_user(username="version_b"),
+            game_session=self.game_session,
+        )
+        self.game_session.playerA = self.playerA
+        self.game_session.playerB = self.playerB
+        self.game_session.save()
+        self.game_session.initialize_game()
+        self.game_session.save()
+        self.game_session.start_regular_turn()
+        self.game_session.save()
+
+        self.turn = self.game_session.current_game_turn
+        self.turn.add_chat_message(self.playerA, "question")
+        self.turn.state = GameTurn.REACT_EMOJI
+        self.turn.save()
+
+        self.consumer = GameConsumer()
+        self.consumer.game_id = self.game_session.game_id
+
+    def test_save_increments_version(self):
+        version = self.turn.version
+        self.turn.turn_number = 2
+        self.turn.save(update_fields=["turn_number"])
+        self.assertEqual(self.turn.version, version + 1)
+        self.turn.refresh_from_db()
+        self.assertEqual(self.turn.version, version + 1)
+
+    def test_stale_save_raises(self):
+        stale = GameTurn.objects.get(id=self.turn.id)
+        self.turn.save()
+        stale.turn_number = 5
+        with self.assertRaises(StaleState), transaction.atomic():
+            stale.save(update_fields=["turn_number"])
+        self.turn.refresh_from_db()
+        self.assertEqual(self.turn.turn_number, 1)
+
+        # Saving works again once the row was reloaded
+        stale.refresh_from_db()
+        stale.turn_number = 5
+        stale.save(update_fields=["turn_number"])
+
+    def test_stale_state_raises(self):
+        stale = GameSession.objects.get(id=self.game_session.id)
+        GameSession.objects.filter(id=self.game_session.id).update(
+            state=GameSession.ENDED
+        )
+        with self.assertRaises(StaleState), transaction.atomic():
+            stale.save()
+
+    def test_consumer_retries_after_a_concurrent_action(self):
+        load = self.consumer.get_current_game_turn
+        stale_turn = load()
+        # The partner's action saves the turn after it was loaded
+        partner_turn = GameTurn.objects.get(id=self.turn.id)
+        partner_turn.player_b_completed_cycle = True
+        partner_turn.save()
+
+        loads = []
+
+        def get_current_game_turn():
+            loads.append(load() if loads else stale_turn)
+            return loads[-1]
+
+        with patch.object(
+            self.consumer, "get_current_game_turn", get_current_game_turn
+        ):
+            self.consumer.run_action_sync(
+                self.consumer.react_with_emoji_sync, "🌕", self.playerA
+            )
+
+        self.assertEqual(len(loads), 2)
+        self.turn.refresh_from_db()
+        self.assertEqual(self.turn.state, GameTurn.NARRATIVE_CHOICES)
+        self.assertEqual(ChatMessage.objects.get().reaction, "🌕")
+
+    def test_consumer_reports_a_conflict_when_the_state_moved_on(self):
+        stale_turn = self.consumer.get_current_game_turn()
+        # The partner's action reacts first, the turn is past REACT_EMOJI
+        partner_turn = GameTurn.objects.get(id=self.turn.id)
+        partner_turn.state = GameTurn.NARRATIVE_CHOICES
+        partner_turn.save()
+
+        load = self.consumer.get_current_game_turn
+        loads = []
+
+        def get_current_game_turn():
+            loads.append(load() if loads else stale_turn)
+            return loads[-1]
+
+        with patch.object(
+            self.consumer, "get_current_game_turn", get_current_game_turn
+        ):
+            with self.assertRaises(StaleState):
+                self.consumer.run_action_sync(
+                    self.consumer.react_with_emoji_sync, "🌕", self.playerA
+                )
+
+        self.assertEqual(len(loads), 2)
+        self.turn.refresh_from_db()
+        self.assertEqual(self.turn.state, GameTurn.NARRATIVE_CHOICES)
+        self.assertIsNone(ChatMessage.objects.get().reaction)
+
+    def test_consumer_refuses_an_action_of_another_state(self):
+        GameTurn.objects.filter(id=self.turn.id).update(
+            state=GameTurn.NARRATIVE_CHOICES
+        )
+        with self.assertRaisesMessage(ValueError, "not allowed now"):
+            self.consumer.run_action_sync(
+                self.consumer.react_with_emoji_sync, "🌕", self.playerA
+            )
+
+    def test_react_emoji_handler_sends_the_conflict(self):
+        sent = []
+
+        async def send_json(content, close=False):
+            sent.append(content)
+
+        async def broadcast_game_state():
+            sent.append("refresh")
+
+        def run_action_sync(handler, value, player):
+            raise StaleState("changed")
+
+        self.consumer.scope = {"user": self.playerA.user}
+        with patch.object(self.consumer, "send_json", send_json), patch.object(
+            self.consumer, "broadcast_game_state", broadcast_game_state
+        ), patch.object(self.consumer, "run_action_sync", run_action_sync):
+            async_to_sync(self.consumer.react_emoji)("🌕")
+
+        self.assertEqual(len(sent), 1)
+        self.assertTrue(sent[0]["retry"])
+
+    def test_consumer_gives_up_after_repeated_conflicts(self):
+        load = self.consumer.get_current_game_turn
+
+        def get_current_game_turn():
+            game_turn = load()
+            GameTurn.objects.filter(id=game_turn.id).update(
+                version=game_turn.version + 1
+            )
+            return game_turn
+
+        with patch.object(
+            self.consumer, "get_current_game_turn", get_current_game_turn
+        ):
+            with self.assertRaises(StaleState):
+                self.consumer.run_action_sync(
+                    self.consumer.react_with_emoji_sync, "🌕", self.playerA
+                )
+
+        # Nothing of the failed attempts was written
+        self.turn.refresh_from_db()
+        self.assertEqual(self.turn.state, GameTurn.REACT_EMOJI)
+        self.assertIsNone(ChatMessage.objects.get().reaction)
+
+
+class GameSessionGameIdTest(TestCase):
+    def test_new_session_gets_uuid_without_reading(self):
+        with CaptureQueriesContext(connection) as queries:
+            game_session = GameSession.objects.create()
+        self.assertIsInstance(game_session.game_id, uuid.UUID)
+        self.assertFalse(
+            [q for q in queries.captured_queries if q["sql"].startswith("SELECT")]
+        )
+
+    def test_lookup_by_url_string(self):
+        game_session = GameSession.objects.create()
+        self.assertEqual(
+            GameSession.objects.get(game_id=str(game_session.game_id)), game_session
+        )
+
+    def test_collision_retries_with_new_id(self):
+        existing = GameSession.objects.create()
+        game_session = GameSession(game_id=existing.game_id)
+        game_session.save()
+        self.assertNotEqual(game_session.game_id, existing.game_id)
+        self.assertEqual(GameSession.objects.count(), 2)
+
+    def test_repeated_collisions_raise(self):
+        existing = GameSession.objects.create()
+        game_session = GameSession(game_id=existing.game_id)
+        with patch("game.models.uuid.uuid4", return_value=existing.game_id):
+            with self.assertRaises(IntegrityError):
+                game_session.save()
+
+
+class MoonPhaseCalculatorTest(TestCase):
+    # Published USNO phase times (UTC) and the resulting New York dates
+    KNOWN_PHASES = [
+        ("full_moon", "2023-12-27 00:33", "2023-12-26"),
+        ("last_quarter", "2024-01-04 03:30", "2024-01-03"),
+        ("new_moon", "2024-01-11 11:57", "2024-01-11"),
+        ("first_quarter", "2024-01-18 03:53", "2024-01-17"),
+        ("full_moon", "2024-01-25 17:54", "2024-01-25"),
+        ("last_quarter", "2024-02-02 23:18", "2024-02-02"),
+        ("new_moon", "2024-02-09 22:59", "2024-02-09"),
+        ("first_quarter", "2024-02-16 15:01", "2024-02-16"),
+        ("full_moon", "2024-02-24 12:30", "2024-02-24"),
+        ("last_quarter", "2024-03-03 15:23", "2024-03-03"),
+        ("new_moon", "2024-03-10 09:00", "2024-03-10"),
+        ("first_quarter", "2024-03-17 04:11", "2024-03-17"),
+        ("full_moon", "2024-03-25 07:00", "2024-03-25"),
+        ("new_moon", "2024-04-08 18:21", "2024-04-08"),
+        ("full_moon", "2024-04-23 23:49", "2024-04-23"),
+    ]
+
+    def test_phase_times_match_published_times(self):
+        computed = moon_phases.phase_times(2023, 2024)
+        for phase, time, _ in self.KNOWN_PHASES:
+            expected = datetime.strptime(time, "%Y-%m-%d %H:%M").replace(
+                tzinfo=timezone.utc
+            )
+            closest = min(
+                (t for p, t in computed if p == phase), key=lambda t: abs(t - expected)
+            )
+            self.assertLessEqual(abs(closest - expected), timedelta(minutes=2))
+
+    def test_phase_dates_use_new_york_days(self):
+        computed = set(moon_phases.phase_dates(2023, 2024))
+        for phase, _, day in self.KNOWN_PHASES:
+            self.assertIn((phase, datetime.strptime(day, "%Y-%m-%d").date()), computed)
+
+    def test_phases_alternate_in_order(self):
+        names = [phase for phase, _ in moon_phases.phase_times(2024, 2100)]
+        start = moon_phases.PHASES.index(names[0])
+        self.assertEqual(
+            names,
+            [moon_phases.PHASES[(start + i) % 4] for i in range(len(names))],
+        )
+
+    def test_populate_moon_phase_dates_is_idempotent(self):
+        call_command(
+            "populate_moon_phase_dates",
+            start_year=2024,
+            end_year=2025,
+            stdout=io.StringIO(),
+        )
+        count = moon_phase_dates.objects.count()
+        self.assertEqual(count, len(moon_phases.phase_dates(2024, 2025)))
+        self.assertTrue(
+            moon_phase_dates.objects.filter(
+                moon_phase="full_moon", date="2024-01-25"
+            ).exists()
+        )
+
+        call_command(
+            "populate_moon_phase_dates",
+            start_year=2024,
+            end_year=2025,
+            stdout=io.StringIO(),
+        )
+        self.assertEqual(moon_phase_dates.objects.count(), count)
+
+
+class MoonPhaseIndexTest(TestCase):
+    def setUp(self):
+        moon_phases.invalidate_index()
+        moon_phase_dates.objects.bulk_create(
+            moon_phase_dates(moon_phase=phase, date=date)
+            for phase, date in moon_phases.phase_dates(2024, 2024)
+        )
+
+    def tearDown(self):
+        # The index outlives the test's transaction
+        moon_phases.invalidate_index()
+
+    def test_next_phase_date(self):
+        day = datetime(2024, 1, 20).date()
+        self.assertEqual(
+            moon_phases.next_phase_date("full_moon", day),
+            datetime(2024, 1, 25).date(),
+        )
+        # On the day of the phase itself
+        self.assertEqual(
+            moon_phases.next_phase_date("full_moon", datetime(2024, 1, 25).date()),
+            datetime(2024, 1, 25).date(),
+        )
+        self.assertIsNone(
+            moon_phases.next_phase_date("full_moon", datetime(2025, 1, 1).date())
+        )
+
+    def test_index_is_loaded_once(self):
+        day = datetime(2024, 3, 1).date()
+        moon_phases.next_phase_date("new_moon", day)
+        with self.assertNumQueries(0):
+            for phase in moon_phases.PHASES:
+                self.assertIsNotNone(moon_phases.next_phase_date(phase, day))
+
+    def test_initialize_game_reads_no_moon_phase_dates(self):
+        game_session = GameSession.objects.create()
+        for slot, name in (("playerA", "phase_a"), ("playerB", "phase_b")):
+            player = Player.objects.create(
+                user=User.objects.create_user(username=name),
+                game_session=game_session,
+            )
+            setattr(game_session, slot, player)
+        game_session.save()
+
+        moon_phases.index()
+        with CaptureQueriesContext(connection) as queries, patch(
+            "game.models.datetime"
+        ) as mock_datetime:
+            mock_datetime.now.return_value = datetime(2024, 1, 20)
+            game_session.initialize_game()
+        self.assertFalse(
+            [
+                q
+                for q in queries.captured_queries
+                if moon_phase_dates._meta.db_table in q["sql"]
+            ]
+        )
+        sequence = game_session.current_game_turn.moon_phase_turn_sequence
+        self.assertEqual(sequence.full_moon_turn_number, 6)
+        self.assertEqual(sequence.new_moon_turn_number, 21)
+
+    def test_saving_a_date_invalidates_the_index(self):
+        day = datetime(2025, 1, 1).date()
+        self.assertIsNone(moon_phases.next_phase_date("full_moon", day))
+        moon_phase_dates.objects.create(
+            moon_phase="full_moon", date=datetime(2025, 1, 13).date()
+        )
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                moon_phases.next_phase_date("full_moon", day),
+                datetime(2025, 1, 13).date(),
+            )
+
+    def test_dates_past_the_index_reload_it(self):
+        # Rows added by another process send no signal here
+        day = datetime(2025, 1, 1).date()
+        moon_phases.index()
+        moon_phase_dates.objects.bulk_create(
+            [moon_phase_dates(moon_phase="full_moon", date=datetime(2025, 1, 13))]
+        )
+        with override_settings(GAME_CATALOG_CHECK_INTERVAL=0):
+            self.assertEqual(
+                moon_phases.next_phase_date("full_moon", day),
+                datetime(2025, 1, 13).date(),
+            )
+
+    def test_misses_of_an_unchanged_table_keep_the_index(self):
+        day = datetime(2025, 1, 1).date()
+        moon_phases.index()
+        # The misses right after loading the index are answered from it
+        with self.assertNumQueries(0):
+            for phase in moon_phases.PHASES:
+                self.assertIsNone(moon_phases.next_phase_date(phase, day))
+        # Later, one query reads the bound of the table, which did not move
+        with override_settings(GAME_CATALOG_CHECK_INTERVAL=0):
+            with self.assertNumQueries(1):
+                self.assertIsNone(moon_phases.next_phase_date("full_moon", day))
+
+    def test_empty_table_is_read_once(self):
+        moon_phase_dates.objects.all().delete()
+        moon_phases.invalidate_index()
+        day = datetime(2024, 1, 20).date()
+        with self.assertNumQueries(1):
+            for phase in moon_phases.PHASES:
+                self.assertIsNone(moon_phases.next_phase_date(phase, day))
+
+
+class MoonPhaseScheduleTest(TestCase):
+    def setUp(self):
+        moon_phases.invalidate_index()
+        moon_phase_dates.objects.bulk_create(
+            moon_phase_dates(moon_phase=phase, date=date)
+            for phase, date in moon_phases.phase_dates(2024, 2024)
+        )
+        self.day = datetime(2024, 1, 20).date()
+
+    def tearDown(self):
+        moon_phases.invalidate_index()
+
+    def start_game(self, name):
+        game_session = GameSession.objects.create()
+        for slot in ("playerA", "playerB"):
+            player = Player.objects.create(
+                user=User.objects.create_user(username=f"{name}_{slot}"),
+                game_session=game_session,
+            )
+            setattr(game_session, slot, player)
+        game_session.save()
+        with patch("game.models.datetime") as mock_datetime:
+            mock_datetime.now.return_value = datetime(2024, 1, 20)
+            game_session.initialize_game()
+        game_session.save()
+        return game_session
+
+    def test_games_of_a_day_share_the_schedule(self):
+        first = self.start_game("first")
+        second = self.start_game("second")
+        self.assertEqual(moon_phase_turn_sequence.objects.count(), 1)
+        self.assertEqual(
+            first.current_game_turn.moon_phase_turn_sequence_id,
+            second.current_game_turn.moon_phase_turn_sequence_id,
+        )
+        self.assertEqual(
+            first.current_game_turn.moon_phase_turn_sequence.start_date, self.day
+        )
+
+    def test_phase_of_turn(self):
+        sequence = moon_phase_turn_sequence.for_date(self.day)
+        phases = {
+            turn: sequence.phase_of_turn(turn)
+            for turn in range(0, GameTurn.MAX_NUMBER_OF_TURNS + 2)
+        }
+        self.assertEqual(
+            {turn: phase for turn, phase in phases.items() if phase},
+            {
+                6: "full_moon",
+                14: "last_quarter",
+                21: "new_moon",
+                28: "first_quarter",
+            },
+        )
+        self.assertEqual(len(sequence.turn_phases), GameTurn.MAX_NUMBER_OF_TURNS)
+
+    def test_first_phase_wins_a_shared_turn(self):
+        sequence = moon_phase_turn_sequence(
+            new_moon_turn_number=3, full_moon_turn_number=3
+        )
+        self.assertEqual(sequence.phase_of_turn(3), "new_moon")
+        self.assertIsNone(sequence.phase_of_turn(4))
+
+    def test_phases_past_the_last_turn_are_left_out(self):
+        sequence = moon_phase_turn_sequence(
+            new_moon_turn_number=GameTurn.MAX_NUMBER_OF_TURNS,
+            full_moon_turn_number=GameTurn.MAX_NUMBER_OF_TURNS + 40,
+        )
+        sequence.build_turn_phases()
+        self.assertEqual(len(sequence.turn_phases), GameTurn.MAX_NUMBER_OF_TURNS)
+        self.assertEqual(
+            sequence.phase_of_turn(GameTurn.MAX_NUMBER_OF_TURNS), "new_moon"
+        )
+        self.assertIsNone(sequence.phase_of_turn(GameTurn.MAX_NUMBER_OF_TURNS + 40))
+
+    def test_no_schedule_is_saved_without_turn_numbers(self):
+        day = datetime(2030, 1, 1).date()
+        self.assertIsNone(moon_phase_turn_sequence.for_date(day))
+        self.assertFalse(moon_phase_turn_sequence.objects.exists())
+
+    def test_an_empty_schedule_is_rebuilt(self):
+        empty = moon_phase_turn_sequence.objects.create(start_date=self.day)
+        sequence = moon_phase_turn_sequence.for_date(self.day)
+        self.assertEqual(sequence.pk, empty.pk)
+        self.assertEqual(sequence.phase_of_turn(6), "full_moon")
+        empty.refresh_from_db()
+        self.assertEqual(empty.full_moon_turn_number, 6)
+
+    def test_get_moon_phase_reads_no_rows(self):
+        game_session = self.start_game("lookup")
+        game_turn = (
+            GameSession.objects.select_related(
+                "current_game_turn__moon_phase_turn_sequence"
+            )
+            .get(pk=game_session.pk)
+            .current_game_turn
+        )
+        game_turn.turn_number = 6
+        with self.assertNumQueries(0):
+            self.assertEqual(game_turn.get_moon_phase(), "full_moon")
+            self.assertEqual(
+                game_turn.regular_or_special_moon_next(), GameTurn.MOON_PHASE
+            )
+
+
+@for_each_pool_storage
+class PlayerConsumeWordsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="wordsmith")
+        self.game_session = GameSession.objects.create()
+        self.player = Player.objects.create(
+            user=self.user, game_session=self.game_session
+        )
+
+        self.simple_the = Word.objects.create(word="the", isSimple=True)
+        self.simple_moon = Word.objects.create(word="moon", isSimple=True)
+        self.character_moon = Word.objects.create(word="moon")
+        self.character_moon_2 = Word.objects.create(word="moon")
+        self.character_howl = Word.objects.create(word="howl")
+
+        self.player.pool("simple_word").add(self.simple_the, self.simple_moon)
+        self.player.pool("character_word").add(
+            self.character_moon, self.character_moon_2, self.character_howl
+        )
+
+    def test_simple_pool_is_used_before_character_pool(self):
+        not_found = self.player.consume_words("moon")
+
+        self.assertEqual(not_found, [])
+        self.assertNotIn(self.simple_moon, self.player.pool("simple_word").all())
+        self.assertEqual(self.player.pool("character_word").count(), 3)
+
+    def test_repeated_words_consume_one_entry_each(self):
+        not_found = self.player.consume_words("moon moon moon moon")
+
+        # Three entries spell "moon": one simple and two character words
+        self.assertEqual(not_found, ["moon"])
+        self.assertEqual(list(self.player.pool("simple_word").all()), [self.simple_the])
+        self.assertEqual(
+            list(self.player.pool("character_word").all()), [self.character_howl]
+        )
+
+    def test_unknown_words_are_reported(self):
+        not_found = self.player.consume_words("the wolf howl howl")
+
+        self.assertEqual(not_found, ["wolf", "howl"])
+        self.assertEqual(self.player.pool("simple_word").count(), 1)
+        self.assertEqual(self.player.pool("character_word").count(), 2)
+
+    def test_query_count_does_not_depend_on_answer_length(self):
+        with self.assertNumQueries(3):
+            self.player.consume_words("the moon howl " * 20)
+
+    def test_empty_text(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.player.consume_words("   "), [])
+
+
+@override_settings(GAME_POOL_STORAGE="packed")
+class PackedPoolStorageTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="packer")
+        self.game_session = GameSession.objects.create()
+        self.player = Player.objects.create(
+            user=self.user, game_session=self.game_session
+        )
+        self.interest = Interest.objects.create(name="Astronomy")
+        self.night_one = NarrativeChoice.objects.create(
+            name="Stargazing", interest=self.interest, night_number=1
+        )
+        self.night_two = NarrativeChoice.objects.create(
+            name="Observatory", interest=self.interest, night_number=2
+        )
+        self.verb = Word.objects.create(word="run", isSimple=True, kind_of_word="verb")
+        self.article = Word.objects.create(
+            word="the", isSimple=True, kind_of_word="article"
+        )
+
+    def test_new_players_use_packed_storage(self):
+        self.assertEqual(self.player.pool_storage, "packed")
+
+    def test_add_remove_and_contains(self):
+        pool = self.player.pool("simple_word")
+        pool.add(self.verb, self.article, self.verb)
+
+        self.player.refresh_from_db()
+        self.assertEqual(self.player.simple_word_ids, [self.verb.id, self.article.id])
+        self.assertIn(self.verb, self.player.pool("simple_word"))
+        self.assertFalse(
+            Player.simple_word_pool.through.objects.filter(player=self.player).exists()
+        )
+
+        self.player.pool("simple_word").remove(self.verb)
+        self.player.refresh_from_db()
+        self.assertNotIn(self.verb, self.player.pool("simple_word"))
+        self.assertEqual(self.player.pool("simple_word").count(), 1)
+
+    def test_filter_by_kind_and_night(self):
+        self.player.pool("simple_word").add(self.verb, self.article)
+        self.player.pool("narrative_choice").add(self.night_one, self.night_two)
+
+        self.assertEqual(
+            list(self.player.pool("simple_word").filter(kind_of_word="verb")),
+            [self.verb],
+        )
+        self.assertEqual(
+            list(self.player.pool("narrative_choice").filter(night_number=2)),
+            [self.night_two],
+        )
+
+    def test_consume_words_writes_once(self):
+        character_run = Word.objects.create(word="run")
+        self.player.pool("simple_word").add(self.verb, self.article)
+        self.player.pool("character_word").add(character_run)
+
+        # The spellings, the locked pools and their update
+        with self.assertNumQueries(3):
+            not_found = self.player.consume_words("run run run the")
+
+        self.assertEqual(not_found, ["run"])
+        self.player.refresh_from_db()
+        self.assertEqual(self.player.simple_word_ids, [])
+        self.assertEqual(self.player.character_word_ids, [])
+
+    def test_narrative_choice_form_reads_packed_pool(self):
+        self.player.pool("narrative_choice").add(self.night_one, self.night_two)
+
+        form = NarrativeChoiceForm(player=self.player, night=1)
+
+        self.assertEqual(
+            form.fields["narrative"].choices, [(self.night_one.id, "Stargazing")]
+        )
+
+    def migrate_relational_player(self):
+        from django.apps import apps
+        from importlib import import_module
+
+        migration = import_module("game.migrations.0008_player_packed_pools")
+        player = Player.objects.create(
+            user=User.objects.create_user(username="unpacked"),
+            game_session=self.game_session,
+            pool_storage="relational",
+        )
+        player.pool("simple_word").add(self.verb, self.article)
+        player.pool("narrative_choice").add(self.night_two)
+
+        migration.move_pools_to_packed_storage(apps, None)
+
+        player.refresh_from_db()
+        return player
+
+    def test_migration_moves_pools_to_packed_storage(self):
+        player = self.migrate_relational_player()
+
+        self.assertEqual(player.pool_storage, "packed")
+        self.assertEqual(player.simple_word_ids, [self.verb.id, self.article.id])
+        self.assertEqual(player.narrative_choice_ids, [self.night_two.id])
+        self.assertFalse(
+            Player.simple_word_pool.through.objects.filter(player=player).exists()
+        )
+        self.assertIn(self.night_two, player.pool("narrative_choice"))
+
+    @override_settings(GAME_POOL_STORAGE="relational")
+    def test_migration_keeps_relational_storage(self):
+        player = self.migrate_relational_player()
+
+        self.assertEqual(player.pool_storage, "relational")
+        self.assertEqual(player.simple_word_ids, [])
+        self.assertEqual(player.pool("simple_word").count(), 2)
+
+    def test_many_to_many_pools_refuse_packed_players(self):
+        with self.assertRaises(pools.PoolStorageError):
+            self.player.simple_word_pool.count()
+
+    def test_concurrent_changes_are_kept(self):
+        # Two actions that loaded the player before either changed its pools
+        other = Player.objects.get(pk=self.player.pk)
+        self.player.pool("simple_word").add(self.verb)
+        other.pool("simple_word").add(self.article)
+        self.player.pool("simple_word").remove(self.verb)
+
+        self.player.refresh_from_db()
+        self.assertEqual(self.player.simple_word_ids, [self.article.id])
+
+
+@for_each_pool_storage
+class ReplenishSimpleWordsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="replenisher")
+        self.game_session = GameSession.objects.create()
+        self.player = Player.objects.create(
+            user=self.user, game_session=self.game_session
+        )
+        for kind, target in Player.SIMPLE_WORD_TARGETS.items():
+            for i in range(target + 3):
+                Word.objects.create(
+                    word=f"{kind}_{i}", isSimple=True, kind_of_word=kind
+                )
+
+    def pool_counts(self):
+        return Counter(
+            self.player.pool("simple_word").all().values_list("kind_of_word", flat=True)
+        )
+
+    def test_fills_every_kind_to_its_target(self):
+        self.player.replenish_simple_words()
+
+        self.assertEqual(self.pool_counts(), Counter(Player.SIMPLE_WORD_TARGETS))
+
+    def test_only_missing_words_are_added(self):
+        self.player.replenish_simple_words()
+        used = self.player.pool("simple_word").filter(kind_of_word="verb").first()
+        self.player.consume_words(used.word)
+
+        self.player.replenish_simple_words()
+
+        self.assertEqual(self.pool_counts(), Counter(Player.SIMPLE_WORD_TARGETS))
+
+    def test_catalog_is_read_once(self):
+        self.player.replenish_simple_words()
+        self.player.pool("simple_word").clear()
+
+        # One pool read and one bulk insert, the catalog is cached
+        with self.assertNumQueries(2):
+            self.player.replenish_simple_words()
+
+    def test_catalog_is_invalidated_when_words_change(self):
+        self.player.replenish_simple_words()
+        self.player.pool("simple_word").clear()
+        Word.objects.filter(isSimple=True).exclude(kind_of_word="verb").delete()
+        Word.objects.filter(kind_of_word="verb").first().delete()
+
+        self.player.replenish_simple_words()
+
+        self.assertEqual(self.pool_counts(), Counter({"verb": 5}))
+
+    def test_catalog_is_reloaded_after_a_change_in_another_process(self):
+        catalog.check_version(force=True)
+        verbs = len(catalog.simple_words().ids("verb"))
+        # Another process adds a word without signals and bumps the version
+        Word.objects.bulk_create(
+            [Word(word="leap", isSimple=True, kind_of_word="verb")]
+        )
+        CatalogVersion.bump()
+
+        # Not checked again before the interval is over
+        self.assertEqual(len(catalog.simple_words().ids("verb")), verbs)
+        with override_settings(GAME_CATALOG_CHECK_INTERVAL=0):
+            catalog.check_version()
+        self.assertEqual(len(catalog.simple_words().ids("verb")), verbs + 1)
+
+    def test_bump_version_after_commit(self):
+        version = CatalogVersion.current()
+        with self.captureOnCommitCallbacks(execute=True):
+            Word.objects.create(word="hop", isSimple=True, kind_of_word="verb")
+        self.assertEqual(CatalogVersion.current(), version + 1)
+
+
+@for_each_pool_storage
+class PopulateCharacterWithCreationChoicesTest(TestCase):
+    def build_catalog(self, size):
+        """Create a catalog whose row counts grow with `size`."""
+        for i in range(size * 10):
+            Question.objects.create(text=f"general_{size}_{i}")
+        activities = []
+        for a in range(2):
+            activity = Activity.objects.create(name=f"activity_{size}_{a}")
+            for i in range(size * 4):
+                activity.questions.add(
+                    Question.objects.create(text=f"a{a}_{size}_{i}", is_general=False)
+                )
+            activities.append(activity.id)
+        qualities = []
+        for q in range(3):
+            quality = Quality.objects.create(name=f"quality_{size}_{q}")
+            for i in range(size * 6):
+                quality.words.add(Word.objects.create(word=f"q{q}_{size}_{i}"))
+            qualities.append(quality.id)
+        interests = []
+        for n in range(3):
+            interest = Interest.objects.create(name=f"interest_{size}_{n}")
+            for night in range(1, size + 1):
+                NarrativeChoice.objects.create(
+                    name=f"choice_{night}", interest=interest, night_number=night
+                )
+            interests.append(interest.id)
+        for kind in Player.SIMPLE_WORD_TARGETS:
+            for i in range(size * 2):
+                Word.objects.create(
+                    word=f"{kind}_{size}_{i}", isSimple=True, kind_of_word=kind
+                )
+        return qualities, interests, activities
+
+    def populate(self, size):
+        qualities, interests, activities = self.build_catalog(size)
+        user = User.objects.create_user(username=f"populate_{size}")
+        player = Player.objects.create(
+            user=user, game_session=GameSession.objects.create()
+        )
+        with CaptureQueriesContext(connection) as queries:
+            player.populate_character_with_creation_choices(
+                [str(pk) for pk in qualities],
+                [str(pk) for pk in interests],
+                [str(pk) for pk in activities],
+            )
+        return player, len(queries)
+
+    def test_pools_are_filled(self):
+        player, _ = self.populate(5)
+
+        self.assertEqual(player.pool("question").count(), 50 + 2 * 6)
+        self.assertEqual(player.pool("character_word").count(), 3 * 15)
+        self.assertEqual(player.pool("narrative_choice").count(), 3 * 5)
+        self.assertEqual(
+            player.pool("simple_word").count(), sum(Player.SIMPLE_WORD_TARGETS.values())
+        )
+
+    def test_query_count_does_not_depend_on_catalog_size(self):
+        _, small = self.populate(3)
+        _, large = self.populate(12)
+
+        self.assertEqual(small, large)
+
+    @override_settings(GAME_POOL_STORAGE="packed")
+    def test_packed_pools_are_written_in_one_update(self):
+        player, _ = self.populate(5)
+        player.refresh_from_db()
+
+        self.assertEqual(len(player.question_ids), 50 + 2 * 6)
+        self.assertEqual(len(player.character_word_ids), 3 * 15)
+        self.assertFalse(
+            Player.question_pool.through.objects.filter(player=player).exists()
+        )
+
+
+class SamplingTest(TestCase):
+    def setUp(self):
+        self.questions = [Question.objects.create(text=f"q{i}") for i in range(40)]
+        self.activity = Activity.objects.create(name="Stargazing")
+        self.activity.questions.add(*self.questions[:10])
+
+    def test_sample_is_without_replacement(self):
+        ids = [q.id for q in self.questions]
+
+        chosen = sampling.sample(ids, 25)
+
+        self.assertEqual(len(set(chosen)), 25)
+        self.assertTrue(set(chosen) <= set(ids))
+        self.assertEqual(len(sampling.sample(ids[:2], 5)), 2)
+        self.assertEqual(sampling.sample([], 5), [])
+
+    def test_seeded_samples_are_reproducible(self):
+        ids = catalog.general_question_ids()
+
+        first = sampling.sample(ids, 10, sampling.rng(42, 1))
+        second = sampling.sample(ids, 10, sampling.rng(42, 1))
+        other_salt = sampling.sample(ids, 10, sampling.rng(42, 2))
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other_salt)
+
+    def test_sample_rows_fetches_only_chosen_rows(self):
+        with self.assertNumQueries(1):
+            rows = sampling.sample_rows(Question, [q.id for q in self.questions], 3)
+
+        self.assertEqual(len(rows), 3)
+        self.assertTrue(all(isinstance(row, Question) for row in rows))
+
+    def test_id_arrays_are_cached_until_the_catalog_changes(self):
+        catalog.general_question_ids()
+        catalog.activity_question_ids([self.activity.id])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(len(catalog.general_question_ids()), 40)
+            self.assertEqual(
+                len(
+                    catalog.activity_question_ids([self.activity.id])[self.activity.id]
+                ),
+                10,
+            )
+
+        self.activity.questions.add(Question.objects.create(text="new"))
+
+        self.assertEqual(len(catalog.general_question_ids()), 41)
+        self.assertEqual(
+            len(catalog.activity_question_ids([self.activity.id])[self.activity.id]), 11
+        )
+
+    def test_id_arrays_are_reloaded_after_a_change_in_another_process(self):
+        catalog.check_version(force=True)
+        catalog.activity_question_ids([self.activity.id])
+        # Another process links a question without signals
+        question = Question.objects.create(text="linked elsewhere")
+        catalog.check_version(force=True)
+        catalog.activity_question_ids([self.activity.id])
+        Activity.questions.through.objects.bulk_create(
+            [
+                Activity.questions.through(
+                    activity_id=self.activity.id, question_id=question.id
+                )
+            ]
+        )
+        CatalogVersion.bump()
+
+        with override_settings(GAME_CATALOG_CHECK_INTERVAL=0):
+            ids = catalog.activity_question_ids([self.activity.id])
+        self.assertIn(question.id, ids[self.activity.id])
+
+    def test_seeded_population_is_reproducible(self):
+        quality = Quality.objects.create(name="Brave")
+        quality.words.add(*[Word.objects.create(word=f"w{i}") for i in range(30)])
+        pools_by_seed = []
+        for name in ("first", "second"):
+            player = Player.objects.create(
+                user=User.objects.create_user(username=name),
+                game_session=GameSession.objects.create(),
+            )
+            player.populate_character_with_creation_choices(
+                [quality.id], [], [self.activity.id], seed=7
+            )
+            pools_by_seed.append(
+                (
+                    set(player.pool("question").ids()),
+                    set(player.pool("character_word").ids()),
+                )
+            )
+
+        self.assertEqual(pools_by_seed[0], pools_by_seed[1])
+
+
+@override_settings(GAME_POOL_STORAGE="derived")
+class DerivedPoolStorageTest(TestCase):
+    def setUp(self):
+        for i in range(80):
+            Question.objects.create(text=f"general {i}")
+        self.activity = Activity.objects.create(name="Hiking")
+        self.activity.questions.add(
+            *[
+                Question.objects.create(text=f"hike {i}", is_general=False)
+                for i in range(10)
+            ]
+        )
+        self.quality = Quality.objects.create(name="Curious")
+        self.quality.words.add(
+            *[Word.objects.create(word=f"curious{i}") for i in range(20)]
+        )
+        self.player = Player.objects.create(
+            user=User.objects.create_user(username="deriver"),
+            game_session=GameSession.objects.create(),
+        )
+        self.player.populate_character_with_creation_choices(
+            [self.quality.id], [], [self.activity.id], seed=99
+        )
+        self.player.refresh_from_db()
+
+    def test_only_seed_and_choices_are_stored(self):
+        self.assertEqual(self.player.pool_seed, 99)
+        self.assertEqual(
+            self.player.creation_choices,
+            {"qualities": [self.quality.id], "activities": [self.activity.id]},
+        )
+        self.assertEqual(self.player.question_ids, [])
+        for name in ("question", "character_word"):
+            through = getattr(Player, f"{name}_pool").through
+            self.assertFalse(through.objects.filter(player=self.player).exists())
+
+    def test_pools_are_derived_from_the_seed(self):
+        expected = pools.derive_pools(
+            99, [self.quality.id], [self.activity.id], self.player.catalog_snapshot
+        )
+
+        self.assertEqual(self.player.pool("question").ids(), expected["question"])
+        self.assertEqual(self.player.pool("question").count(), 66)
+        self.assertEqual(
+            self.player.pool("character_word").ids(), expected["character_word"]
+        )
+
+    def test_derivation_is_cached(self):
+        self.player.pool("question").ids()
+
+        with self.assertNumQueries(0):
+            self.player.pool("question").ids()
+            self.player.pool("character_word").ids()
+
+    def test_removed_ids_are_recorded_as_consumed(self):
+        question_id = self.player.pool("question").ids()[0]
+
+        self.player.pool("question").remove(question_id)
+        self.player.refresh_from_db()
+
+        self.assertEqual(self.player.consumed_ids, {"question": [question_id]})
+        self.assertNotIn(question_id, self.player.pool("question"))
+        self.assertEqual(self.player.pool("question").count(), 65)
+
+    def test_pools_are_pinned_to_the_catalog_snapshot(self):
+        questions = self.player.pool("question").ids()
+        words = self.player.pool("character_word").ids()
+
+        # Content ingested by another process, without signals
+        Question.objects.bulk_create(
+            [Question(text=f"late general {i}") for i in range(80)]
+        )
+        late_words = Word.objects.bulk_create(
+            [Word(word=f"late{i}") for i in range(20)]
+        )
+        Quality.words.through.objects.bulk_create(
+            [
+                Quality.words.through(quality_id=self.quality.id, word_id=word.id)
+                for word in late_words
+            ]
+        )
+        CatalogVersion.bump()
+        catalog.check_version(force=True)
+
+        self.assertEqual(self.player.pool("question").ids(), questions)
+        self.assertEqual(self.player.pool("character_word").ids(), words)
+
+    def test_a_deleted_row_is_replaced_in_the_pool(self):
+        questions = self.player.pool("question").ids()
+
+        Question.objects.filter(pk=questions[0]).delete()
+
+        # Another question comes in its place, the others stay
+        pool = self.player.pool("question").ids()
+        self.assertNotIn(questions[0], pool)
+        self.assertEqual(len(set(questions) - set(pool)), 1)
+        self.assertEqual(len(pool), 66)
+
+    def test_words_added_later_are_kept_on_top_of_the_derived_pool(self):
+        extra = Word.objects.create(word="moonlit")
+        derived_word = Word.objects.get(pk=self.player.pool("character_word").ids()[0])
+
+        self.player.pool("character_word").add(extra)
+        not_found = self.player.consume_words(f"{derived_word.word} moonlit moonlit")
+        self.player.refresh_from_db()
+
+        self.assertEqual(not_found, ["moonlit"])
+        self.assertNotIn(extra, self.player.pool("character_word"))
+        self.assertNotIn(derived_word, self.player.pool("character_word"))
+        self.assertEqual(self.player.pool("character_word").count(), 14)
+
+
+class CharacterIngestTest(TestCase):
+    def setUp(self):
+        self.pack = character_json_template_generator.generate_character()
+
+    def test_ingest(self):
+        report = character_ingest.ingest_json_data(self.pack)
+        self.assertEqual(report.created["Quality"], 8)
+        self.assertEqual(report.created["NarrativeChoice"], 9 * 25)
+        character = Character.objects.get(name="Eldritch Mendoza")
+        self.assertEqual(
+            list(character.quality_1_choices.values_list("name", flat=True)),
+            ["Decisive", "Intense", "Protective"],
+        )
+        self.assertEqual(Quality.objects.get(name="Loyal").words.count(), 15)
+        choice = NarrativeChoice.objects.get(name="Fashion_narrative_choice_3")
+        self.assertEqual(choice.night_number, 3)
+        self.assertEqual(choice.words.count(), 10)
+
+    def test_ingest_again_creates_nothing(self):
+        character_ingest.ingest_json_data(self.pack)
+        words = Word.objects.count()
+        with CaptureQueriesContext(connection) as queries:
+            report = character_ingest.ingest_json_data(self.pack)
+        self.assertEqual(sum(report.created.values()), 0)
+        self.assertEqual(Word.objects.count(), words)
+        # Batched lookups, not one query per row
+        self.assertLess(len(queries), 40)
+
+    def test_existing_rows_are_reused(self):
+        word = Word.objects.create(word="loyal_word_1", isSimple=True)
+        activity = Activity.objects.create(name="Work Out")
+        character_ingest.ingest_json_data(self.pack)
+        self.assertEqual(Word.objects.filter(word="loyal_word_1").count(), 1)
+        self.assertIn(word, Quality.objects.get(name="Loyal").words.all())
+        self.assertEqual(activity.questions.count(), 3)
+
+    def test_dry_run(self):
+        report = character_ingest.ingest_json_data(self.pack, dry_run=True)
+        self.assertEqual(report.created["Interest"], 9)
+        self.assertIn("link", report.timings)
+        self.assertFalse(Interest.objects.exists())
+
+    def test_unknown_choice_rolls_back(self):
+        self.pack["character"]["activity_2_choices"].append("Unknown Activity")
+        with self.assertRaises(Activity.DoesNotExist):
+            character_ingest.ingest_json_data(self.pack)
+        self.assertFalse(Word.objects.exists())
+
+    def write_packs(self, directory, count):
+        for i in range(count):
+            pack = character_json_template_generator.generate_character()
+            pack["character"]["name"] = f"Character {i}"
+            # Every pack repeats the vocabulary of the others
+            pack["qualities"][0]["words"].append(f"word_of_pack_{i}")
+            with open(os.path.join(directory, f"pack_{i}.json"), "w") as file:
+                json.dump(pack, file)
+
+    def test_command_ingests_a_directory_in_parallel(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.write_packs(directory, 3)
+            out = io.StringIO()
+            call_command("ingest_character", directory, "--workers=2", stdout=out)
+        self.assertEqual(Character.objects.count(), 3)
+        self.assertEqual(Quality.objects.get(name="Decisive").words.count(), 18)
+        self.assertEqual(Word.objects.filter(word="decisive_word_1").count(), 1)
+        self.assertIn("Files: 3", out.getvalue())
+        self.assertIn("read and validate", out.getvalue())
+
+    def test_command_reports_invalid_packs(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.write_packs(directory, 2)
+            with open(os.path.join(directory, "broken.json"), "w") as file:
+                json.dump({"qualities": []}, file)
+            with self.assertRaisesMessage(CommandError, "broken.json"):
+                call_command(
+                    "ingest_character",
+                    os.path.join(directory, "*.json"),
+                    stdout=io.StringIO(),
+                )
+        self.assertFalse(Character.objects.exists())
+
+    def test_validate_pack(self):
+        self.pack["interests"][1]["narrative_choices"][2]["night_number"] = "3"
+        with self.assertRaisesMessage(
+            ValueError, "interests[1].narrative_choices[2].night_number"
+        ):
+            content_packs.validate_pack(self.pack)
+
+    def test_stream_packs_reads_records_in_bounded_batches(self):
+        self.pack["version"] = {"nested": [1, 2.5, None]}
+        text = json.dumps(self.pack, indent=1)
+        for chunk_size in (1, 7, 4096):
+            packs = list(content_packs.stream_packs(io.StringIO(text), 40, chunk_size))
+            self.assertEqual(
+                content_packs.merge_packs(packs),
+                content_packs.merge_packs([content_packs.normalize_pack(self.pack)]),
+            )
+            # The character comes last, alone
+            self.assertEqual(list(packs[-1]["characters"]), ["Eldritch Mendoza"])
+            self.assertTrue(all(not pack["characters"] for pack in packs[:-1]))
+        self.assertGreater(len(packs), 5)
+
+    def test_stream_packs_rejects_invalid_records(self):
+        self.pack["activities"][2]["questions"] = "not a list"
+        with self.assertRaisesMessage(ValueError, "activities[2].questions"):
+            list(content_packs.stream_packs(io.StringIO(json.dumps(self.pack)), 40))
+
+    def test_command_streams_packs(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.write_packs(directory, 2)
+            out = io.StringIO()
+            call_command(
+                "ingest_character", directory, "--stream", "--batch-size=50", stdout=out
+            )
+        self.assertEqual(Character.objects.count(), 2)
+        self.assertEqual(Quality.objects.get(name="Decisive").words.count(), 17)
+        self.assertEqual(Word.objects.filter(word="decisive_word_1").count(), 1)
+        self.assertIn("rows/s", out.getvalue())
+
+    def test_generate_packs_is_deterministic(self):
+        options = dict(characters=5, qualities=30, simple_words={"verb": 4}, seed=3)
+        packs = character_json_template_generator.generate_packs(**options)
+        self.assertEqual(
+            packs, character_json_template_generator.generate_packs(**options)
+        )
+        self.assertNotEqual(
+            packs,
+            character_json_template_generator.generate_packs(**{**options, "seed": 4}),
+        )
+        for pack in packs:
+            content_packs.validate_pack(pack)
+        self.assertEqual(len(packs[0]["simple_words"]["verb"]), 4)
+        self.assertNotIn("simple_words", packs[1])
+        with self.assertRaises(ValueError):
+            character_json_template_generator.generate_packs(qualities=8)
+
+    def test_simple_words_are_ingested_once(self):
+        self.pack["simple_words"] = {"verb": ["run", "walk"], "article": ["the"]}
+        Word.objects.create(word="run", isSimple=True, kind_of_word="verb")
+        report = character_ingest.ingest_json_data(self.pack)
+        self.assertEqual(report.created["simple Word"], 2)
+        self.assertEqual(
+            catalog.simple_words().ids("verb"),
+            list(
+                Word.objects.filter(kind_of_word="verb")
+                .order_by("id")
+                .values_list("id", flat=True)
+            ),
+        )
+        character_ingest.ingest_json_data(self.pack)
+        self.assertEqual(Word.objects.filter(isSimple=True).count(), 3)
+
+    def test_command_generates_and_loads_content(self):
+        with tempfile.TemporaryDirectory() as directory:
+            call_command(
+                "generate_content",
+                "--characters=4",
+                "--qualities=12",
+                "--narrative-choices-per-interest=2",
+                "--simple-words",
+                "verb=6",
+                "pronoun=2",
+                f"--output={directory}",
+                "--load",
+                stdout=io.StringIO(),
+            )
+            self.assertEqual(len(os.listdir(directory)), 4)
+        self.assertEqual(Character.objects.count(), 4)
+        self.assertEqual(Quality.objects.count(), 12)
+        self.assertEqual(len(catalog.simple_words().ids("verb")), 6)
+
+
+class SimulateGamesTest(TestCase):
+    def test_plays_games_to_the_turn_limit_and_cleans_up(self):
+        call_command(
+            "generate_content",
+            "--characters=2",
+            "--narrative-choices-per-interest=2",
+            "--load",
+            stdout=io.StringIO(),
+        )
+        out = io.StringIO()
+        call_command("simulate_games", "--games=1", stdout=out)
+        output = out.getvalue()
+        for transition in (
+            "create_public_profile",
+            GameTurn.SELECT_QUESTION,
+            GameTurn.NARRATIVE_CHOICES,
+            "end_session",
+        ):
+            self.assertIn(transition, output)
+        # One question per player and turn up to the limit
+        self.assertRegex(
+            output, rf"select_question\s+{2 * (GameTurn.MAX_NUMBER_OF_TURNS - 1)}\s"
+        )
+        self.assertIn("Played 1 games", output)
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(GameSession.objects.exists())
+
+    def test_requires_content(self):
+        with self.assertRaisesMessage(CommandError, "generate_content"):
+            call_command("simulate_games", stdout=io.StringIO())
+
+    def test_narrative_choice_of_the_current_night(self):
+        interest = Interest.objects.create(name="Night")
+        first, second, other = [
+            NarrativeChoice.objects.create(
+                name=f"Choice {n}", interest=interest, night_number=night
+            )
+            for n, night in enumerate((1, 2, 2))
+        ]
+        user = User.objects.create_user(username="night_player")
+        player = Player.objects.create(
+            user=user, game_session=GameSession.objects.create()
+        )
+        player.pool("narrative_choice").add(first, second)
+        command = simulate_games.Command()
+        command.rng = random.Random(0)
+
+        self.assertEqual(command.narrative_choice(user, 1), str(first.pk))
+        self.assertEqual(command.narrative_choice(user, 2), str(second.pk))
+        # The last night of the content is offered again
+        self.assertEqual(command.narrative_choice(user, 5), str(second.pk))
+        # A choice of the catalog when the player has none
+        player.pool("narrative_choice").clear()
+        self.assertEqual(command.narrative_choice(user, 1), str(first.pk))
+        NarrativeChoice.objects.all().delete()
+        with self.assertRaisesMessage(CommandError, "night 1"):
+            command.narrative_choice(user, 1)
+
+
+class LoadTestWebsocketsTest(TransactionTestCase):
+    # The consumers run their queries in other threads, outside of the
+    # transaction of a TestCase
+
+    def test_plays_turns_over_websockets_and_cleans_up(self):
+        call_command(
+            "generate_content",
+            "--characters=2",
+            "--narrative-choices-per-interest=2",
+            "--load",
+            stdout=io.StringIO(),
+        )
+        out = io.StringIO()
+        call_command(
+            "load_test_websockets",
+            "--games=2",
+            "--turns=1",
+            "--watchers=1",
+            stdout=out,
+        )
+        output = out.getvalue()
+        # A question asked by each player of each game in the first turn,
+        # then a narrative choice each
+        for action in (
+            "submit_question",
+            "submit_answer",
+            "react_emoji",
+            "select_narrative",
+        ):
+            self.assertRegex(output, rf"{action}\s+4\s")
+        self.assertIn("6 connections opened", output)
+        self.assertIn("0 errors, 0 games timed out", output)
+        self.assertIn("16 actions in", output)
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(GameSession.objects.exists())
+
+
+class ReplayTraceTest(TransactionTestCase):
+    def setUp(self):
+        call_command(
+            "generate_content",
+            "--characters=2",
+            "--narrative-choices-per-interest=2",
+            "--load",
+            stdout=io.StringIO(),
+        )
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.trace = os.path.join(directory.name, "trace.jsonl")
+
+    def test_records_the_actions_and_replays_them(self):
+        with override_settings(GAME_TRACE_FILE=self.trace):
+            call_command(
+                "load_test_websockets", "--games=2", "--turns=1", stdout=io.StringIO()
+            )
+        # The lines are written by a background thread
+        tracing.flush()
+        with open(self.trace) as file:
+            entries = list(tracing.read_trace(file))
+        self.assertEqual(len(entries), 16)
+        self.assertEqual(len({entry["game_id"] for entry in entries}), 2)
+        self.assertEqual(entries[0]["action"], "submit_question")
+
+        # Not recorded when no trace file is set
+        call_command(
+            "load_test_websockets", "--games=1", "--turns=1", stdout=io.StringIO()
+        )
+        tracing.flush()
+        with open(self.trace) as file:
+            self.assertEqual(len(file.readlines()), 16)
+
+        for speed in ("max", "10"):
+            out = io.StringIO()
+            call_command("replay_trace", self.trace, f"--speed={speed}", stdout=out)
+            output = out.getvalue()
+            self.assertIn("0 errors, 0 games timed out", output)
+            self.assertIn("16 actions in", output)
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(GameSession.objects.exists())
+
+    def test_record_queues_the_line_for_the_writer_thread(self):
+        user = User.objects.create_user(username="traced")
+        with override_settings(GAME_TRACE_FILE=self.trace):
+            tracing.record("game", user, "submit_answer", "an answer")
+            tracing.record("game", user, "react_emoji", "🌑")
+        tracing.flush()
+        with open(self.trace) as file:
+            entries = list(tracing.read_trace(file))
+        self.assertEqual(
+            [(entry["user"], entry["action"]) for entry in entries],
+            [(user.pk, "submit_answer"), (user.pk, "react_emoji")],
+        )
+
+    def test_replaces_ids_from_another_database(self):
+        game_id = str(uuid4())
+        with open(self.trace, "w") as file:
+            for ts, user, action, value in (
+                (0.0, 101, "submit_question", -1),
+                (0.1, 102, "submit_answer", "an answer"),
+                (0.2, 101, "react_emoji", "🌑"),
+            ):
+                file.write(
+                    json.dumps(
+                        {
+                            "ts": ts,
+                            "game_id": game_id,
+                            "user": user,
+                            "action": action,
+                            "value": value,
+                        }
+                    )
+                    + "\n"
+                )
+        out = io.StringIO()
+        call_command("replay_trace", self.trace, "--speed=max", stdout=out)
+        output = out.getvalue()
+        self.assertIn("3 actions in", output)
+        self.assertIn("0 errors", output)
+        self.assertIn("1 recorded ids not in the player's pool were replaced", output)
+
+    def test_rejects_invalid_traces(self):
+        with open(self.trace, "w") as file:
+            file.write('{"ts": 0, "action": "submit_answer"}\n')
+        with self.assertRaisesMessage(CommandError, "Line 1"):
+            call_command("replay_trace", self.trace, stdout=io.StringIO())
+        with self.assertRaises(CommandError):
+            call_command("replay_trace", self.trace, "--speed=0", stdout=io.StringIO())
+
+
+@for_each_pool_storage
+class QueryBudgetTest(QueryBudgetMixin, TestCase):
+    """
+    The most queries each game action, GameProgressView state and
+    CharacterCreationView step may make, whatever the size of the content,
+    the pools and the chat (see game/testing.py).
+    """
+
+    GAME_TURN_BUDGETS = {
+        GameTurn.SELECT_QUESTION: 7,
+        GameTurn.ANSWER_QUESTION: 7,
+        # The first reaction looks up the summary row, inserts it as it is
+        # missing, locks and updates it
+        GameTurn.REACT_EMOJI: 9,
+        GameTurn.NARRATIVE_CHOICES: 7,
+        GameTurn.MOON_PHASE: 8,
+    }
+    GAME_PROGRESS_BUDGETS = {
+        GameTurn.SELECT_QUESTION: 21,
+        GameTurn.ANSWER_QUESTION: 20,
+        GameTurn.REACT_EMOJI: 20,
+        GameTurn.NARRATIVE_CHOICES: 20,
+        GameTurn.MOON_PHASE: 21,
+        GameSession.ENDED: 4,
+    }
+    # States whose action changes the pools of the acting player
+    POOL_CHANGE_STATES = (
+        GameTurn.SELECT_QUESTION,
+        GameTurn.ANSWER_QUESTION,
+        GameTurn.MOON_PHASE,
+    )
+    CHARACTER_CREATION_BUDGETS = {
+        ("GET", Player.CHARACTER_AVATAR_SELECTION): 7,
+        ("POST", Player.CHARACTER_AVATAR_SELECTION): 8,
+        ("GET", Player.MOON_MEANING_SELECTION): 6,
+        ("POST", Player.MOON_MEANING_SELECTION): 8,
+        ("GET", Player.PUBLIC_PROFILE_CREATION): 15,
+        ("POST", Player.PUBLIC_PROFILE_CREATION): 24,
+    }
+
+    @property
+    def relational(self):
+        return pools.default_pool_storage() == pools.RELATIONAL
+
+    def build_content(self, scale):
+        packs = character_json_template_generator.generate_packs(
+            characters=2 * scale,
+            words_per_quality=5 * scale,
+            questions_per_activity=2 * scale,
+            narrative_choices_per_interest=2 * scale,
+            words_per_narrative_choice=3 * scale,
+            simple_words={
+                kind: count * scale
+                for kind, count in Player.SIMPLE_WORD_TARGETS.items()
+            },
+        )
+        character_ingest.ingest_packs(
+            [content_packs.merge_packs(map(content_packs.normalize_pack, packs))]
+        )
+
+    def build_session(self, scale):
+        """Return a game in character creation and its two users."""
+        self.build_content(scale)
+        users = [User.objects.create_user(username=f"budget_{s}") for s in "ab"]
+        game_session = GameSession()
+        game_session.save()
+        game_session.playerA, game_session.playerB = [
+            Player.objects.create(user=user, game_session=game_session)
+            for user in users
+        ]
+        game_session.save()
+        game_session.initialize_game()
+        game_session.save()
+        return game_session, users
+
+    def create_character(self, player, character):
+        player.select_character_avatar(character)
+        player.select_moon_meaning(
+            MoonSignInterpretation.objects.create(
+                on_player=player,
+                new_moon="positive",
+                first_quarter="ambiguous",
+                full_moon="negative",
+                last_quarter="ambiguous",
+            )
+        )
+        player.create_public_profile(**self.profile_choices(character))
+        player.save()
+
+    def profile_choices(self, character):
+        def first(kind, count):
+            return [
+                getattr(character, f"{kind}_{n}_choices").first().pk
+                for n in range(1, count + 1)
+            ]
+
+        return {
+            "qualities": first("quality", 3),
+            "interests": first("interest", 3),
+            "activities": first("activity", 2),
+        }
+
+    def build_game(self, scale, state):
+        """
+        Return a game whose turn is in `state`, with 5 * `scale` chat
+        messages, at the action of the second player of the state.
+        """
+        game_session, users = self.build_session(scale)
+        players = [game_session.playerA, game_session.playerB]
+        for player, character in zip(players, Character.objects.order_by("id")):
+            self.create_character(player, character)
+        game_session.start_regular_turn()
+        game_session.save()
+        ChatMessage.objects.bulk_create(
+            ChatMessage(game=game_session, seq=seq, sender="budget_a", text="hi")
+            for seq in range(1, 5 * scale + 1)
+        )
+
+        # The player who acts, A for the question and the emoji, else B
+        acting = 0 if state in (GameTurn.SELECT_QUESTION, GameTurn.REACT_EMOJI) else 1
+        turn = {
+            "state": state,
+            "active_player": players[acting],
+            "active_slot": (GameTurn.PLAYER_A, GameTurn.PLAYER_B)[acting],
+            "player_a_narrative_choice_made": True,
+            "player_a_moon_phase_message_written": True,
+        }
+        if state == GameTurn.MOON_PHASE:
+            sequence = moon_phase_turn_sequence(full_moon_turn_number=1)
+            sequence.build_turn_phases()
+            sequence.save()
+            turn["moon_phase_turn_sequence"] = sequence
+        GameTurn.objects.filter(pk=game_session.current_game_turn_id).update(**turn)
+        return game_session, users, users[acting]
+
+    def message(self, user):
+        ids = user.player.pool("character_word").ids()[:3]
+        return " ".join(Word.objects.filter(id__in=ids).values_list("word", flat=True))
+
+    def test_game_turn_transitions(self):
+        for state, budget in self.GAME_TURN_BUDGETS.items():
+            if state in self.POOL_CHANGE_STATES and not self.relational:
+                # The player row is locked before its pool arrays change
+                budget += 1
+
+            def build(scale):
+                game_session, _, user = self.build_game(scale, state)
+                consumer = GameConsumer()
+                consumer.game_id = str(game_session.game_id)
+                player = Player.objects.get(user=user)
+                if state == GameTurn.SELECT_QUESTION:
+                    question = Question.objects.get(pk=player.pool("question").ids()[0])
+
+                    def action():
+                        player = consumer.get_player_sync(user)
+                        player.pool("question").remove(question)
+                        consumer.select_question_sync(question.pk, player)
+
+                    return action
+                handler, value = {
+                    GameTurn.ANSWER_QUESTION: (
+                        consumer.answer_question_sync,
+                        self.message(user),
+                    ),
+                    GameTurn.REACT_EMOJI: (consumer.react_with_emoji_sync, "🌕"),
+                    GameTurn.NARRATIVE_CHOICES: (
+                        consumer.make_narrative_choice_sync,
+                        str(player.pool("narrative_choice").ids()[0]),
+                    ),
+                    GameTurn.MOON_PHASE: (
+                        consumer.write_message_about_moon_phase_sync,
+                        self.message(user),
+                    ),
+                }[state]
+                return lambda: handler(value, consumer.get_player_sync(user))
+
+            with self.subTest(state=state):
+                self.assertQueryBudget(budget, build)
+
+    def test_game_progress_view_states(self):
+        for state, budget in self.GAME_PROGRESS_BUDGETS.items():
+
+            def build(scale):
+                if state == GameSession.ENDED:
+                    game_session, users, _ = self.build_game(
+                        scale, GameTurn.SELECT_QUESTION
+                    )
+                    game_session.refresh_from_db()
+                    game_session.end_session()
+                    game_session.save()
+                else:
+                    game_session, users, _ = self.build_game(scale, state)
+                    # Renders after the first find the derived pools cached
+                    for user in users:
+                        player = Player.objects.get(user=user)
+                        for name in pools.DERIVED_POOLS:
+                            player.pool(name).ids()
+                self.client.force_login(users[1])
+                url = reverse("game_progress", args=[game_session.game_id])
+                return lambda: self.client.get(url)
+
+            with self.subTest(state=state):
+                for response in self.assertQueryBudget(budget, build).values():
+                    self.assertEqual(response.status_code, 200)
+
+    def test_character_creation_view_steps(self):
+        for (method, step), budget in self.CHARACTER_CREATION_BUDGETS.items():
+
+            def build(scale):
+                game_session, users = self.build_session(scale)
+                player = users[0].player
+                character = Character.objects.order_by("id").first()
+                data = {"character": character.pk}
+                if step != Player.CHARACTER_AVATAR_SELECTION:
+                    player.select_character_avatar(character)
+                    data = {
+                        "new_moon": "positive",
+                        "first_quarter": "ambiguous",
+                        "full_moon": "negative",
+                        "last_quarter": "ambiguous",
+                        **{
+                            f"{phase}_reason": "budget"
+                            for phase in ReactionSummary.EMOJI_PHASES.values()
+                        },
+                    }
+                if step == Player.PUBLIC_PROFILE_CREATION:
+                    self.create_character(game_session.playerB, character)
+                    player.select_moon_meaning(
+                        MoonSignInterpretation.objects.create(on_player=player)
+                    )
+                    choices = self.profile_choices(character)
+                    data = {
+                        f"{kind}_{n}": pk
+                        for kind, field in (
+                            ("quality", "qualities"),
+                            ("interest", "interests"),
+                            ("activity", "activities"),
+                        )
+                        for n, pk in enumerate(choices[field], 1)
+                    }
+                player.save()
+                self.client.force_login(users[0])
+                url = reverse("character_creation", args=[game_session.game_id])
+                if method == "GET":
+                    return lambda: self.client.get(url)
+                return lambda: self.client.post(url, data)
+
+            with self.subTest(method=method, step=step):
+                for response in self.assertQueryBudget(budget, build).values():
+                    self.assertIn(response.status_code, (200, 302))
+
+    def test_over_budget_and_growth_fail_with_the_sql(self):
+        def build(scale):
+            words = Word.objects.bulk_create(
+                Word(word=f"word {i}") for i in range(scale)
+            )
+            return lambda: [Word.objects.get(pk=word.pk) for word in words]
+
+        with self.assertRaisesMessage(AssertionError, "over the budget of 2"):
+            self.assertQueryBudget(2, build, scales=(3,))
+        with self.assertRaisesMessage(AssertionError, "grow from 1 at scale 1"):
+            self.assertQueryBudget(20, build, scales=(1, 3))
+        self.assertEqual(
+            normalize_sql("SELECT 1 FROM a WHERE b IN (1, 2, 'c') AND d = 'e''f'"),
+            "SELECT ? FROM a WHERE b IN (?, ...) AND d = ?",
+        )
@@ -1,4 +1,27 @@
+"""
+Ingestion of character content packs (see character_json_template_generator).
+
+A pack is ingested in one transaction with a number of queries that does not
+depend on its size: the rows that exist already are looked up by name in
+batches, the missing ones are created with bulk_create and the relations are
+linked with bulk inserts into the through tables. Rows are matched as
+get_or_create used to match them (qualities, activities and interests by
+name, words by word, questions by text, narrative choices by interest, name
+and night number), the oldest row winning when there are duplicates. Simple
+words are matched among the simple words by word and kind of word.
+"""
+
+import itertools
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+from django.db import transaction
+
+from game import catalog
+from game.tools.content_packs import normalize_pack, stream_packs
 from game.models import (
+    CatalogVersion,
     Quality,
     Word,
     Activity,
@@ -8,58 +31,341 @@ from game.models import (
     Question,
 )
 
+# Values per IN lookup and rows per INSERT
+BATCH_SIZE = 500
+
+# Words, questions and narrative choices written at a time by ingest_stream
+STREAM_BATCH_SIZE = 20000
+
+# Character relation -> model of the names listed in the pack, see
+# content_packs.CHOICE_FIELDS
+CHOICE_FIELDS = {
+    "quality_1_choices": Quality,
+    "quality_2_choices": Quality,
+    "quality_3_choices": Quality,
+    "interest_1_choices": Interest,
+    "interest_2_choices": Interest,
+    "interest_3_choices": Interest,
+    "activity_1_choices": Activity,
+    "activity_2_choices": Activity,
+}
+
+
+class IngestReport:
+    """Rows found and created per model, links made and time per phase."""
+
+    def __init__(self):
+        self.existing = Counter()
+        self.created = Counter()
+        self.links = Counter()
+        self.timings = {}
+        self.batches = 0
+        self.elapsed = 0
+
+    @property
+    def rows(self):
+        return (
+            sum(self.existing.values())
+            + sum(self.created.values())
+            + sum(self.links.values())
+        )
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0) + time.perf_counter() - start
+
+    def lines(self):
+        for model in self.existing.keys() | self.created.keys():
+            yield (
+                f"{model}: {self.created[model]} created, "
+                f"{self.existing[model]} existing"
+            )
+        for relation, count in self.links.items():
+            yield f"{relation}: {count} links"
+        for name, seconds in self.timings.items():
+            yield f"{name}: {seconds * 1000:.1f} ms"
+        if self.elapsed:
+            yield (
+                f"{self.rows} rows in {self.batches} batches, "
+                f"{self.elapsed * 1000:.1f} ms ({self.rows / self.elapsed:.0f} rows/s)"
+            )
+
+
+def ingest_json_data(json_data, dry_run=False):
+    """
+    Ingest one pack and return its IngestReport. A dry run makes all the
+    writes and rolls them back, so the report is that of a real run.
+    """
+    return ingest_packs([normalize_pack(json_data)], dry_run=dry_run)
+
+
+def ingest_packs(packs, dry_run=False):
+    """Ingest packs from content_packs.normalize_pack in one transaction."""
+    return _ingest([packs], dry_run)
+
+
+def ingest_stream(paths, batch_size=STREAM_BATCH_SIZE, dry_run=False):
+    """
+    Ingest the packs in the files at `paths` one after the other, in one
+    transaction. Each file is read record by record (see
+    content_packs.stream_packs) and every batch of about `batch_size` words,
+    questions and narrative choices is written as soon as it is read, so
+    memory does not grow with the size of the files.
+    """
 
-def ingest_json_data(json_data):
-    # Iterate through the qualities, activities, interests, and character data
-    for quality_data in json_data["qualities"]:
-        quality, created = Quality.objects.get_or_create(name=quality_data["name"])
-        for word in quality_data["words"]:
-            word_obj, created = Word.objects.get_or_create(word=word)
-            quality.words.add(word_obj)
-
-    for activity_data in json_data["activities"]:
-        activity, created = Activity.objects.get_or_create(name=activity_data["name"])
-        for question in activity_data["questions"]:
-            question_obj, created = Question.objects.get_or_create(text=question)
-            activity.questions.add(question_obj)
-
-    for interest_data in json_data["interests"]:
-        interest, created = Interest.objects.get_or_create(name=interest_data["name"])
-        for narrative_choice_data in interest_data["narrative_choices"]:
-            narrative_choice, created = NarrativeChoice.objects.get_or_create(
-                name=narrative_choice_data["name"],
-                interest=interest,
-                night_number=narrative_choice_data["night_number"],
+    def batches():
+        for path in paths:
+            with open(path, "r") as file:
+                for pack in stream_packs(file, batch_size):
+                    yield [pack]
+
+    return _ingest(batches(), dry_run, read_phase="read")
+
+
+def _ingest(batches, dry_run, read_phase=None):
+    report = IngestReport()
+    start = time.perf_counter()
+    with transaction.atomic():
+        batches = iter(batches)
+        while True:
+            with report.phase(read_phase) if read_phase else nullcontext():
+                packs = next(batches, None)
+            if packs is None:
+                break
+            _write(packs, report)
+            report.batches += 1
+        # Tells the other processes to reload their indexes
+        CatalogVersion.bump()
+        if dry_run:
+            transaction.set_rollback(True)
+    report.elapsed = time.perf_counter() - start
+    if not dry_run:
+        # Bulk writes send no signals, see game/signals.py
+        catalog.invalidate_simple_words()
+        catalog.invalidate_id_arrays()
+    return report
+
+
+def _write(packs, report):
+    qualities = [pack["qualities"] for pack in packs]
+    activities = [pack["activities"] for pack in packs]
+    interests = [pack["interests"] for pack in packs]
+    characters = [pack["characters"] for pack in packs]
+
+    with report.phase("lookup and create"):
+        quality_words = [
+            word for pack in qualities for words in pack.values() for word in words
+        ]
+        choice_words = [
+            word
+            for pack in interests
+            for choices in pack.values()
+            for _, _, words in choices
+            for word in words
+        ]
+        word_ids = _resolve(Word, "word", quality_words + choice_words, report)
+        question_ids = _resolve(
+            Question,
+            "text",
+            [q for pack in activities for qs in pack.values() for q in qs],
+            report,
+        )
+        quality_ids = _resolve(
+            Quality, "name", [name for pack in qualities for name in pack], report
+        )
+        activity_ids = _resolve(
+            Activity, "name", [name for pack in activities for name in pack], report
+        )
+        interest_ids = _resolve(
+            Interest, "name", [name for pack in interests for name in pack], report
+        )
+        choice_ids = _resolve_narrative_choices(
+            [
+                (interest_ids[interest], name, night_number)
+                for pack in interests
+                for interest, choices in pack.items()
+                for name, night_number, _ in choices
+            ],
+            report,
+        )
+        character_ids = _resolve(
+            Character, "name", [name for pack in characters for name in pack], report
+        )
+        _resolve_simple_words(
+            [
+                (word, kind)
+                for pack in packs
+                for kind, words in pack["simple_words"].items()
+                for word in words
+            ],
+            report,
+        )
+
+    with report.phase("link"):
+        _link(
+            Quality,
+            "words",
+            [
+                (quality_ids[quality], word_ids[word])
+                for pack in qualities
+                for quality, words in pack.items()
+                for word in words
+            ],
+            report,
+        )
+        _link(
+            Activity,
+            "questions",
+            [
+                (activity_ids[activity], question_ids[question])
+                for pack in activities
+                for activity, questions in pack.items()
+                for question in questions
+            ],
+            report,
+        )
+        _link(
+            NarrativeChoice,
+            "words",
+            [
+                (
+                    choice_ids[interest_ids[interest], name, night_number],
+                    word_ids[word],
+                )
+                for pack in interests
+                for interest, choices in pack.items()
+                for name, night_number, words in choices
+                for word in words
+            ],
+            report,
+        )
+        ids_by_model = {
+            Quality: quality_ids,
+            Interest: interest_ids,
+            Activity: activity_ids,
+        }
+        for field, model in CHOICE_FIELDS.items():
+            # The choices must exist, in this pack or in the database
+            ids = ids_by_model[model]
+            missing = {
+                name
+                for pack in characters
+                for choices in pack.values()
+                for name in choices[field]
+                if name not in ids
+            }
+            ids.update(_lookup(model, "name", missing))
+            for name in missing - ids.keys():
+                raise model.DoesNotExist(f"{model.__name__} {name!r} does not exist.")
+            _link(
+                Character,
+                field,
+                [
+                    (character_ids[character], ids[name])
+                    for pack in characters
+                    for character, choices in pack.items()
+                    for name in choices[field]
+                ],
+                report,
+            )
+
+
+def _batches(values):
+    values = iter(values)
+    while batch := list(itertools.islice(values, BATCH_SIZE)):
+        yield batch
+
+
+def _lookup(model, field, values):
+    """Return {value: id} of the rows of `model` whose `field` is in `values`."""
+    ids = {}
+    for batch in _batches(values):
+        rows = (
+            model.objects.filter(**{f"{field}__in": batch})
+            .order_by("id")
+            .values_list(field, "id")
+        )
+        for value, pk in rows:
+            ids.setdefault(value, pk)
+    return ids
+
+
+def _resolve(model, field, values, report):
+    """Return {value: id} for `values`, creating the rows that are missing."""
+    values = list(dict.fromkeys(values))
+    ids = _lookup(model, field, values)
+    missing = [model(**{field: value}) for value in values if value not in ids]
+    model.objects.bulk_create(missing, batch_size=BATCH_SIZE)
+    ids.update((getattr(row, field), row.pk) for row in missing)
+    report.existing[model.__name__] += len(values) - len(missing)
+    report.created[model.__name__] += len(missing)
+    return ids
+
+
+def _resolve_narrative_choices(keys, report):
+    """Return {(interest id, name, night number): id}, like _resolve."""
+    keys = list(dict.fromkeys(keys))
+    ids = {}
+    for batch in _batches({interest_id for interest_id, _, _ in keys}):
+        rows = (
+            NarrativeChoice.objects.filter(interest_id__in=batch)
+            .order_by("id")
+            .values_list("interest_id", "name", "night_number", "id")
+        )
+        for interest_id, name, night_number, pk in rows:
+            ids.setdefault((interest_id, name, night_number), pk)
+    missing = [
+        NarrativeChoice(interest_id=interest_id, name=name, night_number=night_number)
+        for interest_id, name, night_number in keys
+        if (interest_id, name, night_number) not in ids
+    ]
+    NarrativeChoice.objects.bulk_create(missing, batch_size=BATCH_SIZE)
+    ids.update(
+        ((row.interest_id, row.name, row.night_number), row.pk) for row in missing
+    )
+    report.existing["NarrativeChoice"] += len(keys) - len(missing)
+    report.created["NarrativeChoice"] += len(missing)
+    return ids
+
+
+def _resolve_simple_words(keys, report):
+    """Create the simple words (word, kind of word) in `keys` that are missing."""
+    keys = list(dict.fromkeys(keys))
+    existing = set()
+    for batch in _batches({word for word, _ in keys}):
+        existing.update(
+            Word.objects.filter(isSimple=True, word__in=batch).values_list(
+                "word", "kind_of_word"
             )
-            for word in narrative_choice_data["words"]:
-                word_obj, created = Word.objects.get_or_create(word=word)
-                narrative_choice.words.add(word_obj)
-
-    character_data = json_data["character"]
-    character, created = Character.objects.get_or_create(name=character_data["name"])
-    # Attach qualities, interests, and activities to the character
-    # For example:
-    for quality_name in character_data["quality_1_choices"]:
-        quality = Quality.objects.get(name=quality_name)
-        character.quality_1_choices.add(quality)
-    for quality_name in character_data["quality_2_choices"]:
-        quality = Quality.objects.get(name=quality_name)
-        character.quality_2_choices.add(quality)
-    for quality_name in character_data["quality_3_choices"]:
-        quality = Quality.objects.get(name=quality_name)
-        character.quality_3_choices.add(quality)
-    for interest_name in character_data["interest_1_choices"]:
-        interest = Interest.objects.get(name=interest_name)
-        character.interest_1_choices.add(interest)
-    for interest_name in character_data["interest_2_choices"]:
-        interest = Interest.objects.get(name=interest_name)
-        character.interest_2_choices.add(interest)
-    for interest_name in character_data["interest_3_choices"]:
-        interest = Interest.objects.get(name=interest_name)
-        character.interest_3_choices.add(interest)
-    for activity_name in character_data["activity_1_choices"]:
-        activity = Activity.objects.get(name=activity_name)
-        character.activity_1_choices.add(activity)
-    for activity_name in character_data["activity_2_choices"]:
-        activity = Activity.objects.get(name=activity_name)
-        character.activity_2_choices.add(activity)
+        )
+    missing = [
+        Word(word=word, kind_of_word=kind, isSimple=True)
+        for word, kind in keys
+        if (word, kind) not in existing
+    ]
+    Word.objects.bulk_create(missing, batch_size=BATCH_SIZE)
+    report.existing["simple Word"] += len(keys) - len(missing)
+    report.created["simple Word"] += len(missing)
+
+
+def _link(model, name, pairs, report):
+    """Add the (owner id, target id) `pairs` to the relation `name` of `model`."""
+    field = model._meta.get_field(name)
+    through = field.remote_field.through
+    owner = f"{field.m2m_field_name()}_id"
+    target = f"{field.m2m_reverse_field_name()}_id"
+    pairs = list(dict.fromkeys(pairs))
+    # Links that exist already are skipped, as add() does
+    through.objects.bulk_create(
+        [
+            through(**{owner: owner_id, target: target_id})
+            for owner_id, target_id in pairs
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    report.links[f"{model.__name__}.{name}"] += len(pairs)
@@ -1,4 +1,13 @@
+"""
+Character packs with generated content.
+
+generate_character returns the pack of one fixed character. generate_packs
+returns any number of characters drawn from a vocabulary of a given size,
+for benchmarks; the same arguments and seed always give the same packs.
+"""
+
 import json
+import random
 
 CHARACTER_NAME = "Eldritch Mendoza"
 QUALITIES = [
@@ -36,6 +45,11 @@ QUESTIONS_PER_ACTIVITY = 3
 NARRATIVE_CHOICES_PER_INTEREST = 25
 WORDS_PER_NARRATIVE_CHOICE = 10
 
+# Names chosen by a character for each of its choice fields
+CHOICES_PER_QUALITY_FIELD = 3
+CHOICES_PER_INTEREST_FIELD = 3
+CHOICES_PER_ACTIVITY_FIELD = 2
+
 
 def generate_words(argument, number):
     argument = argument.lower().replace(" ", "_")
@@ -103,6 +117,105 @@ def generate_character():
     }
 
 
+def generate_simple_words(counts):
+    """Return {kind_of_word: [word, ...]} with `counts[kind]` words of a kind."""
+    return {
+        kind: generate_words(f"simple_{kind}", count) for kind, count in counts.items()
+    }
+
+
+def _names(defaults, prefix, number):
+    names = list(dict.fromkeys(defaults))[:number]
+    return names + [f"{prefix} {i}" for i in range(len(names) + 1, number + 1)]
+
+
+def _split(names, size):
+    groups = []
+    for start in range(0, len(names), size):
+        end = start + size
+        groups.append(names[start:end])
+    return groups
+
+
+def generate_packs(
+    characters=1,
+    qualities=len(QUALITIES),
+    words_per_quality=WORDS_PER_QUALITY,
+    activities=len(ACTIVITIES),
+    questions_per_activity=QUESTIONS_PER_ACTIVITY,
+    interests=len(INTERESTS),
+    narrative_choices_per_interest=NARRATIVE_CHOICES_PER_INTEREST,
+    words_per_narrative_choice=WORDS_PER_NARRATIVE_CHOICE,
+    simple_words=None,
+    seed=0,
+):
+    """
+    Return the packs of `characters` characters. The qualities, activities
+    and interests form a shared vocabulary of the given sizes, from which
+    every character draws its choices at random; a pack holds the records of
+    the names its character chooses. The simple words, {kind_of_word:
+    count}, are in the first pack.
+    """
+    quality_names = _names(QUALITIES, "Quality", qualities)
+    activity_names = _names(ACTIVITIES, "Activity", activities)
+    interest_names = _names(INTERESTS, "Interest", interests)
+    needed = {
+        "qualities": (quality_names, 3 * CHOICES_PER_QUALITY_FIELD),
+        "activities": (activity_names, 2 * CHOICES_PER_ACTIVITY_FIELD),
+        "interests": (interest_names, 3 * CHOICES_PER_INTEREST_FIELD),
+    }
+    for section, (names, count) in needed.items():
+        if len(names) < count:
+            raise ValueError(f"A character needs at least {count} {section}.")
+
+    rng = random.Random(seed)
+    packs = []
+    for i in range(1, characters + 1):
+        chosen_qualities = rng.sample(quality_names, 3 * CHOICES_PER_QUALITY_FIELD)
+        chosen_interests = rng.sample(interest_names, 3 * CHOICES_PER_INTEREST_FIELD)
+        chosen_activities = rng.sample(activity_names, 2 * CHOICES_PER_ACTIVITY_FIELD)
+        quality_choices = _split(chosen_qualities, CHOICES_PER_QUALITY_FIELD)
+        interest_choices = _split(chosen_interests, CHOICES_PER_INTEREST_FIELD)
+        activity_choices = _split(chosen_activities, CHOICES_PER_ACTIVITY_FIELD)
+        character = {"name": f"Character {i}"}
+        for n, names in enumerate(quality_choices, 1):
+            character[f"quality_{n}_choices"] = names
+        for n, names in enumerate(interest_choices, 1):
+            character[f"interest_{n}_choices"] = names
+        for n, names in enumerate(activity_choices, 1):
+            character[f"activity_{n}_choices"] = names
+
+        pack = {
+            "character": character,
+            "qualities": [
+                {"name": quality, "words": generate_words(quality, words_per_quality)}
+                for quality in chosen_qualities
+            ],
+            "activities": [
+                {
+                    "name": activity,
+                    "questions": generate_questions(activity, questions_per_activity),
+                }
+                for activity in chosen_activities
+            ],
+            "interests": [
+                {
+                    "name": interest,
+                    "narrative_choices": generate_narrative_choices(
+                        interest,
+                        narrative_choices_per_interest,
+                        words_per_narrative_choice,
+                    ),
+                }
+                for interest in chosen_interests
+            ],
+        }
+        if i == 1 and simple_words:
+            pack["simple_words"] = generate_simple_words(simple_words)
+        packs.append(pack)
+    return packs
+
+
 def main():
     character_data = generate_character()
     with open("new_character.json", "w") as file:
@@ -0,0 +1,322 @@
+"""
+Reading, validating and merging character content packs.
+
+A pack is the JSON document of one character (see
+character_json_template_generator). This module only deals with plain data
+and does not use the database, so packs can be read in worker processes; see
+character_ingest for writing them.
+"""
+
+import json
+import re
+
+# Characters read at a time by stream_records
+CHUNK_SIZE = 64 * 1024
+
+_NOT_WHITESPACE = re.compile(r"[^ \t\n\r]")
+
+# Top-level sections of a pack that are lists of records
+RECORD_SECTIONS = ("qualities", "activities", "interests")
+
+# Relations of a character to the names of its qualities, interests and
+# activities
+CHOICE_FIELDS = (
+    "quality_1_choices",
+    "quality_2_choices",
+    "quality_3_choices",
+    "interest_1_choices",
+    "interest_2_choices",
+    "interest_3_choices",
+    "activity_1_choices",
+    "activity_2_choices",
+)
+
+
+def validate_pack(json_data):
+    """Raise ValueError naming the first part of `json_data` that is invalid."""
+    if not isinstance(json_data, dict):
+        raise ValueError("The pack is not a JSON object.")
+    for section in RECORD_SECTIONS:
+        if not isinstance(json_data.get(section), list):
+            raise ValueError(f"{section!r} is not a list.")
+        for i, record in enumerate(json_data[section]):
+            validate_record(section, record, f"{section}[{i}]")
+    validate_record("character", json_data.get("character"), "character")
+    if "simple_words" in json_data:
+        validate_record("simple_words", json_data["simple_words"], "simple_words")
+
+
+def validate_record(section, record, where):
+    """Raise ValueError if `record` is not a valid record of `section`."""
+    if section == "qualities":
+        _check_record(record, where, name=str, words=list)
+        _check_strings(record["words"], f"{where}.words")
+    elif section == "activities":
+        _check_record(record, where, name=str, questions=list)
+        _check_strings(record["questions"], f"{where}.questions")
+    elif section == "interests":
+        _check_record(record, where, name=str, narrative_choices=list)
+        for j, choice_data in enumerate(record["narrative_choices"]):
+            choice_where = f"{where}.narrative_choices[{j}]"
+            _check_record(
+                choice_data, choice_where, name=str, night_number=int, words=list
+            )
+            _check_strings(choice_data["words"], f"{choice_where}.words")
+    elif section == "character":
+        _check_record(
+            record, where, name=str, **{field: list for field in CHOICE_FIELDS}
+        )
+        for field in CHOICE_FIELDS:
+            _check_strings(record[field], f"{where}.{field}")
+    elif section == "simple_words":
+        # kind_of_word -> words
+        if not isinstance(record, dict):
+            raise ValueError(f"{where} is not a JSON object.")
+        for kind, words in record.items():
+            if not isinstance(words, list):
+                raise ValueError(f"{where}.{kind} is not a list.")
+            _check_strings(words, f"{where}.{kind}")
+
+
+def _check_record(record, where, **fields):
+    if not isinstance(record, dict):
+        raise ValueError(f"{where} is not a JSON object.")
+    for field, field_type in fields.items():
+        value = record.get(field)
+        # bool is an int too
+        if not isinstance(value, field_type) or isinstance(value, bool):
+            raise ValueError(f"{where}.{field} is not a {field_type.__name__}.")
+
+
+def _check_strings(values, where):
+    if not all(isinstance(value, str) for value in values):
+        raise ValueError(f"{where} has values that are not strings.")
+
+
+def normalize_pack(json_data):
+    """
+    Return the content of a pack as plain data, in the order of the pack:
+
+        {"qualities": {name: [word, ...]},
+         "activities": {name: [question, ...]},
+         "interests": {name: [(choice name, night number, [word, ...]), ...]},
+         "characters": {name: {choice field: [name, ...]}},
+         "simple_words": {kind of word: [word, ...]}}
+    """
+    pack = _empty_pack()
+    for section in RECORD_SECTIONS:
+        for record in json_data[section]:
+            _add_record(pack, section, record)
+    _add_record(pack, "character", json_data["character"])
+    _add_record(pack, "simple_words", json_data.get("simple_words", {}))
+    return pack
+
+
+def _empty_pack():
+    return {
+        "qualities": {},
+        "activities": {},
+        "interests": {},
+        "characters": {},
+        "simple_words": {},
+    }
+
+
+def _add_record(pack, section, record):
+    """Add a record of `section` to the normalized `pack`, return its size."""
+    if section == "qualities":
+        pack["qualities"].setdefault(record["name"], []).extend(record["words"])
+        return len(record["words"])
+    if section == "activities":
+        questions = pack["activities"].setdefault(record["name"], [])
+        questions.extend(record["questions"])
+        return len(record["questions"])
+    if section == "interests":
+        choices = [
+            (choice_data["name"], choice_data["night_number"], choice_data["words"])
+            for choice_data in record["narrative_choices"]
+        ]
+        pack["interests"].setdefault(record["name"], []).extend(choices)
+        return sum(len(words) + 1 for _, _, words in choices)
+    if section == "character":
+        pack["characters"][record["name"]] = {
+            field: record[field] for field in CHOICE_FIELDS
+        }
+        return 1
+    if section == "simple_words":
+        for kind, words in record.items():
+            pack["simple_words"].setdefault(kind, []).extend(words)
+        return sum(len(words) for words in record.values())
+
+
+def load_pack(path):
+    """Read, validate and normalize the pack in the file at `path`."""
+    with open(path, "r") as file:
+        json_data = json.load(file)
+    validate_pack(json_data)
+    return normalize_pack(json_data)
+
+
+def merge_packs(packs):
+    """
+    Merge normalized packs into one, without duplicates: the words of a
+    quality or a narrative choice, the questions of an activity, the
+    narrative choices of an interest and the choices of a character are
+    the union of those in all the packs, in the order first seen.
+    """
+    merged = _empty_pack()
+    for pack in packs:
+        for section in ("qualities", "activities", "simple_words"):
+            for name, values in pack[section].items():
+                merged[section].setdefault(name, {}).update(dict.fromkeys(values))
+        for interest, choices in pack["interests"].items():
+            merged_choices = merged["interests"].setdefault(interest, {})
+            for name, night_number, words in choices:
+                merged_words = merged_choices.setdefault((name, night_number), {})
+                merged_words.update(dict.fromkeys(words))
+        for character, choices in pack["characters"].items():
+            merged_fields = merged["characters"].setdefault(character, {})
+            for field, names in choices.items():
+                merged_fields.setdefault(field, {}).update(dict.fromkeys(names))
+
+    return {
+        "qualities": {
+            name: list(values) for name, values in merged["qualities"].items()
+        },
+        "activities": {
+            name: list(values) for name, values in merged["activities"].items()
+        },
+        "interests": {
+            interest: [
+                (name, night_number, list(words))
+                for (name, night_number), words in choices.items()
+            ]
+            for interest, choices in merged["interests"].items()
+        },
+        "characters": {
+            character: {field: list(names) for field, names in fields.items()}
+            for character, fields in merged["characters"].items()
+        },
+        "simple_words": {
+            kind: list(words) for kind, words in merged["simple_words"].items()
+        },
+    }
+
+
+def stream_packs(file, batch_size, chunk_size=CHUNK_SIZE):
+    """
+    Read a pack from `file` record by record and yield it as normalized
+    packs of about `batch_size` words, questions and narrative choices each
+    (a single record can make a batch larger). The character comes last, in
+    a pack of its own, so the qualities, interests and activities it names
+    have been yielded before it.
+    """
+    pack, size = _empty_pack(), 0
+    character = None
+    for section, where, record in stream_records(file, chunk_size):
+        validate_record(section, record, where)
+        if section == "character":
+            character = record
+            continue
+        size += _add_record(pack, section, record)
+        if size >= batch_size:
+            yield pack
+            pack, size = _empty_pack(), 0
+    if size:
+        yield pack
+    if character is None:
+        raise ValueError("The pack has no character.")
+    pack = _empty_pack()
+    _add_record(pack, "character", character)
+    yield pack
+
+
+def stream_records(file, chunk_size=CHUNK_SIZE):
+    """
+    Yield (section, position, record) for every record of the top-level
+    sections of the pack in `file`, reading `chunk_size` characters at a
+    time. Only one record is held in memory at once. Other top-level keys
+    are skipped.
+    """
+    stream = _JSONStream(file, chunk_size)
+    stream.expect("{")
+    while stream.peek() != "}":
+        section = stream.value()
+        stream.expect(":")
+        if section in RECORD_SECTIONS:
+            stream.expect("[")
+            i = 0
+            while stream.peek() != "]":
+                yield section, f"{section}[{i}]", stream.value()
+                i += 1
+                if stream.peek() == ",":
+                    stream.advance()
+            stream.expect("]")
+        else:
+            record = stream.value()
+            if section in ("character", "simple_words"):
+                yield section, section, record
+        if stream.peek() == ",":
+            stream.advance()
+    stream.expect("}")
+
+
+class _JSONStream:
+    """JSON values read one at a time from a text file with raw_decode."""
+
+    decoder = json.JSONDecoder()
+
+    def __init__(self, file, chunk_size):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.position = 0
+        self.at_end = False
+
+    def fill(self):
+        """Read more of the file, return False at its end."""
+        if self.at_end:
+            return False
+        # Reading as much as is buffered keeps re-parsing a long record linear
+        chunk = self.file.read(max(self.chunk_size, len(self.buffer)))
+        if not chunk:
+            self.at_end = True
+            return False
+        unread = self.position
+        self.buffer = self.buffer[unread:] + chunk
+        self.position = 0
+        return True
+
+    def peek(self):
+        """Return the next character that is not whitespace, or ""."""
+        while True:
+            match = _NOT_WHITESPACE.search(self.buffer, self.position)
+            if match:
+                self.position = match.start()
+                return match.group()
+            self.position = len(self.buffer)
+            if not self.fill():
+                return ""
+
+    def advance(self):
+        self.position += 1
+
+    def expect(self, character):
+        found = self.peek()
+        if found != character:
+            raise ValueError(f"Expected {character!r} but found {found!r}.")
+        self.advance()
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # A number may go on in the next chunk
+            if end < len(self.buffer) or not self.fill():
+                self.position = end
+                return value
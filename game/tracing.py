@@ -0,0 +1,108 @@
+"""
+Traces of the actions the game consumer receives.
+
+When settings.GAME_TRACE_FILE is set, GameConsumer.receive appends every
+action of a logged in user to that file, one JSON object per line:
+
+    {"ts": 1700000000.25, "game_id": "...", "user": 3,
+     "action": "submit_answer", "value": "..."}
+
+ts is the time it was received (seconds since the epoch) and user the id of
+the user. The lines are written by a background thread that keeps the file
+open, so that the consumer's event loop never waits on the disk. The
+replay_trace command plays a trace back against a database.
+"""
+
+import atexit
+import json
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ("ts", "game_id", "user", "action", "value")
+
+# (path, line) waiting for the writer thread
+_lines = queue.Queue()
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def trace_file():
+    return getattr(settings, "GAME_TRACE_FILE", None)
+
+
+def record(game_id, user, action, value):
+    """Queue an action for the trace file, if there is one."""
+    path = trace_file()
+    if not path:
+        return
+    line = json.dumps(
+        {
+            "ts": time.time(),
+            "game_id": str(game_id),
+            "user": user.pk,
+            "action": action,
+            "value": value,
+        }
+    )
+    _start_writer()
+    _lines.put((path, line))
+
+
+def flush():
+    """Wait until the actions recorded so far are written."""
+    if _writer is not None:
+        _lines.join()
+
+
+def _start_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(
+                target=_write_lines, name="game-trace-writer", daemon=True
+            )
+            _writer.start()
+            atexit.register(flush)
+
+
+def _write_lines():
+    file = None
+    while True:
+        path, line = _lines.get()
+        try:
+            if file is None or file.name != path:
+                if file is not None:
+                    file.close()
+                file = open(path, "a")
+            file.write(line + "\n")
+            # Flushed once the lines queued so far are written
+            if _lines.empty():
+                file.flush()
+        except OSError:
+            logger.exception("Could not write to the game trace %s", path)
+            file = None
+        finally:
+            _lines.task_done()
+
+
+def read_trace(file):
+    """
+    Yield the actions of the trace `file` in order. Blank lines are skipped,
+    and a line that is not an action raises ValueError.
+    """
+    for number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError as error:
+            raise ValueError(f"Line {number}: {error}")
+        if not isinstance(entry, dict) or not all(key in entry for key in FIELDS):
+            raise ValueError(f"Line {number}: expected the fields {', '.join(FIELDS)}.")
+        yield entry
@@ -0,0 +1,165 @@
+"""
+Write coalescing for game actions.
+
+One game action (a message from the consumer) used to write the turn, the
+player and new chat messages several times over. Inside ``action()`` the
+model code records its writes instead of running them:
+
+    with unit_of_work.action():
+        game_turn.react_with_emoji(emoji, player)
+        unit_of_work.save(game_turn, "state")
+
+- ``save(instance, *fields)`` marks fields of a row as dirty (all fields when
+  none are given);
+- ``insert(*instances)`` queues new rows;
+- ``lock(instance, *fields)`` reloads fields of a row that the action
+  changes from their current values (read-modify-write), locking the row
+  until the action's transaction ends. A row is locked once per action, so
+  the changes made in memory since are kept.
+
+When the block ends everything is written at once: one UPDATE per dirty row
+with its update_fields, then the new rows with one bulk insert per model, in
+the order they were first queued. The whole block runs in one transaction,
+so a versioned row that turns out to be stale at the flush (see
+game/concurrency.py) undoes the writes that did run immediately too. The
+updates go first so that a concurrent action is found stale before its new
+rows can clash with the other action's (e.g. the seq of a chat message);
+dirty rows therefore must not point to rows queued in the same action.
+
+Rule violations are reported with ValueError after some of the changes may
+already have been made (see GameTurn.write_message_about_moon_phase), so the
+writes are flushed for a ValueError too. Any other exception discards them.
+
+Two kinds of writes run immediately inside an action as well:
+
+- rows that must exist before they can be locked, such as the first
+  ReactionSummary of a sender (see ReactionSummary.record);
+- deletes, such as RelationalPool.remove and clear. A delete is one query
+  already, and running it at once orders it before the rows the action
+  queues, so a pool row removed and added back in one action is kept.
+
+Outside an action the helpers write immediately, so the models work as
+before from the views, the tests and the shell.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+
+_current = ContextVar("unit_of_work", default=None)
+
+
+class UnitOfWork:
+    def __init__(self):
+        # (model, ignore_conflicts) -> new rows, in the order first queued
+        self.new = {}
+        # id(instance) -> [instance, set of fields or None for all fields]
+        self.dirty = {}
+        # id(instance) -> instance, for the rows locked in this action
+        self.locked = {}
+
+    def insert(self, instances, ignore_conflicts=False):
+        for instance in instances:
+            key = (type(instance), ignore_conflicts)
+            self.new.setdefault(key, []).append(instance)
+
+    def save(self, instance, fields):
+        if instance.pk is None:
+            # Saved as a new row unless it is queued already
+            queued = (row for rows in self.new.values() for row in rows)
+            if not any(row is instance for row in queued):
+                self.insert([instance])
+            return
+        entry = self.dirty.setdefault(id(instance), [instance, set()])
+        if not fields or entry[1] is None:
+            entry[1] = None
+        else:
+            entry[1].update(fields)
+
+    def pending(self, model):
+        return [
+            row
+            for (row_model, _), rows in self.new.items()
+            if row_model is model
+            for row in rows
+        ]
+
+    def flush(self):
+        for instance, fields in self.dirty.values():
+            if fields is None:
+                instance.save()
+            else:
+                instance.save(update_fields=sorted(fields))
+        for (model, ignore_conflicts), rows in self.new.items():
+            model.objects.bulk_create(rows, ignore_conflicts=ignore_conflicts)
+        self.new = {}
+        self.dirty = {}
+
+
+@contextmanager
+def action():
+    """Collect the writes of the block and flush them once at the end."""
+    if _current.get() is not None:
+        # Nested actions belong to the outer one
+        yield _current.get()
+        return
+    unit = UnitOfWork()
+    rule_violation = None
+    with transaction.atomic():
+        token = _current.set(unit)
+        try:
+            yield unit
+        except ValueError as error:
+            rule_violation = error
+        finally:
+            _current.reset(token)
+        unit.flush()
+    if rule_violation is not None:
+        raise rule_violation
+
+
+def save(instance, *fields):
+    """Save `fields` of `instance` (all fields when none are given)."""
+    unit = _current.get()
+    if unit is not None:
+        unit.save(instance, fields)
+    elif instance.pk is None or not fields:
+        instance.save()
+    else:
+        instance.save(update_fields=fields)
+
+
+def insert(*instances, ignore_conflicts=False):
+    """Create rows for `instances`, all of the same model."""
+    unit = _current.get()
+    if unit is not None:
+        unit.insert(instances, ignore_conflicts)
+    elif len(instances) == 1 and not ignore_conflicts:
+        instances[0].save()
+    elif instances:
+        type(instances[0]).objects.bulk_create(
+            instances, ignore_conflicts=ignore_conflicts
+        )
+
+
+def lock(instance, *fields):
+    """
+    Reload `fields` of `instance` from its row locked with SELECT ... FOR
+    UPDATE, which the caller must run in a transaction. Inside an action the
+    row is locked and reloaded once, as later changes are still in memory.
+    """
+    unit = _current.get()
+    if unit is not None:
+        if id(instance) in unit.locked:
+            return
+        unit.locked[id(instance)] = instance
+    row = type(instance).objects.select_for_update().values(*fields).get(pk=instance.pk)
+    for field, value in row.items():
+        setattr(instance, field, value)
+
+
+def pending(model):
+    """Return the new rows of `model` queued in the current action."""
+    unit = _current.get()
+    return [] if unit is None else unit.pending(model)
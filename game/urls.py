@@ -14,6 +14,11 @@ urlpatterns = [
         GameProgressView.as_view(),
         name="game_progress",
     ),
+    path(
+        "chat_history/<uuid:game_id>/",
+        views.chat_history,
+        name="chat_history",
+    ),
     path(
         "end_game_session/<uuid:game_id>/",
         views.end_game_session,
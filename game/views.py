@@ -18,13 +18,15 @@ from .models import (
     GameTurn,
     Character,
     MoonSignInterpretation,
+    Question,
 )
+from . import sampling
+from .concurrency import StaleState
 
 
 from django.shortcuts import redirect, render
 from django.views import View
 import random
-from collections import defaultdict
 from django.contrib.auth.models import User
 from django.db.models import Q
 from accounts.models import Match
@@ -32,6 +34,9 @@ from django.http import JsonResponse
 from django.shortcuts import get_object_or_404
 from django.core.serializers.json import DjangoJSONEncoder
 
+# Chat messages rendered with the page and returned per request by chat_history
+CHAT_WINDOW = 50
+
 
 def initiate_game_session(request):
     if request.method == "POST":
@@ -90,24 +95,15 @@ class GameProgressView(View):
     def get(self, request, *args, **kwargs):
         game_id = kwargs["game_id"]
         try:
-            game_session = GameSession.objects.get(game_id=game_id)
+            game_session = GameSession.objects.select_related(
+                "current_game_turn__moon_phase_turn_sequence"
+            ).get(game_id=game_id)
         except GameSession.DoesNotExist:
             messages.error(request, "Game session not found.")
             return redirect("end_game_session", game_id=game_id)
 
         if game_session.state == GameSession.ENDED:
-            messages_by_sender, attitude_summary = retrieve_messages_from_log(
-                game_session, request.user
-            )
-            return render(
-                request,
-                "end_game_session.html",
-                {
-                    "game_id": game_id,
-                    "messages_by_sender": dict(messages_by_sender),
-                    "attitude_summary": dict(attitude_summary),
-                },
-            )
+            return render_game_summary(request, game_session)
         else:
             player = request.user.player
             # Check if the user is a participant of the game session
@@ -117,12 +113,14 @@ class GameProgressView(View):
                 )
                 return redirect("home")
 
-            chat_messages_for_session = game_session.gameLog.chat_messages.all()
+            # Only the latest messages, the older ones are fetched on demand
+            chat_messages_for_session, has_older_messages = chat_window(game_session)
 
             # Context that is common to all states
             context = {
                 "game_session": game_session,
                 "chat_messages": chat_messages_for_session,
+                "has_older_messages": has_older_messages,
                 "active_player": game_session.current_game_turn.get_active_player(),
                 "playerC": player.character_name,
             }
@@ -131,15 +129,15 @@ class GameProgressView(View):
             turn = game_session.current_game_turn
 
             if turn.state == GameTurn.SELECT_QUESTION:
-                questions = player.question_pool.all()
-                random_questions = random.sample(
-                    list(questions), min(len(questions), 3)
+                random_questions = sampling.sample_rows(
+                    Question, player.pool("question").ids(), 3
                 )
                 context.update({"random_questions": random_questions})
 
             elif turn.state == GameTurn.ANSWER_QUESTION:
                 words = (
-                    player.character_word_pool.all() | player.simple_word_pool.all()
+                    player.pool("character_word").all()
+                    | player.pool("simple_word").all()
                 )  # this adds the simple words to the pool
                 tags_answer = [word.word for word in words]
                 random.shuffle(tags_answer)
@@ -195,7 +193,8 @@ class GameProgressView(View):
                 )
             elif game_session.current_game_turn.state == GameTurn.MOON_PHASE:
                 words = (
-                    player.character_word_pool.all() | player.simple_word_pool.all()
+                    player.pool("character_word").all()
+                    | player.pool("simple_word").all()
                 )  # this adds the simple words to the pool
                 tags_answer = [word.word for word in words]
                 random.shuffle(tags_answer)
@@ -231,23 +230,18 @@ class GameProgressView(View):
 def end_game_session(request, game_id):
     try:
         game_session = GameSession.objects.get(game_id=game_id)
+    except GameSession.DoesNotExist:
+        messages.error(request, "Game session not found.")
+        return redirect("home")
+
+    if game_session.state != GameSession.ENDED:
         if (
-            request.user not in [game_session.playerA.user, game_session.playerB.user]
+            request.user.pk
+            not in [game_session.playerA.user_id, game_session.playerB.user_id]
             and not request.user.is_staff
         ):
             messages.error(request, "You are not a participant of this game session.")
             return redirect("home")
-        messages_by_sender, attitude_summary = retrieve_messages_from_log(
-            game_session.gameLog, request.user.player
-        )
-
-        other_player = (
-            game_session.playerA
-            if game_session.playerA != request.user.player
-            else game_session.playerB
-        )
-        other_player_user = other_player.user
-        other_player_email = other_player.user.email
 
         with transaction.atomic():  # Start a database transaction
             # Lock the game session row
@@ -268,54 +262,31 @@ def end_game_session(request, game_id):
                 game_session.end_session()
                 game_session.save()
 
-        return render(
-            request,
-            "end_game_session.html",
-            {
-                "game_id": game_id,
-                "messages_by_sender": dict(messages_by_sender),
-                "attitude_summary": dict(attitude_summary),
-                "other_player_user": other_player_user,
-                "other_player_email": other_player_email,
-            },
-        )
+    return render_game_summary(request, game_session)
 
-    except GameSession.DoesNotExist:
-        messages.error(request, "Game session not found.")
-        return redirect("home")
 
+def render_game_summary(request, game_session):
+    """Render the summary that end_session stored for the user."""
+    summary = (game_session.summary or {}).get("players", {})
+    details = summary.get(str(request.user.pk))
+    if details is None and not request.user.is_staff:
+        messages.error(request, "You are not a participant of this game session.")
+        return redirect("home")
 
-def get_moon_phase_from_emoji(emoji, moon_meaning):
-    moon_sign_mapping = {
-        "🌑": "new_moon",
-        "🌓": "first_quarter",
-        "🌕": "full_moon",
-        "🌗": "last_quarter",
-    }
-    moon_phase = moon_sign_mapping.get(emoji)
-    # print(moon_meaning.get_moon_sign(moon_phase))
-    return moon_meaning.get_moon_sign(moon_phase)
-
-
-def retrieve_messages_from_log(game_log, player=None):
-    # game_log = game_session.gameLog
-    sender_details = defaultdict(lambda: {"reactions": []})
-    attitude_summary = defaultdict(int)
-    for message in game_log.chat_messages.all():
-        emoji = message.reaction
-        sender = message.sender
-        if player and sender == player.character_name:
-            moon_meaning = player.MoonSignInterpretation
-            attitude = get_moon_phase_from_emoji(emoji, moon_meaning)
-            # Add the emoji to the sender's reactions list
-            sender_details[sender]["reactions"].append((emoji, message.timestamp))
-            # Increment the count for the attitude type (positive/negative)
-            if attitude in {"positive", "negative", "ambiguous"}:
-                attitude_summary[attitude] += 1
-    # Sort the reactions by timestamp for each sender
-    for sender, details in sender_details.items():
-        details["reactions"].sort(key=lambda x: x[1])  # Sort by timestamp
-    return sender_details, attitude_summary
+    context = {"game_id": game_session.game_id}
+    if details is not None:
+        partner = details["partner"] or {}
+        context.update(
+            {
+                "messages_by_sender": {
+                    details["sender"]: {"reactions": details["reactions"]}
+                },
+                "attitude_summary": details["attitude_summary"],
+                "other_player_user": partner.get("username"),
+                "other_player_email": partner.get("email"),
+            }
+        )
+    return render(request, "end_game_session.html", context)
 
 
 class CharacterCreationView(View):
@@ -461,22 +432,30 @@ class CharacterCreationView(View):
                 if players.count() == 2:
                     playerA, playerB = players.all()
 
-                    if (
-                        playerA.character_creation_state == Player.CHARACTER_COMPLETE
-                        and playerB.character_creation_state
-                        == Player.CHARACTER_COMPLETE
-                    ):
-                        # Transition the game session to the next state
-                        game_session.start_regular_turn()
-                        game_session.save()
-                    else:
-                        print(
-                            "The game session state remains in "
-                            "CHARACTER_CREATION as there "
-                            "are not exactly 2 players to transition to REGULAR_TURN."
-                        )
-                        other_player = playerA if playerA != player else playerB
-                        game_session.current_game_turn.set_active_player(other_player)
+                    try:
+                        if (
+                            playerA.character_creation_state
+                            == Player.CHARACTER_COMPLETE
+                            and playerB.character_creation_state
+                            == Player.CHARACTER_COMPLETE
+                        ):
+                            # Transition the game session to the next state
+                            game_session.start_regular_turn()
+                            game_session.save()
+                        else:
+                            print(
+                                "The game session state remains in "
+                                "CHARACTER_CREATION as there are not exactly 2 "
+                                "players to transition to REGULAR_TURN."
+                            )
+                            other_player = playerA if playerA != player else playerB
+                            game_session.current_game_turn.set_active_player(
+                                other_player
+                            )
+                    except StaleState:
+                        # The partner finished their character at the same
+                        # time and their request got there first
+                        pass
 
                 return redirect("game:character_creation", game_id=game_id)
 
@@ -490,6 +469,66 @@ class CharacterCreationView(View):
             return redirect("home")
 
 
+def chat_window(game_session, before=None, after=None, limit=CHAT_WINDOW):
+    """
+    Return up to `limit` chat messages of the game in seq order, and whether
+    there are more beyond them. These are the latest messages, or with a
+    cursor the ones right before seq `before` or right after seq `after`.
+    """
+    chat_messages = game_session.chat_messages.all()
+    if after is not None:
+        window = list(chat_messages.filter(seq__gt=after).order_by("seq")[: limit + 1])
+        return window[:limit], len(window) > limit
+    if before is not None:
+        chat_messages = chat_messages.filter(seq__lt=before)
+    window = list(chat_messages.order_by("-seq")[: limit + 1])
+    return window[:limit][::-1], len(window) > limit
+
+
+def chat_history(request, game_id):
+    """
+    Chat messages of the game as JSON, older than the `before` seq or newer
+    than the `after` seq, so that clients fetch only what they do not have.
+    """
+    try:
+        before = request.GET.get("before")
+        after = request.GET.get("after")
+        before = int(before) if before is not None else None
+        after = int(after) if after is not None else None
+    except ValueError:
+        return JsonResponse({"error": "Invalid cursor"}, status=400)
+
+    game_session = GameSession.objects.filter(game_id=game_id).first()
+    if game_session is None:
+        return JsonResponse({"error": "Game session not found"}, status=404)
+    player = getattr(request.user, "player", None)
+    if player is None or player.pk not in (
+        game_session.playerA_id,
+        game_session.playerB_id,
+    ):
+        return JsonResponse(
+            {"error": "You are not a participant of this game session."}, status=403
+        )
+
+    chat_messages, has_more = chat_window(game_session, before, after)
+    return JsonResponse(
+        {
+            "messages": [
+                {
+                    "seq": message.seq,
+                    "sender": message.sender,
+                    "avatar_url": message.avatar_url,
+                    "text": message.text,
+                    "reaction": message.reaction,
+                    "timestamp": message.timestamp,
+                }
+                for message in chat_messages
+            ],
+            "has_more": has_more,
+        }
+    )
+
+
 def get_character_details(request):
     character_id = request.GET.get("id")
     if not character_id:
@@ -164,3 +164,20 @@ EMAIL_HOST_PASSWORD = os.environ.get("RPTHENDATE_EMAIL_HOST_PASSWORD")
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 DEFAULT_FROM_EMAIL = "Roleplay then Date roleplayanddate@gmail.com"
+
+# Storage for the player word, question and narrative choice pools,
+# "relational" (ManyToMany tables), "packed" (id arrays on the player row) or
+# "derived" (question and word pools computed from a seed). See game/pools.py.
+GAME_POOL_STORAGE = os.environ.get("GAME_POOL_STORAGE", "relational")
+
+# Seconds between the checks of a process for content changes made by other
+# processes (ingest_character, populate_moon_phase_dates, the admin), see
+# game/catalog.py and game/moon_phases.py.
+GAME_CATALOG_CHECK_INTERVAL = float(os.environ.get("GAME_CATALOG_CHECK_INTERVAL", 5))
+
+# Turns the checks above off in tests, see game/testing.py
+TEST_RUNNER = "game.testing.TestRunner"
+
+# JSONL file every action received by GameConsumer is appended to, for
+# replay_trace. Unset, nothing is recorded. See game/tracing.py.
+GAME_TRACE_FILE = os.environ.get("GAME_TRACE_FILE")